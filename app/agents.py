@@ -1,16 +1,31 @@
 import json
+import logging
 import os
-import re
+import threading
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from dotenv import load_dotenv
 
-from .local_llm_client import analyze_jd_local
+from .json_utils import parse_json_object, response_key, strip_markdown_fences
+from .llm_schemas import (
+    JUDGE_SCHEMA,
+    REWRITE_SCHEMA,
+    SELECTION_SCHEMA,
+    STRUCTURED_OUTPUTS,
+    validate_judgement,
+    validate_rewrite,
+)
+from .llm_scheduler import PRIORITY_LONG, PRIORITY_SHORT
+from .local_llm_client import analyze_jd_local, chat_local
 from .openrouter_client import OpenRouterClient
+from .request_context import current_llm_stage, stage_backend
+from .resilience import LLMUnavailable, check_deadline
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 client = OpenRouterClient()
 
 MISTRAL_MODEL = "xiaomi/mimo-v2-flash:free"
@@ -18,15 +33,56 @@ GROK_MODEL = "tngtech/deepseek-r1t2-chimera:free" #"mistralai/mistral-7b-instruc
 
 BASE_DIR = Path(__file__).resolve().parent
 STYLE_GUIDE_PATH = BASE_DIR / "style_guide.md"
-FENCED_BLOCK_RE = re.compile(r"^```(?:[\w-]+)?\s*([\s\S]*?)\s*```$", re.DOTALL)
+
+# sampling temperatures per stage; bench/evaluate.py sweeps them
+SELECT_TEMPERATURE = float(os.getenv("SELECT_TEMPERATURE", "0.2"))
+REWRITE_TEMPERATURE = float(os.getenv("REWRITE_TEMPERATURE", "0.3"))
+JUDGE_TEMPERATURE = float(os.getenv("JUDGE_TEMPERATURE", "0.1"))
+# JSONL file every select/rewrite/judge reply is appended to, for replay in evaluations
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+# summary of the placeholder judgement returned when the judge reply is not JSON
+JUDGE_UNPARSED_SUMMARY = "Could not parse JSON"
+_record_lock = threading.Lock()
+
+
+def _record_reply(stage: str, messages: List[Dict[str, str]], temperature: float, reply: str) -> None:
+    line = json.dumps({"key": response_key(messages, temperature), "stage": stage, "content": reply})
+    with _record_lock, open(LLM_RECORD_PATH, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def _chat(
+    stage: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    priority: int,
+    schema: Optional[Dict[str, Any]] = None,
+) -> str:
+    current_llm_stage.set(stage)
+    check_deadline()
+    # schemas are opt-in (LLM_STRUCTURED_OUTPUTS=1)
+    schema = schema if STRUCTURED_OUTPUTS else None
+    # the budget planner may move a stage to Ollama when OpenRouter calls run short
+    if stage_backend(stage) == "local":
+        reply = chat_local(messages, temperature=temperature, schema=schema)
+    else:
+        reply = client.chat(
+            model, messages, temperature=temperature, max_tokens=max_tokens, priority=priority,
+            schema=schema, schema_name=stage,
+        )
+    if LLM_RECORD_PATH:
+        _record_reply(stage, messages, temperature, reply)
+    return reply
 
 
-def _strip_markdown_fences(content: str) -> str:
-    stripped = content.strip()
-    match = FENCED_BLOCK_RE.match(stripped)
-    if match:
-        return match.group(1).strip()
-    return stripped
+def _schema_repair_prompt(errors: List[str]) -> str:
+    return (
+        "Your answer did not match the required JSON format (" + "; ".join(errors[:5]) + "). "
+        'Reply with JSON only: {"score": <0-10>, "summary": "...", "improvements": ["..."], '
+        '"project_selection_issue": <true|false>}'
+    )
 
 
 def _format_projects_for_prompt(projects: List[Dict[str, Any]]) -> str:
@@ -99,6 +155,7 @@ def select_projects(
     project_count: int,
     projects: List[Dict[str, Any]],
     feedback: Optional[str] = None,
+    temperature: float = SELECT_TEMPERATURE,
 ) -> Dict[str, Any]:
     """
     Choose the best projects for the resume based on JD analysis and inventory.
@@ -131,12 +188,12 @@ def select_projects(
         {"role": "user", "content": user_prompt},
     ]
 
-    raw = client.chat(MISTRAL_MODEL, messages, temperature=0.2, max_tokens=100000)
-    clean = _strip_markdown_fences(raw)
-    try:
-        clean = clean.replace('\r', '').replace('\t', ' ')
-        parsed = json.loads(clean)
-    except json.JSONDecodeError:
+    raw = _chat(
+        "select", MISTRAL_MODEL, messages, temperature=temperature, max_tokens=100000, priority=PRIORITY_SHORT,
+        schema=SELECTION_SCHEMA,
+    )
+    parsed = parse_json_object(raw)
+    if not isinstance(parsed, dict):
         return {"selected_project_ids": [], "reasons": [], "raw": raw}
 
     selected_ids = parsed.get("selected_project_ids", [])
@@ -173,6 +230,8 @@ def rewrite_resume(
     selected_projects: List[Dict[str, Any]],
     project_count: int,
     feedback_notes: str = "",
+    keyword_hints: str = "",
+    temperature: float = REWRITE_TEMPERATURE,
 ) -> str:
     style_text = load_style_guide()
     user_template = os.getenv("PROMPT_REWRITE_USER_TEMPLATE")
@@ -184,6 +243,8 @@ def rewrite_resume(
     )
     if feedback_notes.strip():
         guidance += f"\nIncorporate this recruiter feedback:\n{feedback_notes.strip()}\n"
+    if keyword_hints:
+        guidance += f"\n{keyword_hints}\n"
     guidance += (
         "\nEnsure the final resume highlights the selected projects explicitly and keeps all facts truthful."
     )
@@ -205,21 +266,30 @@ def rewrite_resume(
             "content": msg_content,
         },
     ]
-    res = client.chat(MISTRAL_MODEL, messages, temperature=0.3, max_tokens=100000)
-    try:
-        parsed = _strip_markdown_fences(res)
-        parsed = parsed.replace('\r', '').replace('\t', ' ')
-        return json.loads(parsed)
-    except Exception as err:
-        print(err)
-        return json.loads(res)
+    res = _chat(
+        "rewrite", MISTRAL_MODEL, messages, temperature=temperature, max_tokens=100000, priority=PRIORITY_LONG,
+        schema=REWRITE_SCHEMA,
+    )
+    parsed = parse_json_object(res)
+    if isinstance(parsed, dict):
+        # the closed schema only binds replies that were sent it; free-form
+        # replies may carry extra keys as long as the resume is there
+        errors = validate_rewrite(parsed) if STRUCTURED_OUTPUTS else []
+        resume = parsed.get("upgradedResume")
+        if not errors and isinstance(resume, str) and resume.strip():
+            return parsed
+    # Unparseable output: treat the text itself as the candidate and let the
+    # judge score it instead of failing the whole job.
+    logger.warning("rewrite_resume: could not parse JSON output, using raw text")
+    return {"upgradedResume": strip_markdown_fences(res)}
 
 def judge_resume(
     jd_text: str,
     new_resume: str,
     selected_projects: List[Dict[str, Any]],
     project_count: int,
-    previous_agent_output: str
+    previous_agent_output: str,
+    temperature: float = JUDGE_TEMPERATURE,
 ) -> dict:
     try:
         user_template = os.getenv("PROMPT_JUDGE_TEMPLATE")
@@ -243,19 +313,35 @@ def judge_resume(
                 "content":  msg_content + project_guidance + "\n\n Previous agent response = " + previous_agent_output,
             },
         ]
-        raw = client.chat(GROK_MODEL, messages, temperature=0.1, max_tokens=100000)
-        clean = _strip_markdown_fences(raw)
-        try:
-            clean = clean.replace('\r', '').replace('\t', ' ')
-            parsed = json.loads(clean)
-        except json.JSONDecodeError:
+        raw = _chat(
+            "judge", GROK_MODEL, messages, temperature=temperature, max_tokens=100000, priority=PRIORITY_SHORT,
+            schema=JUDGE_SCHEMA,
+        )
+        parsed = parse_json_object(raw)
+        errors = validate_judgement(parsed)
+        if STRUCTURED_OUTPUTS and errors:
+            # the provider did not enforce the schema; one repair call is
+            # cheaper than the rewrite round a score of 0 would trigger
+            logger.warning("judge_resume: output failed schema (%s), asking again", "; ".join(errors[:3]))
+            raw = _chat(
+                "judge", GROK_MODEL, messages + [
+                    {"role": "assistant", "content": raw},
+                    {"role": "user", "content": _schema_repair_prompt(errors)},
+                ],
+                temperature=0.0, max_tokens=100000, priority=PRIORITY_SHORT, schema=JUDGE_SCHEMA,
+            )
+            parsed = parse_json_object(raw)
+        if not isinstance(parsed, dict):
             parsed = {
                 "score": 0,
-                "summary": "Could not parse JSON",
+                "summary": JUDGE_UNPARSED_SUMMARY,
                 "improvements": [raw],
             }
         parsed.setdefault("project_selection_issue", False)
         return parsed
+    except LLMUnavailable:
+        # out of time or backend down: a score of 0 would only buy another wasted round
+        raise
     except Exception as e:
         print(e)
         return None
\ No newline at end of file
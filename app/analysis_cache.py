@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from .agents import analyze_jd
+from .project_index import shortlist_projects
+from .state_store import get_state_store
+
+ANALYSIS_NAMESPACE = "jd_analysis"
+INFLIGHT_NAMESPACE = "jd_analysis_inflight"
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", str(24 * 3600)))
+# how long /generate waits for an analysis another request already started
+ANALYSIS_WAIT_SECONDS = float(os.getenv("ANALYSIS_WAIT_SECONDS", "90"))
+ANALYZE_MIN_CHARS = int(os.getenv("ANALYZE_MIN_CHARS", "200"))
+_POLL_INTERVAL = 0.25
+# the in-flight marker outlives a worker that died mid-analysis by at most
+# this long; a running analysis refreshes it, however slow its fallbacks are
+_INFLIGHT_TTL = 30.0
+_INFLIGHT_REFRESH = 10.0
+
+_WHITESPACE_RE = re.compile(r"[ \t]+")
+
+logger = logging.getLogger(__name__)
+
+
+def canonicalize_text(text: str) -> str:
+    """
+    Normalizes formatting noise that does not change what an LLM makes of
+    a JD or resume: unicode forms, runs of spaces, trailing whitespace and
+    blank lines.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    lines = [_WHITESPACE_RE.sub(" ", line).strip() for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def jd_hash(jd_text: str) -> str:
+    return hashlib.sha256(canonicalize_text(jd_text).encode("utf-8")).hexdigest()
+
+
+def get_cached_analysis(jd_text: str) -> Optional[str]:
+    return get_state_store().get(ANALYSIS_NAMESPACE, jd_hash(jd_text))
+
+
+def _is_empty_analysis(analysis: str) -> bool:
+    """True when analyze_jd gave up (every backend failed): headings without items."""
+    return not any(line.startswith("- ") for line in (analysis or "").splitlines())
+
+
+def _refresh_inflight(key: str, done: threading.Event) -> None:
+    store = get_state_store()
+    while not done.wait(_INFLIGHT_REFRESH):
+        store.set(INFLIGHT_NAMESPACE, key, 1, ttl=_INFLIGHT_TTL)
+
+
+def get_or_analyze(jd_text: str) -> str:
+    """
+    Returns the JD analysis from the shared cache, waiting for an in-flight
+    prefetch of the same JD (from any worker) before analyzing it here.
+    """
+    store = get_state_store()
+    key = jd_hash(jd_text)
+    deadline = time.monotonic() + ANALYSIS_WAIT_SECONDS
+    claimed = False
+    while True:
+        cached = store.get(ANALYSIS_NAMESPACE, key)
+        if cached:
+            return cached
+        if store.incr_if_below(INFLIGHT_NAMESPACE, key, 1, ttl=_INFLIGHT_TTL):
+            claimed = True
+            break
+        if time.monotonic() >= deadline:
+            logger.warning("Timed out waiting for in-flight JD analysis %s", key[:12])
+            break
+        time.sleep(_POLL_INTERVAL)
+
+    # a caller that timed out waiting analyzes too, but the marker stays the other worker's
+    done = threading.Event()
+    refresher = None
+    if claimed:
+        refresher = threading.Thread(target=_refresh_inflight, args=(key, done), name="analysis-inflight", daemon=True)
+        refresher.start()
+    try:
+        analysis = analyze_jd(canonicalize_text(jd_text))
+        if _is_empty_analysis(analysis):
+            # an outage, not a property of the JD: let the next job try again
+            logger.warning("Empty analysis for JD %s, not caching it", key[:12])
+        else:
+            store.set(ANALYSIS_NAMESPACE, key, analysis, ttl=ANALYSIS_CACHE_TTL)
+        return analysis
+    finally:
+        if refresher is not None:
+            done.set()
+            refresher.join()
+            store.delete(INFLIGHT_NAMESPACE, key)
+
+
+def prefetch_analysis(jd_text: str, project_count: int, projects: List[Dict[str, Any]]) -> None:
+    """
+    Background task for /analyze: analyzes the JD into the shared cache and
+    pre-ranks projects so the project index is warm when /generate arrives.
+    """
+    try:
+        get_or_analyze(jd_text)
+        shortlist_projects(jd_text, projects, project_count)
+    except Exception:
+        # speculative work; /generate will simply analyze again
+        logger.exception("JD prefetch failed")
+
+
+def analysis_status(jd_text: str) -> str:
+    store = get_state_store()
+    key = jd_hash(jd_text)
+    if store.get(ANALYSIS_NAMESPACE, key):
+        return "cached"
+    if store.get(INFLIGHT_NAMESPACE, key):
+        return "running"
+    return "missing"
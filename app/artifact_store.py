@@ -0,0 +1,231 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote
+
+from .file_utils import OUTPUT_DIR, render_resume_docx_bytes, resume_filename
+from .state_store import get_state_store
+
+ARTIFACT_DIR = OUTPUT_DIR / "artifacts"
+ARTIFACT_NAMESPACE = "artifacts"  # download filename -> artifact record
+BLOB_NAMESPACE = "artifact_blobs"  # content hash -> blob record
+JOB_INDEX_NAMESPACE = "artifact_jobs"  # "<job_id>:v<version>" -> download filename
+LOCK_NAMESPACE = "locks"
+
+ARTIFACT_MAX_AGE_DAYS = float(os.getenv("ARTIFACT_MAX_AGE_DAYS", "30"))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(500 * 1024 * 1024)))
+ARTIFACT_CLEANUP_INTERVAL = float(os.getenv("ARTIFACT_CLEANUP_INTERVAL", "3600"))
+# blobs reused this recently are kept even if no artifact (yet) refers to them
+_BLOB_REUSE_GRACE = 300.0
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(resume_text: str) -> str:
+    # docx bytes embed timestamps, so address blobs by the text they render
+    return hashlib.sha256(str(resume_text).encode("utf-8")).hexdigest()
+
+
+def blob_path(sha256: str) -> Path:
+    return ARTIFACT_DIR / sha256[:2] / f"{sha256}.docx"
+
+
+def artifact_filename(job_id: str, company_name: str, version: int) -> str:
+    """
+    Unique per job and version, so two jobs for the same company never
+    overwrite each other: Anmol_Sansi_<Company>_<job8>_v<version>.docx
+    """
+    stem = resume_filename(company_name, version)[: -len(f"_v{version}.docx")]
+    return f"{stem}_{job_id[:8]}_v{version}.docx"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def store_resume_docx(
+    job_id: str,
+    company_name: str,
+    resume_text: str,
+    version: int,
+    docx_bytes: Optional[bytes] = None,
+) -> Dict[str, Any]:
+    """
+    Renders (or reuses) the docx for resume_text and indexes it under
+    job_id/version. Identical resumes share one file on disk. docx_bytes,
+    when given, is an already rendered copy of resume_text.
+    """
+    store = get_state_store()
+    sha256 = content_hash(resume_text)
+    path = blob_path(sha256)
+    now = time.time()
+
+    # claim the blob atomically; cleanup() deletes blobs under the same update
+    blob = store.update(BLOB_NAMESPACE, sha256, lambda b: {**b, "used_at": now} if b else None)
+    if blob is None or not path.exists():
+        data = docx_bytes or render_resume_docx_bytes(resume_text)
+        _write_atomic(path, data)
+        blob = {"size": len(data), "created_at": now, "used_at": now}
+        store.set(BLOB_NAMESPACE, sha256, blob)
+
+    filename = artifact_filename(job_id, company_name, version)
+    record = {
+        "filename": filename,
+        "download_name": resume_filename(company_name, version),
+        "sha256": sha256,
+        "size": blob["size"],
+        "job_id": job_id,
+        "version": version,
+        "created_at": now,
+    }
+    store.set(ARTIFACT_NAMESPACE, filename, record)
+    store.set(JOB_INDEX_NAMESPACE, f"{job_id}:v{version}", filename)
+    return record
+
+
+def get_artifact(filename: str) -> Optional[Dict[str, Any]]:
+    return get_state_store().get(ARTIFACT_NAMESPACE, filename)
+
+
+def get_job_artifact(job_id: str, version: int) -> Optional[Dict[str, Any]]:
+    filename = get_state_store().get(JOB_INDEX_NAMESPACE, f"{job_id}:v{version}")
+    return get_artifact(filename) if filename else None
+
+
+def content_disposition(filename: str) -> str:
+    """attachment header; names that are not plain ASCII go in RFC 5987 filename* like FileResponse does."""
+    quoted = quote(filename, safe="")
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def artifact_etag(record: Dict[str, Any]) -> str:
+    return f'"{record["sha256"]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def read_artifact_bytes(record: Dict[str, Any]) -> bytes:
+    """Raises FileNotFoundError if the blob was removed by retention."""
+    return blob_path(record["sha256"]).read_bytes()
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single "bytes=start-end" range into inclusive offsets.
+    Returns None when there is no usable range (serve the full body) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec:
+        # multipart ranges are not worth it for small docx files
+        return None
+    start_text, _, end_text = spec.partition("-")
+    try:
+        if not start_text:
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise ValueError("empty suffix range")
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        raise ValueError(f"Invalid range: {range_header}")
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError(f"Unsatisfiable range: {range_header}")
+    return start, end
+
+
+def cleanup(now: Optional[float] = None) -> Dict[str, int]:
+    """
+    Applies the retention policy:
+      1. drop artifacts older than ARTIFACT_MAX_AGE_DAYS
+      2. drop the oldest remaining artifacts until blobs fit in ARTIFACT_MAX_BYTES
+      3. delete blobs no artifact refers to anymore
+    """
+    store = get_state_store()
+    now = now or time.time()
+    cutoff = now - ARTIFACT_MAX_AGE_DAYS * 86400
+
+    records = sorted(store.items(ARTIFACT_NAMESPACE).values(), key=lambda r: r.get("created_at", 0))
+    expired = [r for r in records if r.get("created_at", 0) < cutoff]
+    kept = [r for r in records if r.get("created_at", 0) >= cutoff]
+
+    blob_sizes = {r["sha256"]: r.get("size", 0) for r in kept}
+    total = sum(blob_sizes.values())
+    while kept and total > ARTIFACT_MAX_BYTES:
+        oldest = kept.pop(0)
+        expired.append(oldest)
+        if not any(r["sha256"] == oldest["sha256"] for r in kept):
+            total -= blob_sizes.pop(oldest["sha256"], 0)
+
+    for record in expired:
+        store.delete(ARTIFACT_NAMESPACE, record["filename"])
+        store.delete(JOB_INDEX_NAMESPACE, f"{record['job_id']}:v{record['version']}")
+
+    referenced = {r["sha256"] for r in kept}
+    removed_blobs = 0
+    reused_after = now - _BLOB_REUSE_GRACE
+    for sha256 in store.items(BLOB_NAMESPACE):
+        if sha256 in referenced:
+            continue
+        removed = []
+
+        def _drop(blob, sha256=sha256, removed=removed):
+            # re-checked inside the transaction store_resume_docx claims blobs in,
+            # so a blob reused after the snapshot above is never unlinked
+            if not blob or blob.get("used_at", blob.get("created_at", 0)) >= reused_after:
+                return blob
+            try:
+                blob_path(sha256).unlink()
+            except FileNotFoundError:
+                pass
+            removed.append(sha256)
+            return None
+
+        store.update(BLOB_NAMESPACE, sha256, _drop)
+        if removed:
+            store.delete(BLOB_NAMESPACE, sha256)
+            removed_blobs += 1
+
+    if expired or removed_blobs:
+        logger.info("Artifact cleanup removed %s artifacts and %s blobs", len(expired), removed_blobs)
+    return {"artifacts_removed": len(expired), "blobs_removed": removed_blobs, "bytes_kept": total}
+
+
+def _cleanup_loop(interval: float) -> None:
+    store = get_state_store()
+    while True:
+        # only one worker process runs each cleanup round
+        slot = f"artifact_cleanup:{int(time.time() // interval)}"
+        if store.incr_if_below(LOCK_NAMESPACE, slot, 1, ttl=interval * 2):
+            try:
+                if hasattr(store, "purge_expired"):
+                    store.purge_expired()
+                cleanup()
+            except Exception:
+                logger.exception("Artifact cleanup failed")
+        time.sleep(interval)
+
+
+def start_cleanup_thread(interval: float = ARTIFACT_CLEANUP_INTERVAL) -> threading.Thread:
+    thread = threading.Thread(target=_cleanup_loop, args=(interval,), name="artifact-cleanup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .budget import BudgetExceeded, admit_job, release_job
+from .executors import get_executors
+from .file_utils import extract_text_from_docx_bytes, render_resume_docx_bytes, safe_company_name
+from .pipeline import PIPELINE_MAX_LOOPS, prepare_pipeline_state, run_pipeline_and_get_text
+from .request_context import current_budget_id, current_job_id, current_llm_routes
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_PARSE_WORKERS = int(os.getenv("BATCH_PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+logger = logging.getLogger(__name__)
+
+
+def _safe_parse(docx_bytes: bytes) -> Tuple[str, Optional[str]]:
+    try:
+        return extract_text_from_docx_bytes(docx_bytes), None
+    except Exception as exc:  # corrupt upload; report it in the manifest
+        return "", f"Could not read docx: {exc}"
+
+
+def parse_resumes(resumes: List[Tuple[str, bytes]]) -> List[Tuple[str, str, Optional[str]]]:
+    """
+    Extracts text from many .docx files in a process pool.
+    Returns (name, text, error) in input order.
+    """
+    if not resumes:
+        return []
+    workers = max(1, min(BATCH_PARSE_WORKERS, len(resumes)))
+    payloads = [data for _, data in resumes]
+    if workers == 1:
+        parsed = [_safe_parse(data) for data in payloads]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_safe_parse, payloads, chunksize=max(1, len(payloads) // (workers * 4))))
+    return [(name, text, error) for (name, _), (text, error) in zip(resumes, parsed)]
+
+
+def _tailor_one(
+    name: str,
+    base_resume: str,
+    jd_text: str,
+    project_count: int,
+    projects: List[Dict[str, Any]],
+    shared_state: Dict[str, Any],
+    max_loops: int,
+) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"name": name, "job_id": str(uuid.uuid4()), "base_resume": base_resume}
+    current_job_id.set(result["job_id"])
+    try:
+        # each candidate is admitted on its own so a short budget degrades the tail of the batch;
+        # the JD analysis and projects come from the shared stage
+        plan = admit_job(result["job_id"], max_loops, setup=False)
+    except BudgetExceeded as exc:
+        result["error"] = str(exc)
+        return result
+    current_llm_routes.set(plan["routes"])
+    current_budget_id.set(plan["reservation_id"])
+    result["budget_mode"] = plan["mode"]
+    try:
+        resume_text, judgement, pipeline_state = run_pipeline_and_get_text(
+            jd_text=jd_text,
+            base_resume=base_resume,
+            project_count=project_count,
+            projects=projects,
+            previous_state=shared_state,
+            max_loops=plan["max_loops"],
+        )
+    except Exception as exc:
+        logger.exception("Batch candidate %s failed", name)
+        release_job(plan)
+        result["error"] = str(exc)
+        return result
+    release_job(plan, pipeline_state.get("loops"))
+    result.update(
+        {
+            "resume_text": resume_text,
+            "score": judgement.get("score"),
+            "summary": judgement.get("summary"),
+            "pipeline_state": pipeline_state,
+        }
+    )
+    return result
+
+
+def run_batch(
+    jd_text: str,
+    project_count: int,
+    projects: List[Dict[str, Any]],
+    resumes: List[Tuple[str, bytes]],
+    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+    max_loops: int = PIPELINE_MAX_LOOPS,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Tailors many resumes to one JD. The JD is analyzed and projects are
+    selected once; resumes are parsed in a process pool; each candidate runs
+    on the shared job pool (EXECUTOR_JOB_WORKERS), with at most
+    max_concurrency of them in flight per batch.
+
+    Analysis, selection and parsing happen before this returns, so errors
+    surface before any response is streamed (BudgetExceeded when the
+    shared stage cannot be admitted). The returned iterator yields one
+    result dict per resume as it finishes.
+    """
+    # the shared analysis and selection are admitted like a job without loops
+    plan = admit_job(f"batch-{uuid.uuid4()}", max_loops=0)
+    routes_token = current_llm_routes.set(plan["routes"])
+    budget_token = current_budget_id.set(plan["reservation_id"])
+    try:
+        shared_state = prepare_pipeline_state(jd_text, project_count, projects)
+    finally:
+        release_job(plan)
+        current_llm_routes.reset(routes_token)
+        current_budget_id.reset(budget_token)
+    shared_state = {
+        "jd_analysis": shared_state["jd_analysis"],
+        "selected_project_ids": shared_state["selected_project_ids"],
+    }
+
+    parsed = parse_resumes(resumes)
+    return _run_candidates(parsed, jd_text, project_count, projects, shared_state, max_concurrency, max_loops)
+
+
+def _run_candidates(
+    parsed: List[Tuple[str, str, Optional[str]]],
+    jd_text: str,
+    project_count: int,
+    projects: List[Dict[str, Any]],
+    shared_state: Dict[str, Any],
+    max_concurrency: int,
+    max_loops: int,
+) -> Iterator[Dict[str, Any]]:
+    for name, text, error in parsed:
+        if error or not text:
+            yield {"name": name, "error": error or "Resume content is empty"}
+
+    runnable = iter([(name, text) for name, text, error in parsed if text and not error])
+    executors = get_executors()
+    in_flight: Set[Future] = set()
+
+    def _submit_next() -> None:
+        for name, text in runnable:
+            in_flight.add(executors.submit_job(
+                _tailor_one, name, text, jd_text, project_count, projects, shared_state, max_loops
+            ))
+            return
+
+    try:
+        for _ in range(max(1, max_concurrency)):
+            _submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.discard(future)
+                _submit_next()
+                yield future.result()
+    finally:
+        # also runs when the client disconnects and the stream is closed:
+        # queued candidates are dropped and the rest are never submitted
+        for future in in_flight:
+            future.cancel()
+
+
+class _ZipStreamBuffer:
+    """Write-only sink for zipfile; drained after each entry so the archive streams."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _score_sort_key(entry: Dict[str, Any]) -> Tuple[bool, float]:
+    try:
+        return False, -float(entry.get("score"))
+    except (TypeError, ValueError):
+        return True, 0.0
+
+
+def _entry_stem(name: str, used: Dict[str, int]) -> str:
+    stem = Path(name).stem.strip().replace(" ", "_") or "resume"
+    used[stem] = used.get(stem, 0) + 1
+    return stem if used[stem] == 1 else f"{stem}_{used[stem]}"
+
+
+def stream_batch_zip(results: Iterator[Dict[str, Any]], company: str) -> Iterator[bytes]:
+    """
+    Streams a zip with one tailored .docx per candidate, written as soon as
+    each candidate finishes, followed by manifest.json with scores and errors.
+    """
+    buffer = _ZipStreamBuffer()
+    manifest: List[Dict[str, Any]] = []
+    used_stems: Dict[str, int] = {}
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for result in results:
+            entry = {
+                "name": result["name"],
+                "job_id": result.get("job_id"),
+                "score": result.get("score"),
+                "summary": result.get("summary"),
+                "error": result.get("error"),
+                "budget_mode": result.get("budget_mode"),
+            }
+            if not result.get("error"):
+                filename = f"{_entry_stem(result['name'], used_stems)}_{safe_company_name(company)}.docx"
+                docx_bytes = result["pipeline_state"].get("outputs", {}).get("docx_bytes")
+                archive.writestr(filename, docx_bytes or render_resume_docx_bytes(result["resume_text"]))
+                entry["file"] = filename
+            manifest.append(entry)
+            yield buffer.drain()
+        manifest.sort(key=_score_sort_key)
+        archive.writestr("manifest.json", json.dumps({"company": company, "results": manifest}, indent=2))
+    yield buffer.drain()
@@ -0,0 +1,265 @@
+import logging
+import math
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from .llm_schemas import STRUCTURED_OUTPUTS
+from .local_llm_client import ollama_available
+from .openrouter_client import JOB_CALLS_NAMESPACE, OpenRouterClient
+from .pipeline import PIPELINE_MAX_LOOPS
+from .request_context import LOCAL_LLM_STAGES
+from .state_store import get_state_store
+
+BUDGET_NAMESPACE = "budget"
+# OpenRouter calls a job makes outside the rewrite/judge loop (project selection)
+FIXED_CALLS_PER_JOB = int(os.getenv("BUDGET_FIXED_CALLS_PER_JOB", "1"))
+# the JD analysis falls back to OpenRouter when Ollama gives no usable answer
+ANALYSIS_FALLBACK_CALLS = 1
+# fewest loops worth running fully on OpenRouter before moving the judge to Ollama
+BUDGET_MIN_LOOPS = int(os.getenv("BUDGET_MIN_LOOPS", "2"))
+# weight of the newest job in the running averages
+BUDGET_HISTORY_WEIGHT = float(os.getenv("BUDGET_HISTORY_WEIGHT", "0.2"))
+# reservations of jobs that never reported back expire after this many seconds
+BUDGET_RESERVATION_TTL = float(os.getenv("BUDGET_RESERVATION_TTL", "3600"))
+
+OPENROUTER_ROUTES = {"analyze": "openrouter", "select": "openrouter", "rewrite": "openrouter", "judge": "openrouter"}
+LOCAL_JUDGE_ROUTES = {**OPENROUTER_ROUTES, "judge": "local"}
+LOCAL_ROUTES = {stage: "local" for stage in OPENROUTER_ROUTES}
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[OpenRouterClient] = None
+
+
+class BudgetExceeded(RuntimeError):
+    def __init__(self, plan: Dict[str, Any]):
+        super().__init__(plan["reason"])
+        self.plan = plan
+
+
+def _openrouter() -> OpenRouterClient:
+    global _client
+    if _client is None:
+        _client = OpenRouterClient()
+    return _client
+
+
+def _on_openrouter(routes: Dict[str, str], stage: str) -> bool:
+    return routes.get(stage) == "openrouter" and stage not in LOCAL_LLM_STAGES
+
+
+def _calls_per_loop(routes: Dict[str, str]) -> int:
+    return sum(1 for stage in ("rewrite", "judge") if _on_openrouter(routes, stage))
+
+
+def _fixed_calls(routes: Dict[str, str], setup: bool = True) -> int:
+    # project selection; jobs that start from a known selection skip it
+    return FIXED_CALLS_PER_JOB if setup and _on_openrouter(routes, "select") else 0
+
+
+def _worst_extra_calls(routes: Dict[str, str], loops: int, setup: bool) -> int:
+    """Calls beyond the planned ones at worst: analysis fallback, a reselection and a judge repair per loop."""
+    calls = ANALYSIS_FALLBACK_CALLS if setup and _on_openrouter(routes, "analyze") else 0
+    per_loop = int(_on_openrouter(routes, "select")) + int(STRUCTURED_OUTPUTS and _on_openrouter(routes, "judge"))
+    return calls + loops * per_loop
+
+
+def _loop_costs(routes: Dict[str, str], setup: bool) -> Tuple[int, int]:
+    """
+    (calls before the loop, calls per loop) a job reserves. Until jobs have
+    finished, each loop also reserves its worst-case extras; after that the
+    average extras of finished jobs (which include key retries) are
+    reserved once, rounded up.
+    """
+    fixed = _fixed_calls(routes, setup)
+    per_loop = _calls_per_loop(routes)
+    history = job_history()
+    if history.get("jobs"):
+        return fixed + math.ceil(history.get("avg_extra_calls", 0.0)), per_loop
+    return fixed + _worst_extra_calls(routes, 0, setup), per_loop + _worst_extra_calls(routes, 1, False)
+
+
+def job_history() -> Dict[str, Any]:
+    """Running averages of loops and OpenRouter calls per finished job."""
+    return get_state_store().get(BUDGET_NAMESPACE, "history") or {}
+
+
+def expected_calls(max_loops: int, routes: Dict[str, str] = OPENROUTER_ROUTES) -> float:
+    """
+    OpenRouter calls a job is expected to make: the loops jobs usually need
+    (capped at max_loops) plus the calls they usually spend on reselection
+    and retries, falling back to the worst case until there is history.
+    """
+    history = job_history()
+    loops = min(float(max_loops), history.get("avg_loops", max_loops))
+    fixed, per_loop = _loop_costs(routes, True)
+    return float(fixed + loops * per_loop)
+
+
+def _live_reservations(reservations: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    now = time.time()
+    return {rid: entry for rid, entry in (reservations or {}).items() if entry.get("expires_at", 0) > now}
+
+
+def _outstanding(reservations: Dict[str, Any], store) -> int:
+    # a reservation shrinks as its job spends calls, which usage already counts
+    total = 0
+    for reservation_id, entry in reservations.items():
+        spent = int(store.get(JOB_CALLS_NAMESPACE, reservation_id, 0) or 0)
+        total += max(0, int(entry["calls"]) - spent)
+    return total
+
+
+def capacity() -> Dict[str, Any]:
+    """Calls left today across keys, minus what running jobs have reserved."""
+    client = _openrouter()
+    store = get_state_store()
+    usage = client.get_today_usage()
+    keys = {name: max(0, client.daily_limit - int(used)) for name, used in usage.items()}
+    reservations = _live_reservations(store.get(BUDGET_NAMESPACE, "reservations"))
+    reserved = _outstanding(reservations, store)
+    remaining = max(0, sum(keys.values()) - reserved)
+    per_job = expected_calls(PIPELINE_MAX_LOOPS)
+    return {
+        "remaining_calls": remaining,
+        "reserved_calls": reserved,
+        "running_jobs": len(reservations),
+        "keys": keys,
+        "daily_limit_per_key": client.daily_limit,
+        "expected_calls_per_job": round(per_job, 2),
+        "jobs_left_today": int(remaining // per_job) if per_job else None,
+        "history": job_history(),
+        "ollama_available": ollama_available(),
+    }
+
+
+def _plan(remaining: int, max_loops: int, local_ok: bool, setup: bool = True) -> Dict[str, Any]:
+    """
+    Picks the cheapest downgrade that still fits: fewer loops, then a local
+    judge, then Ollama for everything. max_loops is capped so a job can
+    never run out of calls halfway through. setup=False is for jobs that
+    already know their JD analysis and projects; max_loops=0 plans only the
+    setup (the shared stage of a batch).
+    """
+    steps = [("full", OPENROUTER_ROUTES), ("reduced", OPENROUTER_ROUTES), ("local_judge", LOCAL_JUDGE_ROUTES)]
+    for mode, routes in steps:
+        if mode == "local_judge" and not local_ok:
+            break
+        fixed, per_loop = _loop_costs(routes, setup)
+        spare = remaining - fixed
+        if spare < 0:
+            continue
+        # with LOCAL_LLM_STAGES covering every loop stage, loops cost no calls
+        affordable = spare // per_loop if per_loop else max_loops
+        if mode == "full" and affordable < max_loops:
+            continue
+        if mode == "reduced" and affordable < min(max_loops, BUDGET_MIN_LOOPS):
+            continue
+        loops = min(max_loops, affordable)
+        if loops < min(1, max_loops):
+            continue
+        return {
+            "mode": mode,
+            "max_loops": loops,
+            "routes": dict(routes),
+            "setup": setup,
+            "reserved_calls": fixed + loops * per_loop,
+            "remaining_calls": remaining,
+            "reason": "" if mode == "full" else f"OpenRouter budget short: {remaining} calls left today",
+        }
+    if local_ok:
+        return {
+            "mode": "local",
+            "max_loops": max_loops,
+            "routes": dict(LOCAL_ROUTES),
+            "setup": setup,
+            "reserved_calls": 0,
+            "remaining_calls": remaining,
+            "reason": "OpenRouter budget used up; running on Ollama only",
+        }
+    return {
+        "mode": "reject",
+        "max_loops": 0,
+        "routes": {},
+        "setup": setup,
+        "reserved_calls": 0,
+        "remaining_calls": remaining,
+        "reason": f"Not enough OpenRouter calls left today ({remaining}) and Ollama is not reachable",
+    }
+
+
+def plan_job(max_loops: int, setup: bool = True) -> Dict[str, Any]:
+    """Dry run of admit_job; reserves nothing."""
+    return _plan(capacity()["remaining_calls"], max_loops, ollama_available(), setup)
+
+
+def admit_job(job_id: str, max_loops: int, setup: bool = True) -> Dict[str, Any]:
+    """
+    Decides how job_id may run and reserves its OpenRouter calls so
+    concurrent admissions (on any worker) cannot oversubscribe the keys.
+    Each admission gets its own plan["reservation_id"] (a regenerate may
+    overlap its job's generate); callers set current_budget_id to it so the
+    calls are counted against the right reservation.
+    Raises BudgetExceeded when the job cannot run at all.
+    """
+    client = _openrouter()
+    store = get_state_store()
+    local_ok = ollama_available()
+    reservation_id = f"{job_id}:{uuid.uuid4().hex[:12]}"
+    plan: Dict[str, Any] = {}
+
+    def _reserve(reservations):
+        reservations = _live_reservations(reservations)
+        left = sum(max(0, client.daily_limit - int(used)) for used in client.get_today_usage().values())
+        plan.update(_plan(max(0, left - _outstanding(reservations, store)), max_loops, local_ok, setup))
+        if plan["reserved_calls"]:
+            reservations[reservation_id] = {
+                "calls": plan["reserved_calls"],
+                "expires_at": time.time() + BUDGET_RESERVATION_TTL,
+            }
+        return reservations
+
+    store.update(BUDGET_NAMESPACE, "reservations", _reserve, {})
+    plan["reservation_id"] = reservation_id
+    if plan["mode"] == "reject":
+        raise BudgetExceeded(plan)
+    if plan["mode"] != "full":
+        logger.warning("Job %s downgraded to %s (max_loops=%s): %s", job_id, plan["mode"], plan["max_loops"], plan["reason"])
+    return plan
+
+
+def release_job(plan: Dict[str, Any], loops: Optional[int] = None) -> None:
+    """
+    Drops the plan's reservation and, when its job finished (loops given),
+    folds the loop count and calls into the history the planner reserves by.
+    """
+    store = get_state_store()
+    reservation_id = plan["reservation_id"]
+
+    def _drop(reservations):
+        reservations = _live_reservations(reservations)
+        reservations.pop(reservation_id, None)
+        return reservations
+
+    store.update(BUDGET_NAMESPACE, "reservations", _drop, {})
+    calls = int(store.get(JOB_CALLS_NAMESPACE, reservation_id, 0) or 0)
+    store.delete(JOB_CALLS_NAMESPACE, reservation_id)
+    if not loops:
+        return
+
+    def _fold(history):
+        history = dict(history or {})
+        # calls beyond the planned ones: analysis fallback, reselection, schema repairs, key retries
+        routes = plan.get("routes") or OPENROUTER_ROUTES
+        planned = _fixed_calls(routes, plan.get("setup", True)) + loops * _calls_per_loop(routes)
+        extra = max(0.0, calls - planned)
+        jobs = history.get("jobs", 0)
+        weight = 1.0 if jobs == 0 else BUDGET_HISTORY_WEIGHT
+        history["avg_loops"] = round(history.get("avg_loops", 0.0) * (1 - weight) + loops * weight, 3)
+        history["avg_extra_calls"] = round(history.get("avg_extra_calls", 0.0) * (1 - weight) + extra * weight, 3)
+        history["jobs"] = jobs + 1
+        return history
+
+    store.update(BUDGET_NAMESPACE, "history", _fold, {})
@@ -0,0 +1,40 @@
+import os
+from typing import Tuple
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:  # optional: brotli for clients that accept it, gzip for the rest
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # pragma: no cover - depends on the environment
+    BrotliMiddleware = None
+
+# responses smaller than this are sent as-is
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+# 1-9 for gzip; brotli uses 0-11 and gets the same number capped at 11
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+# .docx and .zip are already compressed, and range responses must keep their byte offsets
+UNCOMPRESSED_PREFIXES: Tuple[str, ...] = ("/download", "/batch", "/static")
+
+
+class CompressionMiddleware:
+    """
+    Brotli (when brotli-asgi is installed) or gzip for API responses,
+    skipping paths that serve already-compressed files or byte ranges.
+    """
+
+    def __init__(self, app: ASGIApp, skip_prefixes: Tuple[str, ...] = UNCOMPRESSED_PREFIXES):
+        self.app = app
+        self.skip_prefixes = skip_prefixes
+        if BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(
+                app, quality=min(COMPRESS_LEVEL, 11), minimum_size=COMPRESS_MIN_BYTES, gzip_fallback=True
+            )
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=COMPRESS_MIN_BYTES, compresslevel=COMPRESS_LEVEL)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await self.compressed(scope, receive, send)
@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .resilience import DeadlineExceeded, call_timeout
+
+# pipelines running at once; jobs mostly wait on LLM calls, so threads are cheap
+EXECUTOR_JOB_WORKERS = int(os.getenv("EXECUTOR_JOB_WORKERS", "32"))
+# "thread" or "process" for docx parsing/rendering and diffs
+EXECUTOR_CPU_BACKEND = os.getenv("EXECUTOR_CPU_BACKEND", "thread").lower()
+EXECUTOR_CPU_WORKERS = int(os.getenv("EXECUTOR_CPU_WORKERS", str(os.cpu_count() or 1)))
+# per-stage caps across all jobs, e.g. "rewrite=8,judge=8,docx=2,diff=2"
+EXECUTOR_STAGE_LIMITS = os.getenv("EXECUTOR_STAGE_LIMITS", "")
+
+logger = logging.getLogger(__name__)
+
+
+def parse_stage_limits(text: str) -> Dict[str, int]:
+    limits: Dict[str, int] = {}
+    for part in (text or "").split(","):
+        stage, _, value = part.partition("=")
+        if stage.strip() and value.strip():
+            limits[stage.strip()] = max(1, int(value))
+    return limits
+
+
+def stage_base(name: str) -> str:
+    """TaskGraph node names carry the iteration ("rewrite#2"); limits apply per stage."""
+    return name.split("#", 1)[0]
+
+
+class Executors:
+    """
+    Where pipeline work runs, instead of FastAPI's shared threadpool:
+
+    - jobs: /generate, /regenerate and /batch pipelines, at most
+      job_workers at once. The endpoints are async and await this pool, so
+      downloads and other quick requests no longer queue behind long jobs.
+    - cpu: docx parsing/rendering and diffs, in threads or in a process
+      pool so they do not hold the GIL the event loop and LLM threads need.
+    - stage slots: optional per-stage caps (rewrite, judge, docx, ...)
+      shared by every job in this process.
+    """
+
+    def __init__(
+        self,
+        job_workers: int = EXECUTOR_JOB_WORKERS,
+        cpu_backend: str = EXECUTOR_CPU_BACKEND,
+        cpu_workers: int = EXECUTOR_CPU_WORKERS,
+        stage_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.job_workers = max(1, job_workers)
+        self.cpu_backend = cpu_backend
+        self.cpu_workers = max(1, cpu_workers)
+        self.stage_limits = parse_stage_limits(EXECUTOR_STAGE_LIMITS) if stage_limits is None else stage_limits
+        self.jobs = ThreadPoolExecutor(max_workers=self.job_workers, thread_name_prefix="job")
+        self.cpu = self._cpu_pool()
+        self._slots = {stage: threading.BoundedSemaphore(limit) for stage, limit in self.stage_limits.items()}
+        self._lock = threading.Lock()
+        self._jobs_queued = 0
+        self._jobs_running = 0
+        self._stage_running: Dict[str, int] = {}
+        self._stage_waiting: Dict[str, int] = {}
+
+    def _cpu_pool(self) -> Executor:
+        if self.cpu_backend == "process":
+            # spawn: forking a process that already runs uvicorn and pool threads is unsafe
+            return ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=multiprocessing.get_context("spawn"))
+        if self.cpu_backend != "thread":
+            logger.warning("Unknown EXECUTOR_CPU_BACKEND %r, using threads", self.cpu_backend)
+            self.cpu_backend = "thread"
+        return ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="cpu")
+
+    def _run_tracked(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            self._jobs_queued -= 1
+            self._jobs_running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._jobs_running -= 1
+
+    def submit_job(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Queues a blocking job function on the job pool with the caller's context vars."""
+        with self._lock:
+            self._jobs_queued += 1
+        context = contextvars.copy_context()
+        future = self.jobs.submit(partial(context.run, self._run_tracked, fn, *args, **kwargs))
+        future.add_done_callback(self._forget_cancelled)
+        return future
+
+    def _forget_cancelled(self, future: Future) -> None:
+        if future.cancelled():
+            with self._lock:
+                self._jobs_queued -= 1
+
+    async def run_job(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Awaits a blocking job function on the job pool (see submit_job)."""
+        return await asyncio.wrap_future(self.submit_job(fn, *args, **kwargs))
+
+    def run_cpu(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Blocking call of a CPU-bound function; with processes, fn and args must pickle."""
+        return self.cpu.submit(fn, *args).result()
+
+    @contextmanager
+    def stage_slot(self, name: str) -> Iterator[None]:
+        stage = stage_base(name)
+        slot = self._slots.get(stage)
+        with self._lock:
+            self._stage_waiting[stage] = self._stage_waiting.get(stage, 0) + 1
+        if slot is not None:
+            try:
+                # waits no longer than the job's deadline allows
+                acquired = slot.acquire(timeout=call_timeout(None))
+            except DeadlineExceeded:
+                acquired = False
+            if not acquired:
+                with self._lock:
+                    self._stage_waiting[stage] -= 1
+                raise DeadlineExceeded(f"Job deadline exceeded waiting for a {stage} slot")
+        with self._lock:
+            self._stage_waiting[stage] -= 1
+            self._stage_running[stage] = self._stage_running.get(stage, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stage_running[stage] -= 1
+            if slot is not None:
+                slot.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_workers": self.job_workers,
+                "jobs_running": self._jobs_running,
+                "jobs_queued": self._jobs_queued,
+                "cpu_backend": self.cpu_backend,
+                "cpu_workers": self.cpu_workers,
+                "stages": {
+                    stage: {
+                        "running": self._stage_running.get(stage, 0),
+                        "waiting": self._stage_waiting.get(stage, 0),
+                        "limit": self.stage_limits.get(stage),
+                    }
+                    for stage in sorted(set(self._stage_running) | set(self.stage_limits))
+                },
+            }
+
+    def shutdown(self) -> None:
+        self.jobs.shutdown(wait=False, cancel_futures=True)
+        self.cpu.shutdown(wait=False, cancel_futures=True)
+
+
+_executors: Optional[Executors] = None
+_executors_lock = threading.Lock()
+
+
+def get_executors() -> Executors:
+    global _executors
+    if _executors is None:
+        with _executors_lock:
+            if _executors is None:
+                _executors = Executors()
+    return _executors
+
+
+def run_cpu(fn: Callable[..., Any], *args: Any) -> Any:
+    return get_executors().run_cpu(fn, *args)
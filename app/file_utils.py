@@ -1,14 +1,33 @@
 import io
+import os
+import re
 from pathlib import Path
 from docx import Document
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-OUTPUT_DIR = BASE_DIR / "output"
+OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", str(BASE_DIR / "output")))
 MASTER_RESUME_PATH = BASE_DIR / "app" / "master_resume.docx"
 
 
-def _safe_company(company_name: str) -> str:
-    return company_name.strip().replace(" ", "_")
+_UNSAFE_FILENAME_RE = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def safe_company_name(company_name: str) -> str:
+    """Company name as a file name part: no path separators, quotes or control characters."""
+    return _UNSAFE_FILENAME_RE.sub("", company_name.strip()).replace(" ", "_")
+
+
+def resume_filename(company_name: str, version: int) -> str:
+    return f"Anmol_Sansi_{safe_company_name(company_name)}_v{version}.docx"
+
+
+def render_resume_docx_bytes(resume_text: str) -> bytes:
+    doc = Document()
+    for line in str(resume_text).split("\n"):
+        doc.add_paragraph(line)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
 
 
 def create_resume_docx(company_name: str, resume_text: str, version: int) -> Path:
@@ -19,14 +38,9 @@ def create_resume_docx(company_name: str, resume_text: str, version: int) -> Pat
     try:
         OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-        safe_company = _safe_company(company_name)
-        filename = f"Anmol_Sansi_{safe_company}_v{version}.docx"
-        docx_path = OUTPUT_DIR / filename
+        docx_path = OUTPUT_DIR / resume_filename(company_name, version)
 
-        doc = Document()
-        for line in str(resume_text).split("\n"):
-            doc.add_paragraph(line)
-        doc.save(docx_path)
+        docx_path.write_bytes(render_resume_docx_bytes(resume_text))
 
         return docx_path
     except Exception as e:
@@ -0,0 +1,302 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_HISTORY_DB_PATH = BASE_DIR / "data" / "history.db"
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1") == "1"
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", "365"))
+# rows are written in batches by a background thread
+HISTORY_FLUSH_SECONDS = float(os.getenv("HISTORY_FLUSH_SECONDS", "1"))
+HISTORY_BATCH_SIZE = 500
+_PURGE_INTERVAL = 3600.0
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS llm_calls (
+    ts REAL NOT NULL,
+    job_id TEXT,
+    stage INTEGER NOT NULL,
+    backend INTEGER NOT NULL,
+    model INTEGER NOT NULL,
+    key_name INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS llm_calls_stage ON llm_calls (stage, model, status, ts, latency_ms);
+CREATE INDEX IF NOT EXISTS llm_calls_ts ON llm_calls (ts);
+CREATE INDEX IF NOT EXISTS llm_calls_job ON llm_calls (job_id);
+CREATE TABLE IF NOT EXISTS job_iterations (
+    ts REAL NOT NULL,
+    job_id TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    score REAL,
+    project_issue INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS job_iterations_ts ON job_iterations (ts, job_id, iteration, score);
+CREATE INDEX IF NOT EXISTS job_iterations_job ON job_iterations (job_id, iteration);
+"""
+
+
+class HistoryStore:
+    """
+    Append-only telemetry: one row per LLM call and per rewrite/judge
+    iteration. Repeated strings (stage, backend, model, key, status) are
+    stored once in `names` and referenced by id, which keeps rows small;
+    indexes cover the time-window queries below.
+
+    record_* calls only enqueue; a background thread writes batches so
+    LLM calls never wait on the disk.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._name_ids: Dict[str, int] = {}
+        self._names_lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[str, tuple]]" = queue.Queue()
+        self._writer_pid: Optional[int] = None
+        self._writer_lock = threading.Lock()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _name_id(self, conn: sqlite3.Connection, name: str) -> int:
+        name = name or "-"
+        with self._names_lock:
+            if name not in self._name_ids:
+                conn.execute("INSERT OR IGNORE INTO names (name) VALUES (?)", (name,))
+                self._name_ids[name] = conn.execute("SELECT id FROM names WHERE name = ?", (name,)).fetchone()[0]
+            return self._name_ids[name]
+
+    def _lookup_id(self, name: str) -> Optional[int]:
+        row = self._conn().execute("SELECT id FROM names WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # writes
+
+    def record_call(
+        self,
+        job_id: str,
+        stage: str,
+        backend: str,
+        model: str,
+        key_name: str,
+        status: str,
+        latency_ms: float,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+    ) -> None:
+        row = (time.time(), job_id, stage, backend, model, key_name, status, latency_ms, prompt_tokens, completion_tokens)
+        self._enqueue("call", row)
+
+    def record_iteration(self, job_id: str, iteration: int, score: Optional[float], project_issue: bool) -> None:
+        self._enqueue("iteration", (time.time(), job_id, iteration, score, int(bool(project_issue))))
+
+    def _enqueue(self, kind: str, row: tuple) -> None:
+        self._queue.put((kind, row))
+        # (re)start the writer in this process; threads do not survive a fork
+        if self._writer_pid != os.getpid():
+            with self._writer_lock:
+                if self._writer_pid != os.getpid():
+                    threading.Thread(target=self._write_loop, name="history-writer", daemon=True).start()
+                    self._writer_pid = os.getpid()
+
+    def _write_loop(self) -> None:
+        last_purge = 0.0
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + HISTORY_FLUSH_SECONDS
+            while len(batch) < HISTORY_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                if time.monotonic() - last_purge > _PURGE_INTERVAL:
+                    self.purge(HISTORY_RETENTION_DAYS)
+                    last_purge = time.monotonic()
+            except sqlite3.Error:
+                logger.exception("Could not write %s history rows", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[Tuple[str, tuple]]) -> None:
+        conn = self._conn()
+        calls = []
+        iterations = []
+        for kind, row in batch:
+            if kind == "call":
+                ts, job_id, stage, backend, model, key_name, status, latency, prompt, completion = row
+                calls.append((
+                    ts, job_id,
+                    self._name_id(conn, stage), self._name_id(conn, backend), self._name_id(conn, model),
+                    self._name_id(conn, key_name), self._name_id(conn, status),
+                    latency, prompt, completion,
+                ))
+            else:
+                iterations.append(row)
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT INTO llm_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", calls)
+            conn.executemany("INSERT INTO job_iterations VALUES (?, ?, ?, ?, ?)", iterations)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def flush(self) -> None:
+        """Blocks until everything recorded so far is on disk."""
+        if self._writer_pid == os.getpid():
+            self._queue.join()
+
+    def purge(self, older_than_days: float) -> None:
+        cutoff = time.time() - older_than_days * 86400
+        conn = self._conn()
+        conn.execute("DELETE FROM llm_calls WHERE ts < ?", (cutoff,))
+        conn.execute("DELETE FROM job_iterations WHERE ts < ?", (cutoff,))
+
+    # queries
+
+    def latency_percentiles(self, stage: str, days: float = 7, q: float = 0.95) -> Dict[str, Dict[str, Any]]:
+        """Latency percentile of successful calls of one stage, per model."""
+        stage_id = self._lookup_id(stage)
+        ok_id = self._lookup_id("ok")
+        if stage_id is None or ok_id is None:
+            return {}
+        conn = self._conn()
+        since = time.time() - days * 86400
+        counts = conn.execute(
+            "SELECT model, COUNT(*) FROM llm_calls WHERE stage = ? AND ts >= ? AND status = ? GROUP BY model",
+            (stage_id, since, ok_id),
+        ).fetchall()
+        result: Dict[str, Dict[str, Any]] = {}
+        for model_id, count in counts:
+            # nearest-rank percentile: skip to the row instead of loading the window
+            offset = max(0, min(count - 1, int(round(q * (count - 1)))))
+            value = conn.execute(
+                "SELECT latency_ms FROM llm_calls WHERE stage = ? AND ts >= ? AND status = ? AND model = ?"
+                " ORDER BY latency_ms LIMIT 1 OFFSET ?",
+                (stage_id, since, ok_id, model_id, offset),
+            ).fetchone()[0]
+            model = conn.execute("SELECT name FROM names WHERE id = ?", (model_id,)).fetchone()[0]
+            result[model] = {"calls": count, "latency_ms": round(value, 1)}
+        return result
+
+    def loops_to_score(self, score: float = 8, days: float = 30) -> Dict[str, Any]:
+        """Average iterations jobs needed to first reach `score`, and how many never did."""
+        since = time.time() - days * 86400
+        conn = self._conn()
+        # one pass over the window: first iteration at or above `score` per job.
+        # Without the hint SQLite walks the job_id index (no sort) over all history.
+        total, reached, avg_loops = conn.execute(
+            "SELECT COUNT(*), COUNT(first), AVG(first) FROM ("
+            " SELECT MIN(CASE WHEN score >= ? THEN iteration END) AS first"
+            " FROM job_iterations INDEXED BY job_iterations_ts"
+            " WHERE ts >= ? GROUP BY job_id)",
+            (score, since),
+        ).fetchone()
+        return {
+            "score": score,
+            "jobs": total,
+            "jobs_reached": reached,
+            "avg_loops": round(avg_loops, 2) if avg_loops is not None else None,
+        }
+
+    def call_summary(self, days: float = 1) -> List[Dict[str, Any]]:
+        """Calls, errors and tokens per backend/model/status."""
+        since = time.time() - days * 86400
+        rows = self._conn().execute(
+            "SELECT b.name, m.name, s.name, COUNT(*), AVG(c.latency_ms),"
+            " SUM(c.prompt_tokens), SUM(c.completion_tokens)"
+            " FROM llm_calls c"
+            " JOIN names b ON b.id = c.backend JOIN names m ON m.id = c.model JOIN names s ON s.id = c.status"
+            " WHERE c.ts >= ? GROUP BY c.backend, c.model, c.status",
+            (since,),
+        ).fetchall()
+        return [
+            {
+                "backend": backend,
+                "model": model,
+                "status": status,
+                "calls": calls,
+                "avg_latency_ms": round(avg_latency or 0.0, 1),
+                "prompt_tokens": prompt or 0,
+                "completion_tokens": completion or 0,
+            }
+            for backend, model, status, calls, avg_latency, prompt, completion in rows
+        ]
+
+    def job_trajectory(self, job_id: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT iteration, score, project_issue FROM job_iterations WHERE job_id = ? ORDER BY ts",
+            (job_id,),
+        ).fetchall()
+        return [{"iteration": it, "score": score, "project_issue": bool(issue)} for it, score, issue in rows]
+
+    def job_usage(self, job_id: str) -> Dict[str, Any]:
+        """LLM calls, tokens and summed call latency of one job (call flush() first)."""
+        calls, latency, prompt, completion = self._conn().execute(
+            "SELECT COUNT(*), SUM(latency_ms), SUM(prompt_tokens), SUM(completion_tokens)"
+            " FROM llm_calls WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        return {
+            "calls": calls,
+            "llm_ms": round(latency or 0.0, 1),
+            "prompt_tokens": prompt or 0,
+            "completion_tokens": completion or 0,
+        }
+
+
+class _DisabledHistoryStore:
+    def record_call(self, *args, **kwargs) -> None:
+        pass
+
+    def record_iteration(self, *args, **kwargs) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history_store():
+    """Process-wide history store at HISTORY_DB_PATH; a no-op when HISTORY_ENABLED=0."""
+    global _history
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                if HISTORY_ENABLED:
+                    _history = HistoryStore(Path(os.getenv("HISTORY_DB_PATH", str(DEFAULT_HISTORY_DB_PATH))))
+                    atexit.register(_history.flush)
+                else:
+                    _history = _DisabledHistoryStore()
+    return _history
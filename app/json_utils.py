@@ -0,0 +1,145 @@
+import hashlib
+import json
+import re
+from typing import Any, Iterable, List, Optional
+
+FENCED_BLOCK_RE = re.compile(r"^```(?:[\w-]+)?\s*([\s\S]*?)\s*```$", re.DOTALL)
+
+SMART_OPEN_QUOTE = "“"
+SMART_CLOSE_QUOTE = "”"
+_STRING_ESCAPES = {"\n": "\\n", "\t": "\\t", "\r": ""}
+
+
+def response_key(messages: Iterable[Any], temperature: float) -> str:
+    """Identifies an LLM request by prompt and temperature, for recording and replaying replies."""
+    payload = json.dumps({"messages": list(messages), "temperature": temperature}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def strip_markdown_fences(content: str) -> str:
+    stripped = (content or "").strip()
+    match = FENCED_BLOCK_RE.match(stripped)
+    if match:
+        return match.group(1).strip()
+    return stripped
+
+
+class StreamingJSONParser:
+    """
+    Incrementally scans model output for the first balanced JSON object.
+
+    Text before the object (prose, markdown fences) is skipped. While scanning,
+    common model defects are repaired on the fly:
+      - trailing commas before } or ]
+      - smart double quotes used as string delimiters
+      - raw newlines / tabs / carriage returns inside strings
+    feed() returns the parsed object as soon as it closes, so callers reading a
+    token stream can stop early.
+    """
+
+    def __init__(self) -> None:
+        self.result: Optional[Any] = None
+        self.done = False
+        self._reset_object()
+
+    def _reset_object(self) -> None:
+        self._out: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._string_closer = '"'
+        self._escape = False
+
+    def feed(self, chunk: str) -> Optional[Any]:
+        if self.done:
+            return self.result
+        for ch in chunk or "":
+            if self._consume(ch):
+                candidate = "".join(self._out)
+                self._reset_object()
+                try:
+                    self.result = json.loads(candidate)
+                except json.JSONDecodeError:
+                    # balanced but not JSON (e.g. "{name}" in prose); keep looking
+                    continue
+                self.done = True
+                return self.result
+        return None
+
+    def _consume(self, ch: str) -> bool:
+        """Returns True when a top-level object has just closed."""
+        if self._depth == 0:
+            if ch == "{":
+                self._out.append(ch)
+                self._depth = 1
+            return False
+
+        if self._in_string:
+            if self._escape:
+                self._out.append(ch)
+                self._escape = False
+            elif ch == "\\":
+                self._out.append(ch)
+                self._escape = True
+            elif ch == self._string_closer:
+                self._out.append('"')
+                self._in_string = False
+            elif ch == '"':
+                # literal double quote inside a smart-quoted string
+                self._out.append('\\"')
+            elif ch in _STRING_ESCAPES:
+                self._out.append(_STRING_ESCAPES[ch])
+            else:
+                self._out.append(ch)
+            return False
+
+        if ch == '"' or ch == SMART_OPEN_QUOTE:
+            self._in_string = True
+            self._string_closer = '"' if ch == '"' else SMART_CLOSE_QUOTE
+            self._out.append('"')
+        elif ch in "{[":
+            self._depth += 1
+            self._out.append(ch)
+        elif ch in "}]":
+            self._drop_trailing_comma()
+            self._depth -= 1
+            self._out.append(ch)
+            return self._depth == 0
+        else:
+            self._out.append(ch)
+        return False
+
+    def _drop_trailing_comma(self) -> None:
+        out = self._out
+        idx = len(out) - 1
+        while idx >= 0 and out[idx].isspace():
+            idx -= 1
+        if idx >= 0 and out[idx] == ",":
+            del out[idx:]
+
+
+def parse_json_stream(chunks: Iterable[str]) -> Optional[Any]:
+    """
+    Consumes chunks until the first JSON object is complete.
+    Stops iterating as soon as it is, so a streaming response can be closed early.
+    """
+    parser = StreamingJSONParser()
+    for chunk in chunks:
+        if parser.feed(chunk) is not None:
+            return parser.result
+    return None
+
+
+def parse_json_object(content: str) -> Optional[Any]:
+    """
+    Tolerant replacement for json.loads on LLM output.
+    Tries a strict parse of the fence-stripped text first, then scans for the
+    first balanced object with repairs. Returns None if nothing parses.
+    """
+    clean = strip_markdown_fences(content)
+    if clean.startswith("{"):
+        try:
+            return json.loads(clean)
+        except json.JSONDecodeError:
+            pass
+    parser = StreamingJSONParser()
+    return parser.feed(clean)
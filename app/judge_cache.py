@@ -0,0 +1,199 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .agents import GROK_MODEL
+from .analysis_cache import canonicalize_text, jd_hash
+from .llm_schemas import STRUCTURED_OUTPUTS, validate_judgement
+from .ollama_client import get_ollama_client
+from .request_context import stage_backend
+from .state_store import get_state_store
+
+JUDGE_CACHE_NAMESPACE = "judge_cache"
+# judgements are shared across jobs and workers for the same JD + projects + resume
+JUDGE_CACHE_ENABLED = os.getenv("JUDGE_CACHE_ENABLED", "1") == "1"
+JUDGE_CACHE_TTL = float(os.getenv("JUDGE_CACHE_TTL", str(7 * 24 * 3600)))
+# resumes remembered per JD + project set; the oldest are dropped first
+JUDGE_CACHE_GROUP_SIZE = int(os.getenv("JUDGE_CACHE_GROUP_SIZE", "32"))
+# SimHash bits (of 64) two resumes may differ in and still count as near-duplicates
+JUDGE_NEAR_DUP_BITS = int(os.getenv("JUDGE_NEAR_DUP_BITS", "6"))
+# what to do with a near-duplicate: "flag" it and judge anyway, "reuse" its judgement, or "off"
+JUDGE_NEAR_DUPLICATES = os.getenv("JUDGE_NEAR_DUPLICATES", "flag")
+_SHINGLE_WORDS = 3
+
+_WORD_RE = re.compile(r"\w[\w+#.%-]*")
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash over lowercase word 3-shingles. Resumes that share most
+    of their phrasing differ in few bits: a one-line edit of a 40-line
+    resume moves it by up to about 10 bits, an unrelated resume by about 32.
+    """
+    words = _WORD_RE.findall(text.lower())
+    counts = [0] * 64
+    for i in range(max(1, len(words) - _SHINGLE_WORDS + 1)):
+        shingle = " ".join(words[i:i + _SHINGLE_WORDS]).encode("utf-8")
+        value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "big")
+        for bit in range(64):
+            counts[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, count in enumerate(counts) if count > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _judge_model() -> str:
+    # Ollama and OpenRouter score differently, so each keeps its own judgements
+    if stage_backend("judge") == "local":
+        return f"local:{get_ollama_client().model}"
+    return f"openrouter:{GROK_MODEL}"
+
+
+def _cacheable(judgement: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The judgement as stored, or None when it is not worth storing. With
+    structured outputs it must match JUDGE_SCHEMA; a free-form reply only
+    needs a numeric score, and its improvements are kept as strings.
+    """
+    if STRUCTURED_OUTPUTS:
+        return None if validate_judgement(judgement) else dict(judgement)
+    try:
+        score = float(judgement.get("score"))
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(score):
+        return None
+    improvements = judgement.get("improvements") or []
+    if not isinstance(improvements, list):
+        improvements = [improvements]
+    return {
+        **judgement,
+        "score": score,
+        "improvements": [item if isinstance(item, str) else json.dumps(item) for item in improvements],
+    }
+
+
+@dataclass
+class JudgeLookup:
+    group: str
+    fingerprint: str
+    simhash: int
+    # judgement of exactly this resume, from any job
+    judgement: Optional[Dict[str, Any]] = None
+    # closest earlier resume within JUDGE_NEAR_DUP_BITS: score, distance, judgement
+    near: Optional[Dict[str, Any]] = None
+
+
+class JudgeCache:
+    """
+    Judge results shared across jobs. Entries are grouped by what the judge
+    sees besides the resume (canonical JD, selected projects, the backend
+    and model the job's judge runs on, temperature, prompt template); each
+    group keeps its last `group_size` resumes as fingerprint, SimHash and
+    judgement, in one state-store entry.
+
+    An exact fingerprint match skips the judge call. A resume within
+    `max_distance` bits of an earlier one is a near-duplicate: the rewrite
+    barely changed it, so it is unlikely to score better.
+    """
+
+    def __init__(
+        self,
+        ttl: float = JUDGE_CACHE_TTL,
+        group_size: int = JUDGE_CACHE_GROUP_SIZE,
+        max_distance: int = JUDGE_NEAR_DUP_BITS,
+    ):
+        self.ttl = ttl
+        self.group_size = max(1, group_size)
+        self.max_distance = max_distance
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def group_key(self, jd_text: str, project_ids: List[str], temperature: float) -> str:
+        template = os.getenv("PROMPT_JUDGE_TEMPLATE") or ""
+        payload = "\n".join([
+            jd_hash(jd_text),
+            ",".join(sorted(pid for pid in project_ids if pid)),
+            _judge_model(),
+            repr(float(temperature)),
+            hashlib.sha256(template.encode("utf-8")).hexdigest(),
+        ])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, jd_text: str, project_ids: List[str], resume_text: str, temperature: float) -> JudgeLookup:
+        canonical = canonicalize_text(resume_text)
+        found = JudgeLookup(
+            group=self.group_key(jd_text, project_ids, temperature),
+            fingerprint=hashlib.sha256(canonical.encode("utf-8")).hexdigest(),
+            simhash=simhash(canonical),
+        )
+        for entry in get_state_store().get(JUDGE_CACHE_NAMESPACE, found.group) or []:
+            if entry["fingerprint"] == found.fingerprint:
+                found.judgement = dict(entry["judgement"])
+                found.near = None
+                break
+            distance = hamming(found.simhash, int(entry["simhash"], 16))
+            if distance <= self.max_distance and (found.near is None or distance < found.near["distance"]):
+                found.near = {
+                    "score": entry["judgement"].get("score"),
+                    "distance": distance,
+                    "judgement": entry["judgement"],
+                }
+        with self._lock:
+            if found.judgement is not None:
+                self.hits += 1
+            elif found.near is not None:
+                self.near_hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def remember(self, found: JudgeLookup, judgement: Dict[str, Any]) -> None:
+        """Stores a judgement parsed from a judge reply; callers skip failed calls."""
+        judgement = _cacheable(judgement)
+        if judgement is None:
+            return
+        store = get_state_store()
+        entries = [e for e in store.get(JUDGE_CACHE_NAMESPACE, found.group) or []
+                   if e["fingerprint"] != found.fingerprint]
+        entries.append({
+            "fingerprint": found.fingerprint,
+            "simhash": format(found.simhash, "016x"),
+            "judgement": judgement,
+            "ts": time.time(),
+        })
+        # read-modify-write: two workers storing at once can drop one entry,
+        # which only costs a judge call later
+        store.set(JUDGE_CACHE_NAMESPACE, found.group, entries[-self.group_size:], ttl=self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": JUDGE_CACHE_ENABLED,
+                "hits": self.hits,
+                "near_duplicates": self.near_hits,
+                "misses": self.misses,
+            }
+
+
+_judge_cache: Optional[JudgeCache] = None
+_judge_cache_lock = threading.Lock()
+
+
+def get_judge_cache() -> JudgeCache:
+    global _judge_cache
+    if _judge_cache is None:
+        with _judge_cache_lock:
+            if _judge_cache is None:
+                _judge_cache = JudgeCache()
+    return _judge_cache
@@ -0,0 +1,205 @@
+import itertools
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# short calls (JD analysis, project selection, judge) go ahead of long rewrites
+PRIORITY_SHORT = 0
+PRIORITY_LONG = 1
+
+KEY_RPM = float(os.getenv("OPENROUTER_KEY_RPM", "20"))
+KEY_BURST = float(os.getenv("OPENROUTER_KEY_BURST", "3"))
+# 0 disables the per-model limit
+MODEL_RPM = float(os.getenv("OPENROUTER_MODEL_RPM", "0"))
+MODEL_BURST = float(os.getenv("OPENROUTER_MODEL_BURST", "3"))
+SCHEDULER_TIMEOUT = float(os.getenv("OPENROUTER_SCHEDULER_TIMEOUT", "300"))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(burst, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)."""
+        # a 429 cooldown applies even when the bucket has no rate limit
+        cooldown = max(0.0, self.blocked_until - now)
+        if self.rate <= 0:
+            return cooldown
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return cooldown
+        return max(cooldown, (1.0 - self.tokens) / self.rate)
+
+    def take(self, now: float) -> None:
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1.0
+
+    def block(self, seconds: float, now: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Waiter:
+    __slots__ = ("priority", "job_id", "seq", "keys", "model")
+
+    def __init__(self, priority: int, job_id: str, seq: int, keys: List[str], model: str):
+        self.priority = priority
+        self.job_id = job_id
+        self.seq = seq
+        self.keys = keys
+        self.model = model
+
+
+class LLMScheduler:
+    """
+    Process-wide admission point in front of OpenRouter calls.
+
+    Every call waits for a token from its key's bucket and its model's
+    bucket, so bursts from concurrent jobs are spread out instead of
+    turning into 429s. Waiting calls are served by priority first, then by
+    how many calls their job has already been granted (fair queuing, so one
+    big batch cannot starve an interactive job), then in arrival order.
+    """
+
+    def __init__(
+        self,
+        key_rpm: float = KEY_RPM,
+        key_burst: float = KEY_BURST,
+        model_rpm: float = MODEL_RPM,
+        model_burst: float = MODEL_BURST,
+    ):
+        self.key_rpm = key_rpm
+        self.key_burst = key_burst
+        self.model_rpm = model_rpm
+        self.model_burst = model_burst
+        self._cond = threading.Condition()
+        self._key_buckets: Dict[str, TokenBucket] = {}
+        self._model_buckets: Dict[str, TokenBucket] = {}
+        self._waiters: List[_Waiter] = []
+        self._served: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self.granted = 0
+        self.total_wait = 0.0
+
+    def _key_bucket(self, key_name: str) -> TokenBucket:
+        if key_name not in self._key_buckets:
+            self._key_buckets[key_name] = TokenBucket(self.key_rpm, self.key_burst)
+        return self._key_buckets[key_name]
+
+    def _model_bucket(self, model: str) -> TokenBucket:
+        if model not in self._model_buckets:
+            self._model_buckets[model] = TokenBucket(self.model_rpm, self.model_burst)
+        return self._model_buckets[model]
+
+    def _order(self, waiter: _Waiter):
+        return waiter.priority, self._served.get(waiter.job_id, 0), waiter.seq
+
+    def _best_key(self, waiter: _Waiter, now: float):
+        model_wait = self._model_bucket(waiter.model).wait_time(now)
+        best_key, best_wait = None, None
+        for key_name in waiter.keys:
+            wait = max(model_wait, self._key_bucket(key_name).wait_time(now))
+            if best_wait is None or wait < best_wait:
+                best_key, best_wait = key_name, wait
+        return best_key, best_wait
+
+    def acquire(
+        self,
+        keys: List[str],
+        model: str,
+        priority: int = PRIORITY_LONG,
+        job_id: str = "-",
+        timeout: Optional[float] = SCHEDULER_TIMEOUT,
+    ) -> str:
+        """
+        Blocks until this call may go out; returns the key to use.
+        Raises TimeoutError if no key frees up in time.
+        """
+        if not keys:
+            raise RuntimeError("No OpenRouter keys to schedule on")
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        with self._cond:
+            waiter = _Waiter(priority, job_id, next(self._seq), list(keys), model)
+            self._waiters.append(waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    head = min(self._waiters, key=self._order)
+                    if head is waiter:
+                        key_name, wait = self._best_key(waiter, now)
+                        if wait <= 0:
+                            self._key_bucket(key_name).take(now)
+                            self._model_bucket(model).take(now)
+                            if job_id != "-":
+                                # calls outside a job (prefetch) have nobody to finish_job() them
+                                self._served[job_id] = self._served.get(job_id, 0) + 1
+                            self.granted += 1
+                            self.total_wait += now - started
+                            return key_name
+                    else:
+                        wait = None
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise TimeoutError("Timed out waiting for an OpenRouter rate-limit slot")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiters.remove(waiter)
+                self._cond.notify_all()
+
+    def penalize_key(self, key_name: str, seconds: float) -> None:
+        """Keeps a rate-limited key out of rotation for a while instead of for the day."""
+        with self._cond:
+            self._key_bucket(key_name).block(seconds, time.monotonic())
+            self._cond.notify_all()
+
+    def finish_job(self, job_id: str) -> None:
+        with self._cond:
+            self._served.pop(job_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "queued": len(self._waiters),
+                "queued_short": sum(1 for w in self._waiters if w.priority == PRIORITY_SHORT),
+                "granted": self.granted,
+                "avg_wait_seconds": round(self.total_wait / self.granted, 3) if self.granted else 0.0,
+                "active_jobs": len(self._served),
+                "keys": {
+                    name: {
+                        "tokens": round(bucket.tokens, 2),
+                        "blocked_for": round(max(0.0, bucket.blocked_until - now), 1),
+                    }
+                    for name, bucket in self._key_buckets.items()
+                },
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
@@ -0,0 +1,159 @@
+import os
+from typing import Any, Callable, Dict, List
+
+from .jd_schema import REQUIRED_KEYS
+
+# send JSON schemas as Ollama `format` / OpenRouter `response_format`
+STRUCTURED_OUTPUTS = os.getenv("LLM_STRUCTURED_OUTPUTS", "0") == "1"
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+JD_ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {key: _STRING_LIST for key in REQUIRED_KEYS},
+    "required": list(REQUIRED_KEYS),
+    "additionalProperties": False,
+}
+
+SELECTION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "selected_project_ids": _STRING_LIST,
+        "reasons": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}, "reason": {"type": "string"}},
+                "required": ["id", "reason"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["selected_project_ids", "reasons"],
+    "additionalProperties": False,
+}
+
+REWRITE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {"upgradedResume": {"type": "string", "minLength": 1}},
+    "required": ["upgradedResume"],
+    "additionalProperties": False,
+}
+
+JUDGE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "number", "minimum": 0, "maximum": 10},
+        "summary": {"type": "string"},
+        "improvements": _STRING_LIST,
+        "project_selection_issue": {"type": "boolean"},
+    },
+    "required": ["score", "summary", "improvements", "project_selection_issue"],
+    "additionalProperties": False,
+}
+
+Validator = Callable[[Any], List[str]]
+
+_TYPES = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def compile_validator(schema: Dict[str, Any]) -> Validator:
+    """
+    Turns the JSON Schema subset used above (type, properties, required,
+    additionalProperties, items, enum, minimum/maximum, minLength) into
+    nested closures once, so validating a response is a plain function
+    call. The validator returns a list of errors; empty means valid.
+    """
+    return _compile(schema, "$")
+
+
+def _compile(schema: Dict[str, Any], path: str) -> Validator:
+    checks: List[Validator] = []
+
+    if "type" in schema:
+        type_name = schema["type"]
+        type_check = _TYPES[type_name]
+
+        def _check_type(value: Any) -> List[str]:
+            return [] if type_check(value) else [f"{path}: expected {type_name}"]
+
+        checks.append(_check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+        checks.append(lambda value: [] if value in allowed else [f"{path}: not one of {allowed}"])
+
+    if "minimum" in schema or "maximum" in schema:
+        low, high = schema.get("minimum"), schema.get("maximum")
+
+        def _check_range(value: Any) -> List[str]:
+            if not _TYPES["number"](value):
+                return []
+            if (low is not None and value < low) or (high is not None and value > high):
+                return [f"{path}: {value} outside [{low}, {high}]"]
+            return []
+
+        checks.append(_check_range)
+
+    if "minLength" in schema:
+        min_length = schema["minLength"]
+        checks.append(
+            lambda value: [f"{path}: shorter than {min_length}"]
+            if isinstance(value, str) and len(value) < min_length else []
+        )
+
+    if "properties" in schema or "required" in schema:
+        properties = {name: _compile(sub, f"{path}.{name}") for name, sub in schema.get("properties", {}).items()}
+        required = list(schema.get("required", []))
+        closed = schema.get("additionalProperties") is False
+
+        def _check_object(value: Any) -> List[str]:
+            if not isinstance(value, dict):
+                return []
+            errors = [f"{path}: missing {name}" for name in required if name not in value]
+            for name, item in value.items():
+                if name in properties:
+                    errors.extend(properties[name](item))
+                elif closed:
+                    errors.append(f"{path}: unexpected {name}")
+            return errors
+
+        checks.append(_check_object)
+
+    if "items" in schema:
+        item_check = _compile(schema["items"], f"{path}[]")
+
+        def _check_items(value: Any) -> List[str]:
+            if not isinstance(value, list):
+                return []
+            errors: List[str] = []
+            for item in value:
+                errors.extend(item_check(item))
+            return errors
+
+        checks.append(_check_items)
+
+    def _validate(value: Any) -> List[str]:
+        errors: List[str] = []
+        for check in checks:
+            errors.extend(check(value))
+            if errors and check is checks[0] and "type" in schema:
+                # wrong type: the remaining checks would only add noise
+                break
+        return errors
+
+    return _validate
+
+
+validate_jd_analysis = compile_validator(JD_ANALYSIS_SCHEMA)
+validate_selection = compile_validator(SELECTION_SCHEMA)
+validate_rewrite = compile_validator(REWRITE_SCHEMA)
+validate_judgement = compile_validator(JUDGE_SCHEMA)
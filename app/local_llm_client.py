@@ -1,19 +1,26 @@
-import json
+import contextvars
 import os
-import re
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 from dotenv import load_dotenv
 
+from .json_utils import parse_json_object
 from .jd_schema import REQUIRED_KEYS, is_good_jd_analysis, normalize_jd_analysis
+from .llm_schemas import JD_ANALYSIS_SCHEMA, STRUCTURED_OUTPUTS, validate_jd_analysis
+from .llm_scheduler import PRIORITY_SHORT
+from .ollama_client import get_ollama_client
 from .openrouter_client import OpenRouterClient
+from .request_context import current_llm_stage, stage_backend
+from .resilience import CircuitOpenError, DeadlineExceeded
 
 load_dotenv()
 
-# URL for Ollama running locally
-OLLAMA_URL = "http://localhost:11434/api/chat"
-LOCAL_MODEL_NAME = "mistral"  # or another model you've pulled in Ollama
+# run the normal and the strict analysis prompt at the same time and take
+# the first valid answer (needs OLLAMA_MAX_PARALLEL >= 2). Off by default:
+# it doubles Ollama load per analysis and holds both slots other stages use
+OLLAMA_PARALLEL_ATTEMPTS = os.getenv("OLLAMA_PARALLEL_ATTEMPTS", "0") == "1"
 OPENROUTER_FALLBACK_MODEL = os.getenv("OPENROUTER_STEP1_MODEL", "mistralai/mistral-7b-instruct:free")
 DEFAULT_ANALYZE_TEMPLATE = """You are a job description analyzer.
 Read the job description and extract the following information.
@@ -36,39 +43,27 @@ STRICT_SYSTEM_PROMPT = (
 )
 
 _openrouter_client = OpenRouterClient()
-FENCED_BLOCK_RE = re.compile(r"^```(?:[\w-]+)?\s*([\s\S]*?)\s*```$", re.DOTALL)
 
 
 def _empty_analysis() -> Dict[str, List[str]]:
     return {key: [] for key in REQUIRED_KEYS}
 
 
-def _call_ollama(messages: List[Dict[str, str]]) -> str:
-    body = {
-        "model": LOCAL_MODEL_NAME,
-        "messages": messages,
-        "stream": False,
-    }
-    response = requests.post(OLLAMA_URL, json=body, timeout=60)
-    response.raise_for_status()
-    data = response.json()
-    return data["message"]["content"]
+def chat_local(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.2,
+    schema: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Chat completion on the local Ollama model; used when a stage is routed locally."""
+    return get_ollama_client().chat(messages, temperature=temperature, schema=schema)
 
 
-def _strip_markdown_fences(content: str) -> str:
-    stripped = content.strip()
-    match = FENCED_BLOCK_RE.match(stripped)
-    if match:
-        return match.group(1).strip()
-    return stripped
+def ollama_available() -> bool:
+    return get_ollama_client().available()
 
 
 def _parse_and_validate(content: str) -> Optional[Dict[str, List[str]]]:
-    clean = _strip_markdown_fences(content)
-    try:
-        raw: Any = json.loads(clean)
-    except json.JSONDecodeError:
-        raw = {}
+    raw: Any = parse_json_object(content) or {}
 
     normalized = normalize_jd_analysis(raw)
     if is_good_jd_analysis(normalized):
@@ -76,7 +71,57 @@ def _parse_and_validate(content: str) -> Optional[Dict[str, List[str]]]:
     return None
 
 
+def _structured_attempt(messages: List[Dict[str, str]]) -> Tuple[Optional[Dict[str, List[str]]], bool]:
+    """
+    One schema-constrained call. Returns (analysis, enforced): enforced is
+    True when Ollama honoured the schema, so a stricter prompt cannot help.
+    """
+    client = get_ollama_client()
+    try:
+        content = client.chat(messages, schema=JD_ANALYSIS_SCHEMA)
+    except (requests.RequestException, CircuitOpenError):
+        return None, False
+    parsed = parse_json_object(content)
+    if validate_jd_analysis(parsed):
+        return None, False
+    normalized = normalize_jd_analysis(parsed)
+    return (normalized if is_good_jd_analysis(normalized) else None), bool(client.supports_format)
+
+
+def _try_ollama(messages: List[Dict[str, str]]) -> Optional[Dict[str, List[str]]]:
+    try:
+        content = get_ollama_client().chat(messages)
+    except (requests.RequestException, CircuitOpenError):
+        # Ollama is down: fall back to OpenRouter without waiting
+        return None
+    return _parse_and_validate(content)
+
+
+def _first_valid_attempt(attempts: List[List[Dict[str, str]]]) -> Optional[Dict[str, List[str]]]:
+    if not OLLAMA_PARALLEL_ATTEMPTS or get_ollama_client().max_parallel < 2:
+        for messages in attempts:
+            parsed = _try_ollama(messages)
+            if parsed:
+                return parsed
+        return None
+
+    pool = ThreadPoolExecutor(max_workers=len(attempts), thread_name_prefix="ollama-analyze")
+    try:
+        futures = [pool.submit(contextvars.copy_context().run, _try_ollama, messages) for messages in attempts]
+        for future in as_completed(futures):
+            parsed = future.result()
+            if parsed:
+                return parsed
+        return None
+    finally:
+        # a slower attempt still running is left to finish in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
 def _fallback_to_openrouter(jd_text: str) -> Dict[str, List[str]]:
+    if stage_backend("analyze") == "local":
+        # Ollama-only job: no OpenRouter budget left for the fallback
+        return _empty_analysis()
     user_template = os.getenv("PROMPT_ANALYZE_JD_TEMPLATE", DEFAULT_ANALYZE_TEMPLATE)
     messages = [
         {
@@ -91,13 +136,17 @@ def _fallback_to_openrouter(jd_text: str) -> Dict[str, List[str]]:
             messages,
             temperature=0.1,
             max_tokens=700,
+            priority=PRIORITY_SHORT,
+            schema=JD_ANALYSIS_SCHEMA if STRUCTURED_OUTPUTS else None,
+            schema_name="jd_analysis",
         )
-        clean = _strip_markdown_fences(content)
-        clean = clean.replace('\r', '').replace('\t', ' ')
-        parsed = json.loads(clean)
-    except (json.JSONDecodeError, requests.RequestException, RuntimeError):
+    except DeadlineExceeded:
+        raise
+    except (requests.RequestException, RuntimeError):
         return _empty_analysis()
 
+    parsed = parse_json_object(content)
+
     normalized = normalize_jd_analysis(parsed)
     return normalized if is_good_jd_analysis(normalized) else normalized
 
@@ -105,10 +154,16 @@ def _fallback_to_openrouter(jd_text: str) -> Dict[str, List[str]]:
 def analyze_jd_local(jd_text: str) -> Dict[str, List[str]]:
     """
     Ask the local model (via Ollama) to analyze a job description and
-    return a structured JSON dictionary. Retries with a stricter prompt and
-    falls back to OpenRouter if validation fails.
+    return a structured JSON dictionary. Tries a stricter prompt as well
+    (in parallel when OLLAMA_PARALLEL_ATTEMPTS is on) and falls back to
+    OpenRouter if neither validates.
+
+    With LLM_STRUCTURED_OUTPUTS=1 the first call is constrained to
+    JD_ANALYSIS_SCHEMA; the strict prompt is only tried when this Ollama
+    does not support schemas.
     """
     user_template = os.getenv("PROMPT_ANALYZE_JD_TEMPLATE")
+    current_llm_stage.set("analyze")
 
     attempts = [
         [
@@ -133,14 +188,15 @@ def analyze_jd_local(jd_text: str) -> Dict[str, List[str]]:
         ],
     ]
 
-    for messages in attempts:
-        try:
-            content = _call_ollama(messages)
-        except requests.RequestException:
-            continue
-
-        parsed = _parse_and_validate(content)
+    if STRUCTURED_OUTPUTS and get_ollama_client().supports_format is not False:
+        parsed, enforced = _structured_attempt(attempts[0])
         if parsed:
             return parsed
+        if enforced:
+            # valid JSON but too thin; a stricter prompt fixes format, not content
+            return _fallback_to_openrouter(jd_text)
 
+    parsed = _first_valid_attempt(attempts)
+    if parsed:
+        return parsed
     return _fallback_to_openrouter(jd_text)
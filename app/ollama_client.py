@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from .history_store import get_history_store
+from .request_context import current_job_id, current_llm_stage
+from .resilience import DeadlineExceeded, call_timeout, get_breaker
+
+load_dotenv()
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+# how long Ollama keeps the model loaded after a call ("30m", "1h", "-1" = forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# context window; Ollama's own default (2048) truncates rewrite prompts
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+# max tokens generated per call; -1 = until the model stops
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "-1"))
+# requests in flight at once; match OLLAMA_NUM_PARALLEL on the server
+OLLAMA_MAX_PARALLEL = int(os.getenv("OLLAMA_MAX_PARALLEL", "2"))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "180"))
+# seconds an Ollama health check result is reused
+OLLAMA_CHECK_TTL = float(os.getenv("OLLAMA_CHECK_TTL", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaClient:
+    """
+    Client for a local Ollama server.
+
+    Keeps one pooled HTTP session, asks Ollama to keep the model loaded
+    between jobs (keep_alive) and caps concurrent requests, so parallel
+    stages queue here instead of overloading the server.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_BASE_URL,
+        model: str = OLLAMA_MODEL,
+        keep_alive: str = OLLAMA_KEEP_ALIVE,
+        num_ctx: int = OLLAMA_NUM_CTX,
+        num_predict: int = OLLAMA_NUM_PREDICT,
+        max_parallel: int = OLLAMA_MAX_PARALLEL,
+        timeout: float = OLLAMA_TIMEOUT,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.max_parallel = max(1, max_parallel)
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_parallel)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(self.max_parallel)
+        self._checked_at = 0.0
+        self._available = False
+        # None until a schema request tells us; older Ollama rejects `format` schemas
+        self.supports_format: Optional[bool] = None
+        self.history = get_history_store()
+        self.breaker = get_breaker("ollama")
+
+    def _options(self, temperature: Optional[float], options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        merged: Dict[str, Any] = {"num_ctx": self.num_ctx, "num_predict": self.num_predict}
+        if temperature is not None:
+            merged["temperature"] = temperature
+        merged.update(options or {})
+        return merged
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        options: Optional[Dict[str, Any]] = None,
+        schema: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        With a JSON schema, the answer is constrained to it via `format`.
+        If this Ollama is too old for schemas the request is repeated
+        without one and schemas are not sent again.
+
+        Waiting for a slot and the request itself are bounded by the job's
+        deadline; while Ollama is down the circuit breaker fails fast.
+        """
+        body: Dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": self._options(temperature, options),
+        }
+        if schema is not None and self.supports_format is not False:
+            body["format"] = schema
+        if not self._slots.acquire(timeout=call_timeout(None)):
+            raise DeadlineExceeded("Job deadline exceeded waiting for an Ollama slot")
+        try:
+            try:
+                data = self._post_chat(body)
+            except requests.HTTPError as exc:
+                if "format" not in body or exc.response is None or exc.response.status_code != 400:
+                    raise
+                logger.warning("Ollama rejected the JSON schema format; sending plain requests from now on")
+                self.supports_format = False
+                del body["format"]
+                data = self._post_chat(body)
+            if "format" in body:
+                self.supports_format = True
+            return data["message"]["content"]
+        finally:
+            self._slots.release()
+
+    def _post_chat(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        timeout = call_timeout(self.timeout)
+        self.breaker.allow()
+        started = time.perf_counter()
+        status = "error"
+        data: Dict[str, Any] = {}
+        try:
+            try:
+                response = self.session.post(f"{self.base_url}/api/chat", json=body, timeout=timeout)
+            except requests.Timeout as exc:
+                if timeout < self.timeout:
+                    # cut short by the job's deadline, not a sign that Ollama is down
+                    self.breaker.release()
+                    raise DeadlineExceeded("Job deadline exceeded during an Ollama call") from exc
+                self.breaker.failure()
+                raise
+            except requests.RequestException:
+                self.breaker.failure()
+                raise
+            if response.status_code >= 500:
+                self.breaker.failure()
+            else:
+                self.breaker.success()
+            status = "ok" if response.ok else f"http_{response.status_code}"
+            response.raise_for_status()
+            data = response.json()
+            return data
+        finally:
+            self.history.record_call(
+                job_id=current_job_id.get(),
+                stage=current_llm_stage.get(),
+                backend="ollama",
+                model=self.model,
+                key_name="-",
+                status=status,
+                latency_ms=(time.perf_counter() - started) * 1000,
+                prompt_tokens=data.get("prompt_eval_count"),
+                completion_tokens=data.get("eval_count"),
+            )
+
+    def available(self) -> bool:
+        """Whether Ollama answers; cached for OLLAMA_CHECK_TTL seconds, False while its circuit is open."""
+        if not self.breaker.available():
+            return False
+        now = time.monotonic()
+        if now - self._checked_at < OLLAMA_CHECK_TTL:
+            return self._available
+        try:
+            self.session.get(f"{self.base_url}/api/tags", timeout=2).raise_for_status()
+            self._available = True
+        except requests.RequestException:
+            self._available = False
+        self._checked_at = now
+        return self._available
+
+    def warm_up(self) -> bool:
+        """
+        Loads the model into memory with an empty generate request, so the
+        first job does not pay the model load. Returns False when Ollama is
+        not running.
+        """
+        started = time.perf_counter()
+        try:
+            self.session.post(
+                f"{self.base_url}/api/generate",
+                json={"model": self.model, "keep_alive": self.keep_alive},
+                timeout=self.timeout,
+            ).raise_for_status()
+        except requests.RequestException as exc:
+            logger.info("Ollama warm-up skipped: %s", exc)
+            return False
+        self._available, self._checked_at = True, time.monotonic()
+        logger.info("Ollama model %s loaded in %.1fs", self.model, time.perf_counter() - started)
+        return True
+
+
+_client: Optional[OllamaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_ollama_client() -> OllamaClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaClient()
+    return _client
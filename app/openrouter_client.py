@@ -1,5 +1,6 @@
 import os
 import json
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -7,14 +8,35 @@ import requests
 from dotenv import load_dotenv
 import logging
 
-BASE_DIR = Path(__file__).resolve().parent.parent
-USAGE_FILE = BASE_DIR / "data" / "usage.json"
+from .history_store import get_history_store
+from .llm_scheduler import PRIORITY_LONG, SCHEDULER_TIMEOUT, get_scheduler
+from .request_context import current_budget_id, current_job_id, current_llm_stage
+from .resilience import DeadlineExceeded, call_timeout, check_deadline, get_breaker
+from .state_store import get_state_store
 
 load_dotenv()
 
+BASE_DIR = Path(__file__).resolve().parent.parent
+# legacy per-day usage file, migrated into the state store on first start
+USAGE_FILE = BASE_DIR / "data" / "usage.json"
+USAGE_NAMESPACE = "openrouter_usage"
+# calls spent per budget reservation, read by the budget planner
+JOB_CALLS_NAMESPACE = "openrouter_job_calls"
+# 429s with a reset further out than this are treated as daily exhaustion
+RATE_LIMIT_COOLDOWN_MAX = float(os.getenv("OPENROUTER_RATE_LIMIT_COOLDOWN_MAX", "900"))
+RATE_LIMIT_DEFAULT_COOLDOWN = float(os.getenv("OPENROUTER_RATE_LIMIT_DEFAULT_COOLDOWN", "60"))
+# point at bench/stub_llm_server.py for load tests
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+# seconds per HTTP attempt; less when the job's deadline is closer
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "60"))
+
 logger = logging.getLogger(__name__)
 
 
+def _usage_key(day, key_name):
+    return f"{day}:{key_name}"
+
+
 class OpenRouterClient:
     def __init__(self):
         
@@ -35,70 +57,160 @@ class OpenRouterClient:
         ]
         self.daily_limit = int(os.getenv("OPENROUTER_DAILY_CALL_LIMIT", "6"))
         logger.error("Daily call limit set to %s", self.daily_limit)
-        self._ensure_usage_file()
-
-    def _ensure_usage_file(self):
-        logger.error("Ensuring usage file exists at %s", USAGE_FILE)
-        USAGE_FILE.parent.mkdir(parents=True, exist_ok=True)
-        if not USAGE_FILE.exists():
-            with USAGE_FILE.open("w") as f:
-                json.dump({}, f)
-            logger.info("Created new usage file: %s", USAGE_FILE)
-
-    def _load_usage(self):
-        logger.error("Loading usage from %s", USAGE_FILE)
-        with USAGE_FILE.open() as f:
-            data = json.load(f)
-        logger.error("Loaded usage keys: %s", list(data.keys()))
-        return data
-
-    def _save_usage(self, usage):
-        logger.error("Saving usage to %s", USAGE_FILE)
-        with USAGE_FILE.open("w") as f:
-            json.dump(usage, f, indent=2)
-        logger.info("Usage saved")
-
-    def _get_today_usage(self):
-        usage = self._load_usage()
-        today_utc = datetime.now(timezone.utc).date().isoformat()
-        logger.error("Today's UTC date: %s", today_utc)
-        if today_utc not in usage:
-            usage[today_utc] = {}
-            logger.error("Initialized usage for date %s", today_utc)
-        return usage, today_utc
-
-    def _pick_key(self):
-        usage, today = self._get_today_usage()
+        self.store = get_state_store()
+        self.scheduler = get_scheduler()
+        self.history = get_history_store()
+        self.breaker = get_breaker("openrouter")
+        # models that answered 400 to a json_schema response_format
+        self.schema_unsupported = set()
+        self._migrate_usage_file()
+
+    def _migrate_usage_file(self):
+        # usage.json predates the shared state store; import it once so
+        # counters survive the upgrade.
+        if not USAGE_FILE.exists() or self.store.get(USAGE_NAMESPACE, "_migrated"):
+            return
+        try:
+            with USAGE_FILE.open() as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            data = {}
+        for day, counts in data.items():
+            for key_name, used in (counts or {}).items():
+                self.store.set(USAGE_NAMESPACE, _usage_key(day, key_name), int(used))
+        self.store.set(USAGE_NAMESPACE, "_migrated", True)
+        logger.info("Migrated usage from %s", USAGE_FILE)
+
+    def _today(self):
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def get_today_usage(self):
+        today = self._today()
+        return {
+            key_name: self.store.get(USAGE_NAMESPACE, _usage_key(today, key_name), 0)
+            for key_name in self.keys
+            if os.getenv(key_name)
+        }
+
+    def _available_keys(self, today, exclude=()):
+        return [
+            key_name
+            for key_name in self.keys
+            if os.getenv(key_name)
+            and key_name not in exclude
+            and self.store.get(USAGE_NAMESPACE, _usage_key(today, key_name), 0) < self.daily_limit
+        ]
+
+    def _pick_key(self, model, priority=PRIORITY_LONG):
+        """
+        Waits for the scheduler to hand out a key with rate-limit headroom,
+        then reserves one call on it. The reservation is an atomic increment
+        in the shared store, so concurrent workers can never push a key past
+        its daily limit.
+        """
+        today = self._today()
         logger.error("Picking key for date %s", today)
+        lost_race = set()
 
-        for key_name in self.keys:
-            key_value = os.getenv(key_name)
-            if not key_value:
-                logger.error("Env var %s not set, skipping", key_name)
-                continue
+        while True:
+            candidates = self._available_keys(today, lost_race)
+            if not candidates:
+                logger.error("No available OpenRouter keys within daily limits")
+                raise RuntimeError("No available OpenRouter keys within daily limits")
 
-            used = usage[today].get(key_name, 0)
-            logger.error("Key %s used %s times today", key_name, used)
-            if used < self.daily_limit:
-                logger.info("Selected key %s for use (used %s/%s)", key_name, used, self.daily_limit)
-                return key_name, key_value, usage, today
+            try:
+                key_name = self.scheduler.acquire(
+                    candidates, model, priority, current_job_id.get(), timeout=call_timeout(SCHEDULER_TIMEOUT)
+                )
+            except TimeoutError:
+                check_deadline()
+                raise
+            if self.store.incr_if_below(USAGE_NAMESPACE, _usage_key(today, key_name), self.daily_limit):
+                logger.info("Reserved call on key %s", key_name)
+                return key_name, os.getenv(key_name), today
+            # another worker took the last call on this key
+            lost_race.add(key_name)
+
+    def _give_back(self, today, key_name):
+        """Returns a reserved call that never reached OpenRouter."""
+        self.store.incr(USAGE_NAMESPACE, _usage_key(today, key_name), -1)
+        self._count_job_call(-1)
+
+    def _count_job_call(self, amount=1):
+        budget_id = current_budget_id.get()
+        if budget_id != "-":
+            self.store.incr(JOB_CALLS_NAMESPACE, budget_id, amount)
 
-        logger.error("No available OpenRouter keys within daily limits")
-        raise RuntimeError("No available OpenRouter keys within daily limits")
+    def _record_call(self, model, key_name, status, started, usage=None):
+        usage = usage or {}
+        self.history.record_call(
+            job_id=current_job_id.get(),
+            stage=current_llm_stage.get(),
+            backend="openrouter",
+            model=model,
+            key_name=key_name,
+            status=status,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
+
+    def _mark_exhausted(self, today, key_name):
+        self.store.set(USAGE_NAMESPACE, _usage_key(today, key_name), self.daily_limit)
+
+    def _rate_limit_cooldown(self, resp):
+        """
+        Seconds to rest a key after a 429, or None when the 429 means the
+        daily quota is gone. Per-minute limits only pause the key.
+        """
+        if "per-day" in resp.text or "per day" in resp.text.lower():
+            return None
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), RATE_LIMIT_COOLDOWN_MAX)
+            except ValueError:
+                pass
+        reset_ms = resp.headers.get("X-RateLimit-Reset")
+        if reset_ms:
+            try:
+                seconds = float(reset_ms) / 1000.0 - datetime.now(timezone.utc).timestamp()
+                if seconds > RATE_LIMIT_COOLDOWN_MAX:
+                    return None
+                return max(seconds, 1.0)
+            except ValueError:
+                pass
+        return RATE_LIMIT_DEFAULT_COOLDOWN
 
-    def _record_call(self, usage, today, key_name):
-        used = usage[today].get(key_name, 0)
-        usage[today][key_name] = used + 1
-        logger.error("Recording call for key %s: %s -> %s", key_name, used, usage[today][key_name])
-        self._save_usage(usage)
+    def chat(self, model, messages, temperature=0.2, max_tokens=1024, priority=PRIORITY_LONG, schema=None, schema_name="response"):
+        """
+        With a JSON schema the answer is constrained via response_format.
+        Models that reject it get the same request without a schema, and
+        are remembered so the schema is not sent to them again.
 
-    def chat(self, model, messages, temperature=0.2, max_tokens=1024):
+        Each attempt gets at most the job's remaining time (see
+        resilience.job_deadline). While OpenRouter keeps failing, the
+        circuit breaker stops calls before they burn keys.
+        """
         last_error = None
         last_request_exception = None
         logger.info("Starting chat request: model=%s, temperature=%s, max_tokens=%s", model, temperature, max_tokens)
 
         for attempt in range(len(self.keys)):
-            key_name, api_key, usage, today = self._pick_key()
+            check_deadline()
+            self.breaker.allow()
+            try:
+                key_name, api_key, today = self._pick_key(model, priority)
+            except BaseException:
+                self.breaker.release()
+                raise
+            self._count_job_call()
+            try:
+                timeout = call_timeout(OPENROUTER_TIMEOUT)
+            except DeadlineExceeded:
+                self.breaker.release()
+                self._give_back(today, key_name)
+                raise
             logger.error("Attempt %s: using key %s", attempt + 1, key_name)
 
             headers = {
@@ -114,38 +226,75 @@ class OpenRouterClient:
                 "temperature": temperature,
                 "max_tokens": max_tokens,
             }
+            if schema is not None and model not in self.schema_unsupported:
+                payload["response_format"] = {
+                    "type": "json_schema",
+                    "json_schema": {"name": schema_name, "strict": True, "schema": schema},
+                }
 
+            started = time.perf_counter()
             try:
                 resp = requests.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
+                    OPENROUTER_API_URL,
                     headers=headers,
                     json=payload,
-                    timeout=60,
+                    timeout=timeout,
                 )
             except requests.RequestException as exc:
+                self._record_call(model, key_name, "error", started)
+                if isinstance(exc, requests.Timeout) and timeout < OPENROUTER_TIMEOUT:
+                    # cut short by the job's deadline, which says nothing about the key or OpenRouter
+                    self.breaker.release()
+                    raise DeadlineExceeded("Job deadline exceeded during an OpenRouter call") from exc
+                self.breaker.failure()
                 logger.exception("RequestException when calling OpenRouter: %s", exc)
                 last_error = str(exc)
                 last_request_exception = exc
                 # mark this key as exhausted for today
-                usage[today][key_name] = self.daily_limit
-                self._save_usage(usage)
+                self._mark_exhausted(today, key_name)
                 continue
 
             logger.error("OpenRouter response status: %s", resp.status_code)
+            # any answer below 500 shows OpenRouter is up, even a rate limit
+            if resp.status_code >= 500:
+                self.breaker.failure()
+            else:
+                self.breaker.success()
 
             if resp.status_code == 200:
-                self._record_call(usage, today, key_name)
                 data = resp.json()
+                self._record_call(model, key_name, "ok", started, data.get("usage"))
                 logger.info("Chat request succeeded with key %s", key_name)
                 return data["choices"][0]["message"]["content"]
 
+            self._record_call(model, key_name, f"http_{resp.status_code}", started)
+
+            if resp.status_code == 400 and "response_format" in payload:
+                logger.warning("Model %s does not support structured outputs; retrying without a schema", model)
+                self.schema_unsupported.add(model)
+                # rejected before generation; give the call back
+                self._give_back(today, key_name)
+                continue
+
+            if resp.status_code == 429:
+                cooldown = self._rate_limit_cooldown(resp)
+                if cooldown is not None:
+                    last_error = f"{resp.status_code} {resp.text}"
+                    logger.warning("OpenRouter rate-limited key %s; resting it for %.0fs", key_name, cooldown)
+                    # the call was rejected, so it does not count against the daily limit
+                    self._give_back(today, key_name)
+                    self.scheduler.penalize_key(key_name, cooldown)
+                    continue
+
             if resp.status_code in (401, 402, 429, 500, 503):
                 last_error = f"{resp.status_code} {resp.text}"
                 logger.warning("OpenRouter returned %s. Marking key %s as exhausted for today.", resp.status_code, key_name)
-                usage[today][key_name] = self.daily_limit
-                self._save_usage(usage)
+                self._mark_exhausted(today, key_name)
                 continue
 
+            if 400 <= resp.status_code < 500:
+                # a rejected request (bad model, bad payload) is not charged; do not count it either
+                self._give_back(today, key_name)
             resp.raise_for_status()
 
         logger.error("All keys failed. Last error: %s", last_error)
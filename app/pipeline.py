@@ -1,12 +1,56 @@
+import hashlib
 import json
+import logging
+import os
+from dataclasses import dataclass
+from functools import partial
 from typing import Any, Dict, List, Optional, Tuple
 
 from .agents import (
-    analyze_jd,
+    JUDGE_TEMPERATURE,
+    JUDGE_UNPARSED_SUMMARY,
+    REWRITE_TEMPERATURE,
+    SELECT_TEMPERATURE,
     judge_resume,
     rewrite_resume,
     select_projects,
 )
+from .analysis_cache import get_or_analyze
+from .diff_utils import make_side_by_side_diff_html
+from .executors import get_executors, run_cpu
+from .file_utils import render_resume_docx_bytes
+from .history_store import get_history_store
+from .judge_cache import JUDGE_CACHE_ENABLED, JUDGE_NEAR_DUPLICATES, get_judge_cache
+from .llm_scheduler import get_scheduler
+from .project_index import shortlist_projects
+from .records import IterationResult
+from .resilience import JOB_DEADLINE_SECONDS, LLMUnavailable, job_deadline
+from .resume_model import RESUME_SCOPED_REWRITE, keyword_gaps, keyword_hint, parse_resume
+from .request_context import current_job_id
+from .task_graph import TaskGraph, TaskNode
+
+logger = logging.getLogger(__name__)
+
+# judge results remembered per job, keyed by resume+projects hash
+JUDGE_RESULTS_KEPT = 8
+# a candidate scoring at least this, with the right projects, ends the loop
+PIPELINE_ACCEPT_SCORE = float(os.getenv("PIPELINE_ACCEPT_SCORE", "8"))
+# rewrite/judge rounds for /generate (and batches) and for /regenerate
+PIPELINE_MAX_LOOPS = int(os.getenv("PIPELINE_MAX_LOOPS", "5"))
+PIPELINE_REGENERATE_LOOPS = int(os.getenv("PIPELINE_REGENERATE_LOOPS", "3"))
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    """
+    Loop settings that trade LLM calls for quality. Defaults come from the
+    environment; bench/evaluate.py sweeps them against a corpus.
+    """
+
+    accept_score: float = PIPELINE_ACCEPT_SCORE
+    select_temperature: float = SELECT_TEMPERATURE
+    rewrite_temperature: float = REWRITE_TEMPERATURE
+    judge_temperature: float = JUDGE_TEMPERATURE
 
 
 def _project_lookup(projects: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
@@ -53,98 +97,482 @@ def _pad_projects(
     return padded, [p.get("id") for p in padded if p.get("id")]
 
 
-def run_pipeline_and_get_text(
+def prepare_pipeline_state(
     jd_text: str,
-    base_resume: str,
     project_count: int,
     projects: List[Dict[str, Any]],
     previous_state: Optional[Dict[str, Any]] = None,
-    max_loops: int = 5,
-) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
-    lookup = _project_lookup(projects)
-    jd_analysis = (previous_state or {}).get("jd_analysis")
-    if not jd_analysis:
-        jd_analysis = analyze_jd(jd_text)
+    graph: Optional[TaskGraph] = None,
+    config: Optional[PipelineConfig] = None,
+) -> Dict[str, Any]:
+    """
+    JD analysis and project selection, reusing whatever previous_state
+    already holds. Shared by single jobs and batches (which run it once for
+    many resumes).
 
-    selected_project_ids = (previous_state or {}).get("selected_project_ids") or []
-    selected_projects = _filter_projects(lookup, selected_project_ids, project_count)
+    The first project shortlist comes from the raw JD, so it runs alongside
+    the analysis; only the LLM selector waits for both.
+    """
+    own_graph = graph is None
+    config = config or PipelineConfig()
+    graph = graph or TaskGraph("prepare", stage_slot=get_executors().stage_slot)
+    try:
+        lookup = _project_lookup(projects)
+        jd_analysis = (previous_state or {}).get("jd_analysis")
+        analysis_node = None
+        if not jd_analysis:
+            # usually already cached by the UI's /analyze prefetch
+            analysis_node = graph.submit("analyze", partial(get_or_analyze, jd_text))
 
-    if not selected_projects:
-        selection_result = select_projects(jd_analysis, project_count, projects)
-        selected_project_ids = selection_result.get("selected_project_ids", [])
+        # vector shortlist (best first) so the selector prompt stays small; the
+        # full inventory when the project index is disabled
+        shortlist_node = graph.submit("shortlist", partial(shortlist_projects, jd_text, projects, project_count))
+
+        selected_project_ids = (previous_state or {}).get("selected_project_ids") or []
         selected_projects = _filter_projects(lookup, selected_project_ids, project_count)
+        stage_nodes = [node for node in (analysis_node, shortlist_node) if node is not None]
+
+        if not selected_projects:
+            select_deps = [node for node in (analysis_node, shortlist_node) if node is not None]
+            select_node = graph.submit(
+                "select",
+                partial(_select_with, jd_analysis, project_count, config.select_temperature),
+                *select_deps,
+            )
+            stage_nodes.append(select_node)
+            selection_result = select_node.result()
+            selected_project_ids = selection_result.get("selected_project_ids", [])
+            selected_projects = _filter_projects(lookup, selected_project_ids, project_count)
+
+        if analysis_node is not None:
+            jd_analysis = analysis_node.result()
+        candidates = shortlist_node.result()
+        # the stage that finished last gates the rewrite loop
+        ready_node = max(stage_nodes, key=lambda node: node.end or 0)
 
-    if not selected_projects:
-        selected_projects, selected_project_ids = _ensure_projects_available(projects, project_count)
+        if not selected_projects:
+            selected_projects, selected_project_ids = _ensure_projects_available(candidates, project_count)
+        else:
+            selected_projects, selected_project_ids = _pad_projects(selected_projects, candidates, project_count)
+    finally:
+        if own_graph:
+            graph.shutdown()
+
+    return {
+        "jd_analysis": jd_analysis,
+        "candidates": candidates,
+        "selected_project_ids": selected_project_ids,
+        "selected_projects": selected_projects,
+        "ready_node": ready_node,
+    }
+
+
+def _select_with(
+    known_analysis: Optional[str],
+    project_count: int,
+    temperature: float,
+    *results: Any,
+) -> Dict[str, Any]:
+    # deps are (analysis, shortlist) or just (shortlist) when the analysis is known
+    if known_analysis:
+        jd_analysis, candidates = known_analysis, results[0]
     else:
-        selected_projects, selected_project_ids = _pad_projects(selected_projects, projects, project_count)
+        jd_analysis, candidates = results
+    return select_projects(jd_analysis, project_count, candidates, temperature=temperature)
 
-    current_resume = base_resume
-    last_judgement: Optional[Dict[str, Any]] = None
-    feedback_notes = ""
 
-    for _ in range(max_loops):
+def _score_value(judgement: Optional[Dict[str, Any]]) -> float:
+    try:
+        return float((judgement or {}).get("score", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _resume_hash(resume_text: str, project_ids: List[str]) -> str:
+    payload = "\n".join(sorted(pid for pid in project_ids if pid)) + "\n\n" + str(resume_text)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _merge_improvements(existing: List[str], new: List[Any]) -> List[str]:
+    """Appends new improvements, skipping ones already listed (case/space-insensitive)."""
+    merged = list(existing)
+    seen = {" ".join(str(item).lower().split()) for item in merged}
+    for item in new or []:
+        text = item if isinstance(item, str) else json.dumps(item)
+        key = " ".join(text.lower().split())
+        if key and key not in seen:
+            seen.add(key)
+            merged.append(text)
+    return merged
+
+
+def _warm_start(
+    previous_state: Optional[Dict[str, Any]],
+    selected_project_ids: List[str],
+) -> Dict[str, Any]:
+    """
+    Best-so-far state from an earlier run, if it was produced for the same
+    project selection. Otherwise regenerate starts from the base resume.
+    """
+    previous_state = previous_state or {}
+    best_resume = previous_state.get("best_resume")
+    if not best_resume or previous_state.get("best_project_ids") != selected_project_ids:
+        return {}
+    return {
+        "best_resume": best_resume,
+        "best_score": previous_state.get("best_score", 0),
+        "best_judgement": previous_state.get("best_judgement"),
+        "outstanding_improvements": list(previous_state.get("outstanding_improvements") or []),
+    }
+
+
+def _rewrite_stage(
+    jd_analysis: str,
+    current_resume: str,
+    selected_projects: List[Dict[str, Any]],
+    project_count: int,
+    feedback_items: List[str],
+    *_previous: Any,
+    temperature: float = REWRITE_TEMPERATURE,
+) -> Dict[str, Any]:
+    # _previous: result of the prior judge/select node, only there to order the graph
+    feedback_notes = "\n".join(f"- {imp}" for imp in feedback_items)
+    if not RESUME_SCOPED_REWRITE:
         improved = rewrite_resume(
             jd_analysis=jd_analysis,
             base_resume=current_resume,
             selected_projects=selected_projects,
             project_count=project_count,
             feedback_notes=feedback_notes,
+            temperature=temperature,
         )
+        logger.debug("improved--pipeline.py: %s", improved)
+        return improved
+
+    # send only the sections worth rewriting, plus the JD terms still missing
+    resume = parse_resume(current_resume)
+    scoped = resume.has_fixed_sections()
+    improved = rewrite_resume(
+        jd_analysis=jd_analysis,
+        base_resume=resume.editable_text() if scoped else current_resume,
+        selected_projects=selected_projects,
+        project_count=project_count,
+        feedback_notes=feedback_notes,
+        keyword_hints=keyword_hint(keyword_gaps(resume, jd_analysis)),
+        temperature=temperature,
+    )
+    if scoped:
+        improved["upgradedResume"] = resume.reassemble(improved["upgradedResume"])
+    logger.debug("improved--pipeline.py: %s", improved)
+    return improved
 
-        print("improved--pipeline.py:    ", improved)
 
-        judgement = judge_resume(
+def _judge_shared(
+    jd_text: str,
+    selected_projects: List[Dict[str, Any]],
+    selected_project_ids: List[str],
+    project_count: int,
+    improved: Dict[str, Any],
+    temperature: float,
+) -> Dict[str, Any]:
+    """
+    Judges through the cross-job cache: a resume judged before (by any job)
+    is not judged again, and one that is a near-duplicate of an earlier
+    resume carries a `near_duplicate` note with that resume's score.
+    """
+    candidate = improved["upgradedResume"]
+    cache = get_judge_cache() if JUDGE_CACHE_ENABLED else None
+    found = cache.lookup(jd_text, selected_project_ids, candidate, temperature) if cache else None
+    if found is not None and found.judgement is not None:
+        return found.judgement
+    near = found.near if found is not None and JUDGE_NEAR_DUPLICATES != "off" else None
+    if near is not None and JUDGE_NEAR_DUPLICATES == "reuse":
+        judgement = dict(near["judgement"])
+    else:
+        reply = judge_resume(
             jd_text=jd_text,
-            new_resume=improved["upgradedResume"],
+            new_resume=candidate,
             selected_projects=selected_projects,
             project_count=project_count,
-            previous_agent_output=json.dumps(improved)
+            previous_agent_output=json.dumps(improved),
+            temperature=temperature,
         )
+        judgement = reply or {"score": 0, "summary": "Judge failed", "improvements": [], "project_selection_issue": False}
+        # a failed call or an unparseable reply says nothing about the resume
+        if cache is not None and reply is not None and reply.get("summary") != JUDGE_UNPARSED_SUMMARY:
+            cache.remember(found, judgement)
+    if near is not None:
+        judgement["near_duplicate"] = {"score": near["score"], "distance": near["distance"]}
+    return judgement
 
-        print("Judgement--pipeline.py:    ",judgement)
+
+def _judge_stage(
+    jd_text: str,
+    selected_projects: List[Dict[str, Any]],
+    selected_project_ids: List[str],
+    project_count: int,
+    judge_results: Dict[str, IterationResult],
+    iteration: int,
+    improved: Dict[str, Any],
+    temperature: float = JUDGE_TEMPERATURE,
+) -> Dict[str, Any]:
+    candidate = improved["upgradedResume"]
+    resume_key = _resume_hash(candidate, selected_project_ids)
+    known = judge_results.get(resume_key)
+    if known is not None:
+        judgement = IterationResult.coerce(known, resume_key).judgement()
+    else:
+        judgement = _judge_shared(
+            jd_text, selected_projects, selected_project_ids, project_count, improved, temperature
+        )
+        judge_results[resume_key] = IterationResult.from_judgement(iteration, resume_key, judgement)
+    logger.debug("Judgement--pipeline.py: %s", judgement)
+    return judgement
+
+
+def _collect_outputs(nodes: Dict[str, TaskNode]) -> Dict[str, Any]:
+    """Results of the speculative docx/diff nodes; missing ones are rebuilt by the caller."""
+    outputs: Dict[str, Any] = {}
+    for key, node in nodes.items():
+        try:
+            outputs[key] = node.result()
+        except Exception:
+            logger.exception("Speculative %s failed", key)
+    return outputs
+
+
+def run_pipeline_and_get_text(
+    jd_text: str,
+    base_resume: str,
+    project_count: int,
+    projects: List[Dict[str, Any]],
+    previous_state: Optional[Dict[str, Any]] = None,
+    max_loops: int = PIPELINE_MAX_LOOPS,
+    speculate_outputs: bool = True,
+    config: Optional[PipelineConfig] = None,
+    deadline_seconds: Optional[float] = JOB_DEADLINE_SECONDS,
+) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    """
+    Rewrite/judge loop. When previous_state carries the best resume of an
+    earlier run (see JobSession.previous_state), the loop resumes from it with its
+    outstanding improvements as feedback instead of starting over, and
+    judge results are reused for resumes that were already judged.
+
+    Stages run on a TaskGraph. With speculate_outputs, the docx and diff of
+    each candidate are built while its judge call is in flight and
+    cancelled if the judge rejects it; they come back in state["outputs"].
+    state["timings"] holds per-stage timings and the job's critical path.
+    config (PipelineConfig) sets the accept score and stage temperatures.
+
+    Every LLM call gets only what is left of deadline_seconds. When time
+    runs out or a backend's circuit is open, the best candidate so far is
+    returned; with no candidate yet, DeadlineExceeded or CircuitOpenError
+    propagates.
+    """
+    try:
+        with job_deadline(deadline_seconds), TaskGraph("pipeline", stage_slot=get_executors().stage_slot) as graph:
+            resume_text, judgement, state = _run_loop(
+                graph, jd_text, base_resume, project_count, projects, previous_state, max_loops, speculate_outputs,
+                config or PipelineConfig(),
+            )
+            state["timings"] = graph.report()
+    finally:
+        get_scheduler().finish_job(current_job_id.get())
+    logger.info(
+        "Pipeline critical path %.2fs: %s",
+        state["timings"]["critical_path_seconds"],
+        " -> ".join(state["timings"]["critical_path"]),
+    )
+    return resume_text, judgement, state
+
+
+def _run_loop(
+    graph: TaskGraph,
+    jd_text: str,
+    base_resume: str,
+    project_count: int,
+    projects: List[Dict[str, Any]],
+    previous_state: Optional[Dict[str, Any]],
+    max_loops: int,
+    speculate_outputs: bool,
+    config: PipelineConfig,
+) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    lookup = _project_lookup(projects)
+    prepared = prepare_pipeline_state(jd_text, project_count, projects, previous_state, graph=graph, config=config)
+    jd_analysis = prepared["jd_analysis"]
+    candidates = prepared["candidates"]
+    selected_projects = prepared["selected_projects"]
+    selected_project_ids = prepared["selected_project_ids"]
+
+    judge_results: Dict[str, IterationResult] = dict((previous_state or {}).get("judge_results") or {})
+    warm = _warm_start(previous_state, selected_project_ids)
+    best_resume: Optional[str] = warm.get("best_resume")
+    best_judgement: Optional[Dict[str, Any]] = warm.get("best_judgement")
+    best_score = _score_value(best_judgement) if best_judgement else -1.0
+    best_project_ids = list(selected_project_ids) if best_resume else []
+    best_outputs: Dict[str, TaskNode] = {}
+    outstanding: List[str] = warm.get("outstanding_improvements", [])
+
+    current_resume = best_resume or base_resume
+    feedback_items: List[str] = list(outstanding)
+    last_judgement: Optional[Dict[str, Any]] = None
+    previous_node: TaskNode = prepared["ready_node"]
+    loops_run = 0
+    stopped_early = False
+
+    def _state(outputs: Optional[Dict[str, TaskNode]] = None) -> Dict[str, Any]:
+        # keep only the most recent judge results so sessions stay small
+        recent = dict(list(judge_results.items())[-JUDGE_RESULTS_KEPT:])
+        return {
+            "jd_analysis": jd_analysis,
+            "selected_project_ids": [p.get("id") for p in selected_projects if p.get("id")],
+            "selected_projects": selected_projects,
+            "best_resume": best_resume,
+            "best_score": best_score if best_resume else None,
+            "best_judgement": best_judgement,
+            "best_project_ids": best_project_ids,
+            "outstanding_improvements": outstanding,
+            "judge_results": recent,
+            "outputs": _collect_outputs(outputs or {}),
+            "loops": loops_run,
+        }
+
+    for iteration in range(1, max_loops + 1):
+        loops_run = iteration
+        rewrite_node = graph.submit(
+            f"rewrite#{iteration}",
+            partial(
+                _rewrite_stage, jd_analysis, current_resume, list(selected_projects), project_count, list(feedback_items),
+                temperature=config.rewrite_temperature,
+            ),
+            previous_node,
+        )
+        judge_node = graph.submit(
+            f"judge#{iteration}",
+            partial(
+                _judge_stage,
+                jd_text,
+                list(selected_projects),
+                list(selected_project_ids),
+                project_count,
+                judge_results,
+                iteration,
+                temperature=config.judge_temperature,
+            ),
+            rewrite_node,
+        )
+        speculative: Dict[str, TaskNode] = {}
+        if speculate_outputs:
+            speculative["docx_bytes"] = graph.submit(
+                f"docx#{iteration}",
+                lambda improved: run_cpu(render_resume_docx_bytes, improved["upgradedResume"]),
+                rewrite_node,
+                speculative=True,
+            )
+            speculative["diff_html"] = graph.submit(
+                f"diff#{iteration}",
+                partial(_diff_against, base_resume),
+                rewrite_node,
+                speculative=True,
+            )
+
+        try:
+            improved = rewrite_node.result()
+            judgement = judge_node.result()
+        except LLMUnavailable as exc:
+            if best_resume is None:
+                raise
+            logger.warning("Stopping after %s rounds with the best candidate so far: %s", iteration - 1, exc)
+            loops_run = iteration - 1
+            stopped_early = True
+            for node in speculative.values():
+                graph.cancel(node)
+            break
+        previous_node = judge_node
+
+        candidate = improved["upgradedResume"]
         last_judgement = judgement
-        score = judgement.get("score", 0)
+        score = _score_value(judgement)
         project_issue = judgement.get("project_selection_issue", False)
+        improvements = judgement.get("improvements", []) or []
+        get_history_store().record_iteration(current_job_id.get(), iteration, score, project_issue)
 
-        if score >= 8 and not project_issue:
-            state = {
-                "jd_analysis": jd_analysis,
-                "selected_project_ids": [p.get("id") for p in selected_projects if p.get("id")],
-                "selected_projects": selected_projects,
-            }
-            return improved["upgradedResume"], judgement, state
+        if score >= config.accept_score and not project_issue:
+            best_resume, best_judgement, best_score = candidate, judgement, score
+            best_project_ids = list(selected_project_ids)
+            outstanding = _merge_improvements([], improvements)
+            for node in best_outputs.values():
+                graph.cancel(node)
+            return candidate, judgement, _state(speculative)
 
-        improvements = judgement.get("improvements", []) or []
+        if not project_issue and score > best_score:
+            best_resume, best_judgement, best_score = candidate, judgement, score
+            best_project_ids = list(selected_project_ids)
+            # improvements of the best candidate are what is still open
+            outstanding = _merge_improvements([], improvements)
+            # keep its docx/diff in case the loop ends on a worse candidate
+            for node in best_outputs.values():
+                graph.cancel(node)
+            best_outputs = speculative
+        else:
+            # rejected: drop the speculative work for this candidate
+            for node in speculative.values():
+                graph.cancel(node)
 
         if project_issue:
             selection_feedback = judgement.get("summary", "")
             if improvements:
                 selection_feedback += "\n" + "\n" + json.dumps(improvements)
-            selection_result = select_projects(jd_analysis, project_count, projects, feedback=selection_feedback)
+            previous_node = graph.submit(
+                f"select#{iteration}",
+                partial(
+                    _reselect_stage, jd_analysis, project_count, candidates, selection_feedback,
+                    config.select_temperature,
+                ),
+                judge_node,
+            )
+            try:
+                selection_result = previous_node.result()
+            except LLMUnavailable as exc:
+                if best_resume is None:
+                    raise
+                logger.warning("Stopping at reselection after %s rounds with the best candidate: %s", iteration, exc)
+                stopped_early = True
+                break
             selected_project_ids = selection_result.get("selected_project_ids", [])
             selected_projects = _filter_projects(lookup, selected_project_ids, project_count)
             if not selected_projects:
-                selected_projects, selected_project_ids = _ensure_projects_available(projects, project_count)
+                selected_projects, selected_project_ids = _ensure_projects_available(candidates, project_count)
             else:
-                selected_projects, selected_project_ids = _pad_projects(selected_projects, projects, project_count)
+                selected_projects, selected_project_ids = _pad_projects(selected_projects, candidates, project_count)
             current_resume = base_resume
-            feedback_notes = ""
+            feedback_items = []
             continue
 
-        if improvements:
-            formatted = "\n".join(f"- {imp}" for imp in improvements)
-            feedback_notes = (feedback_notes + "\n" + formatted).strip()
-        current_resume = improved["upgradedResume"]
+        feedback_items = _merge_improvements(feedback_items, improvements)
+        current_resume = candidate
 
-    fallback_state = {
-        "jd_analysis": jd_analysis,
-        "selected_project_ids": [p.get("id") for p in selected_projects if p.get("id")],
-        "selected_projects": selected_projects,
-    }
+    if best_resume is not None and (stopped_early or best_project_ids == selected_project_ids):
+        # the loop ran out (or out of time); hand back the best candidate rather than the last one
+        return best_resume, best_judgement, _state(best_outputs)
     return (
         current_resume,
         last_judgement
         or {"score": 0, "summary": "No judgement", "improvements": [], "project_selection_issue": False},
-        fallback_state,
+        _state(),
     )
+
+
+def _reselect_stage(
+    jd_analysis: str,
+    project_count: int,
+    candidates: List[Dict[str, Any]],
+    feedback: str,
+    temperature: float,
+    _judgement: Dict[str, Any],
+) -> Dict[str, Any]:
+    return select_projects(jd_analysis, project_count, candidates, feedback=feedback, temperature=temperature)
+
+
+def _diff_against(base_resume: str, improved: Dict[str, Any]) -> str:
+    return run_cpu(make_side_by_side_diff_html, base_resume, improved["upgradedResume"])
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # the index is optional; callers fall back to the full inventory
+    np = None
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+INDEX_DIR = Path(os.getenv("PROJECT_INDEX_DIR", str(BASE_DIR / "data" / "project_index")))
+VECTORS_PATH = INDEX_DIR / "vectors.f32"
+META_PATH = INDEX_DIR / "meta.json"
+
+PROJECT_INDEX_ENABLED = os.getenv("PROJECT_INDEX_ENABLED", "0").lower() in ("1", "true", "yes")
+INDEX_DIM = int(os.getenv("PROJECT_INDEX_DIM", "2048"))
+SHORTLIST_FACTOR = int(os.getenv("PROJECT_INDEX_SHORTLIST_FACTOR", "3"))
+SHORTLIST_MIN = int(os.getenv("PROJECT_INDEX_SHORTLIST_MIN", "8"))
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.\-]*[a-z0-9+#]|[a-z0-9]")
+
+logger = logging.getLogger(__name__)
+
+
+def is_available() -> bool:
+    return PROJECT_INDEX_ENABLED and np is not None
+
+
+def _tokens(text: str) -> List[str]:
+    words = TOKEN_RE.findall((text or "").lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _project_hash(project: Dict[str, Any]) -> str:
+    payload = json.dumps(project, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _project_chunks(project: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(kind, text) pieces embedded separately so one strong bullet can match."""
+    chunks = [("intro", f"{project.get('name', '')}. {project.get('intro', '')}")]
+    for bullet in project.get("bullets", []):
+        chunks.append(("bullet", bullet))
+    tags = project.get("tech_tags", []) + project.get("domain_tags", [])
+    if tags:
+        chunks.append(("tags", " ".join(tags)))
+    return [(kind, text) for kind, text in chunks if text and text.strip()]
+
+
+def hashed_tf_vector(text: str, dim: int = INDEX_DIM):
+    """Signed feature hashing of unigrams+bigrams with sublinear tf."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token, count in Counter(_tokens(text)).items():
+        h = zlib.crc32(token.encode("utf-8"))
+        sign = 1.0 if h & 0x80000000 else -1.0
+        vector[h % dim] += sign * (1.0 + math.log(count))
+    return vector
+
+
+class ProjectIndex:
+    """
+    Vector index over project chunks.
+
+    Raw tf vectors live in a float32 memory-mapped matrix on disk with one row
+    per chunk; meta.json records which project (and content hash) each row
+    belongs to. When projects.json changes only new or edited projects are
+    re-vectorized. IDF weights are derived from the matrix at load time, so
+    they stay correct after incremental updates.
+    """
+
+    def __init__(self, index_dir: Path = INDEX_DIR, dim: int = INDEX_DIM):
+        self.index_dir = Path(index_dir)
+        self.vectors_path = self.index_dir / VECTORS_PATH.name
+        self.meta_path = self.index_dir / META_PATH.name
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[str] = None
+        self._row_projects: List[str] = []
+        self._weighted = None
+        self._idf = None
+
+    def _load_meta(self) -> Dict[str, Any]:
+        try:
+            meta = json.loads(self.meta_path.read_text())
+        except (OSError, json.JSONDecodeError):
+            return {}
+        return meta if meta.get("dim") == self.dim else {}
+
+    def _load_matrix(self, rows: int):
+        if rows == 0 or not self.vectors_path.exists():
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def _rebuild(self, projects: List[Dict[str, Any]], fingerprint: str) -> None:
+        meta = self._load_meta()
+        old_rows = meta.get("rows", [])
+        old_matrix = self._load_matrix(len(old_rows))
+        old_by_project: Dict[str, List[int]] = {}
+        for idx, row in enumerate(old_rows):
+            old_by_project.setdefault(f"{row['project_id']}:{row['project_hash']}", []).append(idx)
+
+        rows: List[Dict[str, str]] = []
+        vectors = []
+        reused = 0
+        for project in projects:
+            pid = project.get("id")
+            if not pid:
+                continue
+            phash = _project_hash(project)
+            previous = old_by_project.get(f"{pid}:{phash}")
+            if previous:
+                vectors.extend(np.array(old_matrix[i]) for i in previous)
+                rows.extend(old_rows[i] for i in previous)
+                reused += 1
+                continue
+            for kind, text in _project_chunks(project):
+                vectors.append(hashed_tf_vector(text, self.dim))
+                rows.append({"project_id": pid, "project_hash": phash, "kind": kind})
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        if vectors:
+            tmp_path = self.vectors_path.with_suffix(f".{os.getpid()}.tmp")
+            matrix = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(len(vectors), self.dim))
+            matrix[:] = np.vstack(vectors)
+            matrix.flush()
+            del matrix
+            os.replace(tmp_path, self.vectors_path)
+        tmp_meta = self.meta_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_meta.write_text(json.dumps({"dim": self.dim, "fingerprint": fingerprint, "rows": rows}))
+        os.replace(tmp_meta, self.meta_path)
+        logger.info("Project index rebuilt: %s rows, %s projects reused", len(rows), reused)
+
+    def _ensure_loaded(self, projects: List[Dict[str, Any]]) -> None:
+        fingerprint = hashlib.sha1(
+            "".join(_project_hash(p) for p in projects).encode("utf-8")
+        ).hexdigest()
+        if fingerprint == self._fingerprint:
+            return
+        meta = self._load_meta()
+        if meta.get("fingerprint") != fingerprint:
+            self._rebuild(projects, fingerprint)
+            meta = self._load_meta()
+
+        rows = meta.get("rows", [])
+        matrix = np.asarray(self._load_matrix(len(rows)))
+        doc_freq = np.count_nonzero(matrix, axis=0).astype(np.float32)
+        idf = np.log((1.0 + len(rows)) / (1.0 + doc_freq)) + 1.0
+        weighted = matrix * idf
+        norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        self._idf = idf
+        self._weighted = weighted / norms
+        self._row_projects = [row["project_id"] for row in rows]
+        self._fingerprint = fingerprint
+
+    def rank(self, query_text: str, projects: List[Dict[str, Any]]) -> List[Tuple[str, float]]:
+        """All project ids with their best chunk cosine similarity, best first."""
+        with self._lock:
+            self._ensure_loaded(projects)
+            weighted, idf, row_projects = self._weighted, self._idf, self._row_projects
+        if not row_projects:
+            return []
+
+        query = hashed_tf_vector(query_text, self.dim) * idf
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        similarities = weighted @ (query / norm)
+
+        best: Dict[str, float] = {}
+        for pid, score in zip(row_projects, similarities.tolist()):
+            if score > best.get(pid, -1.0):
+                best[pid] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)
+
+
+_index: Optional[ProjectIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_project_index() -> ProjectIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ProjectIndex()
+    return _index
+
+
+def shortlist_projects(
+    query_text: str,
+    projects: List[Dict[str, Any]],
+    project_count: int,
+) -> List[Dict[str, Any]]:
+    """
+    Narrows the inventory to the projects most similar to query_text, best
+    first, before the LLM selector sees it. Returns projects unchanged when
+    the index is disabled, numpy is missing, or the inventory is already small.
+    """
+    top_k = max(project_count * SHORTLIST_FACTOR, SHORTLIST_MIN)
+    if not is_available() or len(projects) <= top_k:
+        return projects
+    try:
+        ranked = get_project_index().rank(query_text, projects)
+    except Exception:
+        logger.exception("Project index lookup failed, using full inventory")
+        return projects
+    if not ranked:
+        return projects
+
+    lookup = {p.get("id"): p for p in projects if p.get("id")}
+    return [lookup[pid] for pid, _ in ranked[:top_k] if pid in lookup]
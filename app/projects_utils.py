@@ -1,13 +1,31 @@
 import json
+import threading
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
+
+from .records import Project
 
 BASE_DIR = Path(__file__).resolve().parent
 PROJECTS_PATH = BASE_DIR / "projects.json"
 
+# (mtime, projects) of the last projects.json read
+_cache: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+_cache_lock = threading.Lock()
+
 
 def load_projects() -> List[Dict[str, Any]]:
-    if not PROJECTS_PATH.exists():
+    """
+    Parsed once per change of projects.json and shared by every job, with
+    interned tags (see Project). Callers must treat the dicts as read-only.
+    """
+    global _cache
+    try:
+        mtime = PROJECTS_PATH.stat().st_mtime
+    except FileNotFoundError:
         return []
-    with PROJECTS_PATH.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    with _cache_lock:
+        if _cache is None or _cache[0] != mtime:
+            with PROJECTS_PATH.open("r", encoding="utf-8") as f:
+                projects = [Project.from_dict(item).to_dict() for item in json.load(f)]
+            _cache = (mtime, projects)
+        return list(_cache[1])
@@ -0,0 +1,329 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .state_store import get_state_store
+
+# sha256 -> text, shared by every session that references the same text
+TEXT_BLOB_NAMESPACE = "text_blobs"
+# texts kept in process so sessions loaded together share one str object
+TEXT_BLOB_CACHE_SIZE = int(os.getenv("TEXT_BLOB_CACHE_SIZE", "256"))
+
+
+def intern_tags(tags: Optional[Iterable[Any]]) -> Tuple[str, ...]:
+    """Tags repeat across projects and jobs; interning keeps one copy of each."""
+    return tuple(sys.intern(str(tag)) for tag in tags or ())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+class TextBlobs:
+    """
+    Content-addressed texts (JDs, base resumes, analyses, best resumes) in
+    the state store. A batch of 50 resumes for one JD, or a job regenerated
+    ten times, stores each text once and sessions only keep its hash.
+    """
+
+    def __init__(self, store=None, cache_size: int = TEXT_BLOB_CACHE_SIZE):
+        self.store = store or get_state_store()
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, digest: str, text: str) -> str:
+        with self._lock:
+            cached = self._cache.get(digest)
+            if cached is not None:
+                self._cache.move_to_end(digest)
+                return cached
+            self._cache[digest] = text
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return text
+
+    def put(self, text: Optional[str]) -> Optional[str]:
+        if text is None:
+            return None
+        digest = text_hash(text)
+        with self._lock:
+            known = digest in self._cache
+        if not known and self.store.get(TEXT_BLOB_NAMESPACE, digest) is None:
+            self.store.set(TEXT_BLOB_NAMESPACE, digest, text)
+        self._remember(digest, text)
+        return digest
+
+    def get(self, digest: Optional[str], default: str = "") -> str:
+        if not digest:
+            return default
+        with self._lock:
+            cached = self._cache.get(digest)
+        if cached is not None:
+            return self._remember(digest, cached)
+        text = self.store.get(TEXT_BLOB_NAMESPACE, digest)
+        return default if text is None else self._remember(digest, text)
+
+
+_blobs: Optional[TextBlobs] = None
+_blobs_lock = threading.Lock()
+
+
+def get_text_blobs() -> TextBlobs:
+    global _blobs
+    if _blobs is None:
+        with _blobs_lock:
+            if _blobs is None:
+                _blobs = TextBlobs()
+    return _blobs
+
+
+@dataclass(frozen=True, slots=True)
+class Project:
+    """One entry of projects.json; unknown keys are kept in `extra`."""
+
+    id: str
+    name: str = ""
+    intro: str = ""
+    bullets: Tuple[str, ...] = ()
+    tech_tags: Tuple[str, ...] = ()
+    domain_tags: Tuple[str, ...] = ()
+    extra: Tuple[Tuple[str, Any], ...] = ()
+
+    _FIELDS = ("id", "name", "intro", "bullets", "tech_tags", "domain_tags")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Project":
+        return cls(
+            id=sys.intern(str(data.get("id") or "")),
+            name=data.get("name") or "",
+            intro=data.get("intro") or "",
+            bullets=tuple(data.get("bullets") or ()),
+            tech_tags=intern_tags(data.get("tech_tags")),
+            domain_tags=intern_tags(data.get("domain_tags")),
+            extra=tuple((key, value) for key, value in data.items() if key not in cls._FIELDS),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The projects.json shape the prompts, index and API work with."""
+        data: Dict[str, Any] = {"id": self.id, "name": self.name, "intro": self.intro}
+        data["bullets"] = list(self.bullets)
+        data["tech_tags"] = list(self.tech_tags)
+        data["domain_tags"] = list(self.domain_tags)
+        data.update(self.extra)
+        return data
+
+
+def _improvement_text(item: Any) -> str:
+    return item if isinstance(item, str) else json.dumps(item)
+
+
+def _score(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass(frozen=True, slots=True)
+class IterationResult:
+    """A judge verdict for one candidate resume (resume_hash covers text and projects)."""
+
+    iteration: int
+    resume_hash: str
+    score: float
+    summary: str = ""
+    improvements: Tuple[str, ...] = ()
+    project_selection_issue: bool = False
+
+    @classmethod
+    def from_judgement(cls, iteration: int, resume_hash: str, judgement: Dict[str, Any]) -> "IterationResult":
+        return cls(
+            iteration=iteration,
+            resume_hash=resume_hash,
+            score=_score(judgement.get("score")),
+            summary=str(judgement.get("summary") or ""),
+            improvements=tuple(_improvement_text(item) for item in judgement.get("improvements") or ()),
+            project_selection_issue=bool(judgement.get("project_selection_issue", False)),
+        )
+
+    @classmethod
+    def coerce(cls, value: Any, resume_hash: str = "") -> "IterationResult":
+        """Accepts a record, its to_dict() form or a raw judgement from an older session."""
+        if isinstance(value, cls):
+            return value
+        if "resume_hash" in value:
+            return cls(
+                iteration=int(value.get("iteration", 0)),
+                resume_hash=value["resume_hash"],
+                score=_score(value.get("score")),
+                summary=value.get("summary", ""),
+                improvements=tuple(value.get("improvements") or ()),
+                project_selection_issue=bool(value.get("project_selection_issue", False)),
+            )
+        return cls.from_judgement(0, resume_hash, value)
+
+    def judgement(self) -> Dict[str, Any]:
+        return {
+            "score": self.score,
+            "summary": self.summary,
+            "improvements": list(self.improvements),
+            "project_selection_issue": self.project_selection_issue,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"iteration": self.iteration, "resume_hash": self.resume_hash, **self.judgement()}
+
+
+@dataclass(slots=True)
+class JobSession:
+    """
+    What /regenerate needs to continue a job. Long texts are stored once in
+    TextBlobs and referenced by hash, so the stored record stays a few
+    hundred bytes no matter how large the JD or resume is.
+    """
+
+    company: str
+    jd_hash: str
+    base_resume_hash: str
+    resume_source: str
+    project_count: int
+    jd_analysis_hash: Optional[str] = None
+    selected_project_ids: Tuple[str, ...] = ()
+    version: int = 1
+    files: List[str] = field(default_factory=list)
+    best_resume_hash: Optional[str] = None
+    best_score: Optional[float] = None
+    best_judgement: Optional[IterationResult] = None
+    best_project_ids: Tuple[str, ...] = ()
+    outstanding_improvements: Tuple[str, ...] = ()
+    judge_results: Tuple[IterationResult, ...] = ()
+
+    @classmethod
+    def create(
+        cls,
+        jd: str,
+        company: str,
+        base_resume: str,
+        resume_source: str,
+        project_count: int,
+        pipeline_state: Dict[str, Any],
+        files: Optional[List[str]] = None,
+        blobs: Optional[TextBlobs] = None,
+    ) -> "JobSession":
+        blobs = blobs or get_text_blobs()
+        session = cls(
+            company=sys.intern(company),
+            jd_hash=blobs.put(jd),
+            base_resume_hash=blobs.put(base_resume),
+            resume_source=sys.intern(resume_source),
+            project_count=project_count,
+            files=list(files or []),
+        )
+        session.record_pipeline(pipeline_state, blobs)
+        return session
+
+    def record_pipeline(self, state: Dict[str, Any], blobs: Optional[TextBlobs] = None) -> None:
+        """Keeps the analysis, selection and warm-start fields of a pipeline run."""
+        blobs = blobs or get_text_blobs()
+        if state.get("jd_analysis"):
+            self.jd_analysis_hash = blobs.put(state["jd_analysis"])
+        self.selected_project_ids = intern_tags(state.get("selected_project_ids"))
+        if state.get("judge_results"):
+            self.judge_results = tuple(
+                IterationResult.coerce(result, key) for key, result in state["judge_results"].items()
+            )
+        if state.get("best_resume") is None:
+            return
+        self.best_resume_hash = blobs.put(state["best_resume"])
+        self.best_score = state.get("best_score")
+        if state.get("best_judgement") is not None:
+            self.best_judgement = IterationResult.coerce(state["best_judgement"], self.best_resume_hash)
+        self.best_project_ids = intern_tags(state.get("best_project_ids"))
+        self.outstanding_improvements = tuple(state.get("outstanding_improvements") or ())
+
+    def texts(self, blobs: Optional[TextBlobs] = None) -> Tuple[str, str]:
+        """(jd, base_resume)"""
+        blobs = blobs or get_text_blobs()
+        return blobs.get(self.jd_hash), blobs.get(self.base_resume_hash)
+
+    def previous_state(self, blobs: Optional[TextBlobs] = None) -> Dict[str, Any]:
+        """The previous_state run_pipeline_and_get_text warm-starts from."""
+        blobs = blobs or get_text_blobs()
+        state: Dict[str, Any] = {
+            "jd_analysis": blobs.get(self.jd_analysis_hash, None),
+            "selected_project_ids": list(self.selected_project_ids),
+        }
+        if self.best_resume_hash:
+            state.update({
+                "best_resume": blobs.get(self.best_resume_hash, None),
+                "best_score": self.best_score,
+                "best_judgement": self.best_judgement.judgement() if self.best_judgement else None,
+                "best_project_ids": list(self.best_project_ids),
+                "outstanding_improvements": list(self.outstanding_improvements),
+            })
+        if self.judge_results:
+            state["judge_results"] = {result.resume_hash: result for result in self.judge_results}
+        return {key: value for key, value in state.items() if value is not None}
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "company": self.company,
+            "jd_hash": self.jd_hash,
+            "base_resume_hash": self.base_resume_hash,
+            "resume_source": self.resume_source,
+            "project_count": self.project_count,
+            "jd_analysis_hash": self.jd_analysis_hash,
+            "selected_project_ids": list(self.selected_project_ids),
+            "version": self.version,
+            "files": self.files,
+            "best_resume_hash": self.best_resume_hash,
+            "best_score": self.best_score,
+            "best_judgement": self.best_judgement.to_dict() if self.best_judgement else None,
+            "best_project_ids": list(self.best_project_ids),
+            "outstanding_improvements": list(self.outstanding_improvements),
+            "judge_results": [result.to_dict() for result in self.judge_results],
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any], blobs: Optional[TextBlobs] = None) -> "JobSession":
+        """Reads to_record() output, or a full-text session written before records existed."""
+        if "jd_hash" not in record:
+            return cls._from_legacy(record, blobs or get_text_blobs())
+        best_judgement = record.get("best_judgement")
+        return cls(
+            company=sys.intern(record["company"]),
+            jd_hash=record["jd_hash"],
+            base_resume_hash=record["base_resume_hash"],
+            resume_source=sys.intern(record.get("resume_source", "redo")),
+            project_count=record.get("project_count", 3),
+            jd_analysis_hash=record.get("jd_analysis_hash"),
+            selected_project_ids=intern_tags(record.get("selected_project_ids")),
+            version=record.get("version", 1),
+            files=list(record.get("files") or []),
+            best_resume_hash=record.get("best_resume_hash"),
+            best_score=record.get("best_score"),
+            best_judgement=IterationResult.coerce(best_judgement) if best_judgement else None,
+            best_project_ids=intern_tags(record.get("best_project_ids")),
+            outstanding_improvements=tuple(record.get("outstanding_improvements") or ()),
+            judge_results=tuple(IterationResult.coerce(result) for result in record.get("judge_results") or ()),
+        )
+
+    @classmethod
+    def _from_legacy(cls, record: Dict[str, Any], blobs: TextBlobs) -> "JobSession":
+        session = cls(
+            company=sys.intern(record["company"]),
+            jd_hash=blobs.put(record["jd"]),
+            base_resume_hash=blobs.put(record["base_resume"]),
+            resume_source=sys.intern(record.get("resume_source", "redo")),
+            project_count=record.get("project_count", 3),
+            version=record.get("version", 1),
+            files=list(record.get("files") or []),
+        )
+        session.record_pipeline(record, blobs)
+        return session
@@ -0,0 +1,27 @@
+import os
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# stages always sent to Ollama, e.g. "judge" or "rewrite,judge"
+LOCAL_LLM_STAGES = {stage.strip() for stage in os.getenv("LOCAL_LLM_STAGES", "").split(",") if stage.strip()}
+
+# job the current LLM call belongs to; used for fair queuing and telemetry
+current_job_id: ContextVar[str] = ContextVar("current_job_id", default="-")
+
+# pipeline stage making the current LLM call; recorded in the history store
+current_llm_stage: ContextVar[str] = ContextVar("current_llm_stage", default="-")
+
+# per-stage backend ("openrouter" or "local") picked by the budget planner
+current_llm_routes: ContextVar[Optional[Dict[str, str]]] = ContextVar("current_llm_routes", default=None)
+
+# budget reservation the current OpenRouter calls are counted against
+current_budget_id: ContextVar[str] = ContextVar("current_budget_id", default="-")
+
+
+def stage_backend(stage: str) -> str:
+    if stage in LOCAL_LLM_STAGES:
+        return "local"
+    return (current_llm_routes.get() or {}).get(stage, "openrouter")
+
+# time.monotonic() by which the current job must finish; None = no deadline
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
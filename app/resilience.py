@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from .request_context import current_deadline
+
+# wall-clock budget of one pipeline run, analysis to last judge; 0 = no deadline
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "600"))
+# consecutive failures (timeouts, connection errors, 5xx) that open a backend's circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# seconds an open circuit fails fast before one probe call is let through
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailable(RuntimeError):
+    """An LLM call was not made (or cut short) because the job or the backend cannot afford it."""
+
+
+class DeadlineExceeded(LLMUnavailable):
+    pass
+
+
+class CircuitOpenError(LLMUnavailable):
+    pass
+
+
+@contextmanager
+def job_deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Gives the block `seconds` to finish; a tighter deadline set by a caller still wins."""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = current_deadline.get()
+    token = current_deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline() -> None:
+    left = remaining_time()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Job deadline exceeded")
+
+
+def call_timeout(limit: Optional[float]) -> Optional[float]:
+    """
+    Timeout for the next call: `limit`, cut to what is left of the job's
+    deadline. Raises DeadlineExceeded when nothing is left.
+    """
+    left = remaining_time()
+    if left is None:
+        return limit
+    if left <= 0:
+        raise DeadlineExceeded("Job deadline exceeded")
+    return left if limit is None else min(limit, left)
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a backend is down instead of letting every job wait
+    out its timeouts:
+
+    - closed: calls go through; failure_threshold failures in a row open it.
+    - open: allow() raises CircuitOpenError for reset_seconds.
+    - half_open: one probe call goes through; success closes the circuit,
+      failure opens it again.
+
+    Callers pair allow() with success(), failure() or release() (the call
+    ended without saying anything about the backend). State is per process.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} is unavailable (probe in flight)")
+                self._probing = True
+
+    def available(self) -> bool:
+        """Whether allow() would let a call through right now, without taking the probe."""
+        with self._lock:
+            if self.state == "open":
+                return time.monotonic() - self.opened_at >= self.reset_seconds
+            return not (self.state == "half_open" and self._probing)
+
+    def success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info("%s circuit closed", self.name)
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                logger.warning("%s circuit open after %s failures", self.name, self.failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = self.reset_seconds - (time.monotonic() - self.opened_at) if self.state == "open" else 0.0
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected,
+                "retry_in_seconds": round(max(0.0, retry_in), 1),
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(backend: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(backend)
+        if breaker is None:
+            breaker = _breakers[backend] = CircuitBreaker(backend)
+        return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.stats() for name, breaker in sorted(breakers.items())}
@@ -0,0 +1,388 @@
+import io
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from docx import Document
+
+from .jd_schema import normalize_jd_analysis
+from .project_index import TOKEN_RE
+from .records import text_hash
+
+# pipeline sends only editable sections to the rewrite LLM, with keyword-gap hints
+RESUME_SCOPED_REWRITE = os.getenv("RESUME_SCOPED_REWRITE", "0") == "1"
+# parsed resumes kept in process, keyed by content hash
+RESUME_MODEL_CACHE_SIZE = int(os.getenv("RESUME_MODEL_CACHE_SIZE", "64"))
+
+SECTION_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "summary": ("summary", "professional summary", "profile", "about", "about me", "objective", "career objective"),
+    "experience": (
+        "experience", "work experience", "professional experience", "employment", "employment history",
+        "work history", "relevant experience",
+    ),
+    "projects": ("projects", "personal projects", "selected projects", "key projects", "side projects"),
+    "skills": (
+        "skills", "technical skills", "core skills", "key skills", "skills & tools", "skills and tools",
+        "technologies", "tech stack", "tools", "competencies",
+    ),
+    "education": ("education", "academic background", "education & training", "qualifications"),
+    "certifications": ("certifications", "certificates", "licenses", "awards", "honors", "achievements"),
+}
+_KIND_BY_HEADING = {alias: kind for kind, aliases in SECTION_ALIASES.items() for alias in aliases}
+# facts the rewrite has no reason to touch: contact block, degrees, certificates
+FIXED_KINDS = frozenset({"header", "education", "certifications"})
+
+# canonical skill -> spellings seen in resumes and JDs
+SKILL_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "python": ("python", "python3"),
+    "javascript": ("javascript", "js", "ecmascript"),
+    "typescript": ("typescript", "ts"),
+    "java": ("java",),
+    "go": ("go", "golang"),
+    "rust": ("rust",),
+    "c++": ("c++", "cpp"),
+    "c#": ("c#", "csharp", ".net", "dotnet"),
+    "ruby": ("ruby", "rails", "ruby on rails"),
+    "php": ("php",),
+    "kotlin": ("kotlin",),
+    "swift": ("swift",),
+    "scala": ("scala",),
+    "sql": ("sql",),
+    "postgresql": ("postgresql", "postgres", "psql"),
+    "mysql": ("mysql",),
+    "sqlite": ("sqlite",),
+    "mongodb": ("mongodb", "mongo"),
+    "redis": ("redis",),
+    "elasticsearch": ("elasticsearch", "elastic search", "opensearch"),
+    "kafka": ("kafka", "apache kafka"),
+    "rabbitmq": ("rabbitmq",),
+    "spark": ("spark", "pyspark", "apache spark"),
+    "airflow": ("airflow", "apache airflow"),
+    "dbt": ("dbt",),
+    "react": ("react", "react.js", "reactjs"),
+    "vue": ("vue", "vue.js", "vuejs"),
+    "angular": ("angular",),
+    "node.js": ("node.js", "nodejs", "node"),
+    "django": ("django",),
+    "flask": ("flask",),
+    "fastapi": ("fastapi",),
+    "spring": ("spring", "spring boot"),
+    "graphql": ("graphql",),
+    "rest": ("rest", "rest api", "rest apis", "restful"),
+    "grpc": ("grpc",),
+    "aws": ("aws", "amazon web services"),
+    "gcp": ("gcp", "google cloud", "google cloud platform"),
+    "azure": ("azure",),
+    "docker": ("docker", "containers"),
+    "kubernetes": ("kubernetes", "k8s"),
+    "terraform": ("terraform",),
+    "ci/cd": ("ci/cd", "ci cd", "continuous integration", "github actions", "jenkins"),
+    "linux": ("linux",),
+    "git": ("git",),
+    "pandas": ("pandas",),
+    "numpy": ("numpy",),
+    "pytorch": ("pytorch", "torch"),
+    "tensorflow": ("tensorflow",),
+    "scikit-learn": ("scikit-learn", "sklearn"),
+    "machine learning": ("machine learning", "ml"),
+    "llm": ("llm", "llms", "large language models"),
+    "microservices": ("microservices", "microservice"),
+    "distributed systems": ("distributed systems",),
+    "data pipelines": ("data pipelines", "etl", "elt"),
+}
+_CANONICAL = {alias: skill for skill, aliases in SKILL_ALIASES.items() for alias in aliases}
+_MAX_NGRAM = 3
+
+_BULLET_RE = re.compile(r"^(?:[-•*▪‣◦–—·●]|\d+[.)])\s*")
+_SKILL_SPLIT_RE = re.compile(r"\s*(?:[,;|•·]|\s/\s)\s*")
+_STOPWORDS = frozenset(
+    "a an and or the of in on for to with at by from as is are be using use experience years year plus strong "
+    "knowledge understanding ability skills skill working work".split()
+)
+
+
+def _phrases(text: str) -> List[str]:
+    """1- to 3-word phrases of text, lowercased, with skill aliases mapped to one spelling."""
+    tokens = [_CANONICAL.get(token, token) for token in TOKEN_RE.findall((text or "").lower())]
+    phrases = []
+    for size in range(1, _MAX_NGRAM + 1):
+        for start in range(len(tokens) - size + 1):
+            phrase = " ".join(tokens[start : start + size])
+            phrases.append(_CANONICAL.get(phrase, phrase))
+    return phrases
+
+
+def _heading_kind(line: str, guess_caps: bool = True) -> Optional[str]:
+    """Section kind if line looks like a heading, else None."""
+    label = line.strip().rstrip(":").strip()
+    if not label or len(label) > 40 or _BULLET_RE.match(label):
+        return None
+    kind = _KIND_BY_HEADING.get(label.lower())
+    if kind:
+        return kind
+    letters = [ch for ch in label if ch.isalpha()]
+    if guess_caps and letters and label.isupper() and len(label.split()) <= 4 and not label.endswith("."):
+        return "other"
+    return None
+
+
+@dataclass(frozen=True, slots=True)
+class ResumeSection:
+    heading: str  # as written; "" for the block before the first heading
+    kind: str  # header, summary, experience, projects, skills, education, certifications, other
+    lines: Tuple[str, ...]
+    bullets: Tuple[str, ...]
+
+    def text(self) -> str:
+        return "\n".join(((self.heading,) if self.heading else ()) + self.lines)
+
+
+@dataclass(frozen=True, slots=True)
+class ParsedResume:
+    """
+    A resume split into sections with bullets, plus an index of the skills
+    it mentions (canonical name -> indexes of the sections naming it).
+    """
+
+    content_hash: str
+    text: str
+    sections: Tuple[ResumeSection, ...]
+    skills: Dict[str, Tuple[int, ...]]
+    phrases: FrozenSet[str]
+
+    def section(self, kind: str) -> Optional[ResumeSection]:
+        return next((section for section in self.sections if section.kind == kind), None)
+
+    def mentions(self, term: str) -> bool:
+        """
+        Whether the resume covers a JD term. Short terms must appear as a
+        phrase (aliases count, "k8s" covers "Kubernetes"); long requirement
+        sentences count when most of their meaningful words appear.
+        """
+        words = [w for w in TOKEN_RE.findall(term.lower()) if w not in _STOPWORDS]
+        if not words:
+            return True
+        phrase = " ".join(_CANONICAL.get(w, w) for w in words)
+        if len(words) <= _MAX_NGRAM:
+            return _CANONICAL.get(phrase, phrase) in self.phrases
+        found = sum(1 for w in words if _CANONICAL.get(w, w) in self.phrases)
+        return found / len(words) >= 0.6
+
+    def has_fixed_sections(self) -> bool:
+        return any(s.kind in FIXED_KINDS for s in self.sections) and any(
+            s.kind not in FIXED_KINDS for s in self.sections
+        )
+
+    def editable_text(self) -> str:
+        """The sections a rewrite may change (everything except FIXED_KINDS)."""
+        return "\n".join(s.text() for s in self.sections if s.kind not in FIXED_KINDS)
+
+    def reassemble(self, rewritten: str) -> str:
+        """
+        Puts a rewrite of editable_text() back together with the fixed
+        sections, each at its original position. A rewritten section goes to
+        the slot of the editable section with the same heading; one with a
+        new heading follows the section before it. Fixed sections the LLM
+        repeated anyway, including a contact block before its first heading,
+        are dropped from its output.
+        """
+        rewritten_sections = _split_sections([line for line in str(rewritten).splitlines() if line.strip()])
+        if any(s.heading for s in rewritten_sections):
+            rewritten_sections = [s for s in rewritten_sections if s.kind not in FIXED_KINDS]
+        slots = [i for i, s in enumerate(self.sections) if s.kind not in FIXED_KINDS] or [len(self.sections)]
+        by_heading = {_heading_key(self.sections[i].heading): i for i in slots if i < len(self.sections)}
+        placed: Dict[int, List[str]] = {i: [] for i in slots}
+        slot = slots[0]
+        for section in rewritten_sections:
+            slot = by_heading.get(_heading_key(section.heading), slot)
+            placed[slot].append(section.text())
+        parts: List[str] = []
+        for i in range(len(self.sections) + 1):
+            if i in placed:
+                parts.extend(placed[i])
+            elif i < len(self.sections):
+                parts.append(self.sections[i].text())
+        return "\n".join(part for part in parts if part)
+
+
+def _heading_key(heading: str) -> str:
+    return heading.strip().rstrip(":").lower()
+
+
+def _split_sections(lines: List[str], styles: Optional[List[str]] = None) -> List[ResumeSection]:
+    """styles (docx paragraph style names) mark headings and bullets when known."""
+    sections: List[ResumeSection] = []
+    heading, kind = "", "header"
+    body: List[str] = []
+    bullets: List[str] = []
+    # documents with heading styles say where sections start; no need to guess from capitals
+    styled = bool(styles) and any(style.lower().startswith(("heading", "title")) for style in styles)
+
+    def _close():
+        if heading or body:
+            sections.append(ResumeSection(heading, kind, tuple(body), tuple(bullets)))
+
+    for index, line in enumerate(lines):
+        style = (styles[index] if styles else "").lower()
+        # inside the contact block, education or certifications, caps lines
+        # like "B.S. COMPUTER SCIENCE" are content; only known headings end them
+        line_kind = _heading_kind(line, guess_caps=not styled and kind not in FIXED_KINDS)
+        if line_kind is None and style.startswith(("heading", "title")) and len(line) <= 60:
+            line_kind = _KIND_BY_HEADING.get(line.strip().rstrip(":").lower(), "other")
+        if line_kind is not None and not style.startswith("list"):
+            _close()
+            heading, kind, body, bullets = line, line_kind, [], []
+            continue
+        body.append(line)
+        if _BULLET_RE.match(line) or style.startswith("list"):
+            bullets.append(_BULLET_RE.sub("", line).strip())
+    _close()
+    return sections
+
+
+def _skill_items(section: ResumeSection) -> Iterable[str]:
+    """Entries of a skills section: "Languages: Python, Go" -> Python, Go."""
+    for line in section.lines:
+        _, _, listed = _BULLET_RE.sub("", line).rpartition(":")
+        for item in _SKILL_SPLIT_RE.split(listed):
+            item = item.strip().lower()
+            if item and len(item.split()) <= 4:
+                yield _CANONICAL.get(item, item)
+
+
+def _build(text: str, lines: List[str], styles: Optional[List[str]] = None) -> ParsedResume:
+    sections = _split_sections(lines, styles)
+    phrases = set()
+    skills: Dict[str, List[int]] = {}
+    for index, section in enumerate(sections):
+        section_phrases = set(_phrases(section.text()))
+        phrases |= section_phrases
+        found = {skill for skill in SKILL_ALIASES if skill in section_phrases}
+        if section.kind == "skills":
+            found.update(_skill_items(section))
+        for skill in found:
+            skills.setdefault(sys.intern(skill), []).append(index)
+    return ParsedResume(
+        content_hash=text_hash(text),
+        text=text,
+        sections=tuple(sections),
+        skills={skill: tuple(indexes) for skill, indexes in skills.items()},
+        phrases=frozenset(phrases),
+    )
+
+
+_cache: "OrderedDict[str, ParsedResume]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(digest: str) -> Optional[ParsedResume]:
+    with _cache_lock:
+        parsed = _cache.get(digest)
+        if parsed is not None:
+            _cache.move_to_end(digest)
+        return parsed
+
+
+def remember_parsed(parsed: ParsedResume) -> ParsedResume:
+    """Caches a parse made elsewhere (e.g. in a CPU worker process) and returns it."""
+    with _cache_lock:
+        _cache[parsed.content_hash] = parsed
+        _cache.move_to_end(parsed.content_hash)
+        while len(_cache) > RESUME_MODEL_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return parsed
+
+
+def parse_resume(text: str) -> ParsedResume:
+    """Parses plain resume text (headings guessed from the lines), once per content."""
+    text = str(text or "")
+    parsed = _cached(text_hash(text))
+    if parsed is not None:
+        return parsed
+    return remember_parsed(_build(text, [line.strip() for line in text.splitlines() if line.strip()]))
+
+
+def parse_resume_docx(docx_bytes: bytes) -> ParsedResume:
+    """
+    Parses an uploaded .docx using its paragraph styles for headings and
+    bullets. `.text` matches extract_text_from_docx_bytes, and the result is
+    cached under that text, so later parse_resume(text) calls get the
+    style-aware parse.
+    """
+    document = Document(io.BytesIO(docx_bytes))
+    lines: List[str] = []
+    styles: List[str] = []
+    for paragraph in document.paragraphs:
+        line = (paragraph.text or "").strip()
+        if line:
+            lines.append(line)
+            styles.append(paragraph.style.name if paragraph.style is not None else "")
+    text = "\n".join(lines)
+    return _cached(text_hash(text)) or remember_parsed(_build(text, lines, styles))
+
+
+# headings of the text summary agents.analyze_jd builds from the analysis JSON
+_SUMMARY_HEADINGS = {
+    "must-have skills:": "must_have",
+    "nice-to-have skills:": "nice_to_have",
+    "tech stack:": "tech_stack",
+    "responsibilities:": "responsibilities",
+    "important keywords:": "keywords",
+}
+
+
+def _analysis_dict(jd_analysis: Any) -> Dict[str, List[str]]:
+    """Analysis as a dict, from the JSON form or the text summary the pipeline passes around."""
+    if isinstance(jd_analysis, str):
+        try:
+            jd_analysis = json.loads(jd_analysis)
+        except json.JSONDecodeError:
+            parsed: Dict[str, List[str]] = {}
+            key = None
+            for line in jd_analysis.splitlines():
+                line = line.strip()
+                if line.lower() in _SUMMARY_HEADINGS:
+                    key = _SUMMARY_HEADINGS[line.lower()]
+                elif key and line.startswith("- "):
+                    parsed.setdefault(key, []).append(line[2:])
+            jd_analysis = parsed
+    return normalize_jd_analysis(jd_analysis)
+
+
+def keyword_gaps(resume: ParsedResume, jd_analysis: Any) -> Dict[str, Any]:
+    """
+    Local check of which JD analysis terms the resume already covers.
+
+    Returns {"coverage": share of terms covered, "matched": [...],
+    "missing": {"must_have": [...], "tech_stack": [...], "nice_to_have": [...],
+    "keywords": [...]}}. Responsibilities are sentences and are left to the LLM.
+    """
+    analysis = _analysis_dict(jd_analysis)
+    matched: List[str] = []
+    missing: Dict[str, List[str]] = {}
+    seen = set()
+    for key in ("must_have", "tech_stack", "nice_to_have", "keywords"):
+        missing[key] = []
+        for term in analysis.get(key, []):
+            if term.lower() in seen:
+                continue
+            seen.add(term.lower())
+            (matched if resume.mentions(term) else missing[key]).append(term)
+    total = len(matched) + sum(len(terms) for terms in missing.values())
+    return {"coverage": round(len(matched) / total, 2) if total else 1.0, "matched": matched, "missing": missing}
+
+
+def keyword_hint(gaps: Dict[str, Any], limit: int = 12) -> str:
+    """Rewrite-prompt line naming JD terms the resume does not show yet."""
+    missing = [term for key in ("must_have", "tech_stack", "keywords") for term in gaps["missing"].get(key, [])]
+    if not missing:
+        return ""
+    return (
+        "The resume does not yet show these job keywords. Work them in only where the "
+        "existing experience truthfully supports them: " + ", ".join(missing[:limit])
+    )
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_STATE_DB_PATH = BASE_DIR / "data" / "state.db"
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStateStore:
+    """
+    Process-local store. Fine for a single uvicorn worker and for tests,
+    but state is lost on restart and not shared between workers.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._expires: Dict[tuple, float] = {}
+        self._lock = threading.RLock()
+
+    def _live(self, namespace: str, key: str) -> bool:
+        expires_at = self._expires.get((namespace, key))
+        if expires_at is not None and expires_at <= time.time():
+            self._data.get(namespace, {}).pop(key, None)
+            self._expires.pop((namespace, key), None)
+            return False
+        return key in self._data.get(namespace, {})
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        with self._lock:
+            if not self._live(namespace, key):
+                return default
+            return json.loads(self._data[namespace][key])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data.setdefault(namespace, {})[key] = json.dumps(value)
+            if ttl is None:
+                self._expires.pop((namespace, key), None)
+            else:
+                self._expires[(namespace, key)] = time.time() + ttl
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._data.get(namespace, {}).pop(key, None)
+            self._expires.pop((namespace, key), None)
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        with self._lock:
+            keys = list(self._data.get(namespace, {}))
+            return {k: json.loads(self._data[namespace][k]) for k in keys if self._live(namespace, k)}
+
+    def update(self, namespace: str, key: str, fn: Callable[[Any], Any], default: Any = None) -> Any:
+        with self._lock:
+            new_value = fn(self.get(namespace, key, default))
+            self.set(namespace, key, new_value)
+            return new_value
+
+    def incr(self, namespace: str, key: str, amount: int = 1) -> int:
+        return self.update(namespace, key, lambda v: int(v or 0) + amount, 0)
+
+    def incr_if_below(self, namespace: str, key: str, limit: int, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            current = int(self.get(namespace, key, 0) or 0)
+            if current >= limit:
+                return False
+            self.set(namespace, key, current + 1, ttl=ttl)
+            return True
+
+
+class SqliteStateStore:
+    """
+    Store shared by every worker process on the host.
+
+    Uses SQLite in WAL mode so readers never block the single writer, and
+    BEGIN IMMEDIATE transactions for read-modify-write operations so counters
+    and session updates stay correct with several uvicorn workers.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _read(self, conn: sqlite3.Connection, namespace: str, key: str) -> Optional[str]:
+        row = conn.execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?"
+            " AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _write(self, conn: sqlite3.Connection, namespace: str, key: str, value: Any, ttl: Optional[float]) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        conn.execute(
+            "INSERT INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (namespace, key, json.dumps(value), expires_at),
+        )
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        raw = self._read(self._conn(), namespace, key)
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._write(self._conn(), namespace, key, value, ttl)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._conn().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        rows = self._conn().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time()),
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def update(self, namespace: str, key: str, fn: Callable[[Any], Any], default: Any = None) -> Any:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            raw = self._read(conn, namespace, key)
+            new_value = fn(json.loads(raw) if raw is not None else default)
+            self._write(conn, namespace, key, new_value, None)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return new_value
+
+    def incr(self, namespace: str, key: str, amount: int = 1) -> int:
+        return self.update(namespace, key, lambda v: int(v or 0) + amount, 0)
+
+    def incr_if_below(self, namespace: str, key: str, limit: int, ttl: Optional[float] = None) -> bool:
+        """Atomic check-and-increment; with ttl it doubles as an expiring lock."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            raw = self._read(conn, namespace, key)
+            current = int(json.loads(raw)) if raw is not None else 0
+            if current >= limit:
+                conn.execute("COMMIT")
+                return False
+            self._write(conn, namespace, key, current + 1, ttl)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def purge_expired(self) -> int:
+        cur = self._conn().execute(
+            "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        return cur.rowcount
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """
+    Returns the process-wide store selected by STATE_BACKEND:
+      - "sqlite" (default): shared file at STATE_DB_PATH, safe for multiple workers
+      - "memory": in-process only, single worker
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = os.getenv("STATE_BACKEND", "sqlite").lower()
+                if backend == "memory":
+                    _store = MemoryStateStore()
+                else:
+                    path = Path(os.getenv("STATE_DB_PATH", str(DEFAULT_STATE_DB_PATH)))
+                    _store = SqliteStateStore(path)
+                logger.info("Using %s state store", backend)
+    return _store
@@ -21,6 +21,36 @@ const loader = document.getElementById("loader");
 const loaderText = document.getElementById("loader-text");
 const generateBtn = document.getElementById("generate-btn");
 
+const jdTextarea = document.getElementById("jd");
+const projectCountSelect = document.getElementById("project-count");
+const ANALYZE_DEBOUNCE_MS = 1500;
+let analyzeTimer = null;
+let lastPrefetchedJd = "";
+
+// Start JD analysis on the server as soon as the JD stops changing, so the
+// result is already cached when the form is submitted.
+function schedulePrefetch() {
+  clearTimeout(analyzeTimer);
+  analyzeTimer = setTimeout(async () => {
+    const jd = jdTextarea.value.trim();
+    if (!jd || jd === lastPrefetchedJd) return;
+    lastPrefetchedJd = jd;
+
+    const formData = new FormData();
+    formData.append("jd", jd);
+    formData.append("project_count", projectCountSelect.value);
+    try {
+      await fetch("/analyze", { method: "POST", body: formData });
+    } catch (err) {
+      // best effort only; /generate analyzes on its own if needed
+      console.debug("JD prefetch failed", err);
+    }
+  }, ANALYZE_DEBOUNCE_MS);
+}
+
+jdTextarea.addEventListener("input", schedulePrefetch);
+jdTextarea.addEventListener("paste", schedulePrefetch);
+
 function getResumeMode() {
   return document.querySelector('input[name="resume_mode"]:checked').value;
 }
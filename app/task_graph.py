@@ -0,0 +1,178 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+
+class TaskNode:
+    def __init__(self, name: str, fn: Callable[..., Any], deps: Tuple["TaskNode", ...], speculative: bool):
+        self.name = name
+        self.fn = fn
+        self.deps = deps
+        self.speculative = speculative
+        self.future: Future = Future()
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.discarded = False
+        # stages see the submitter's context vars (job id for scheduling)
+        self.context = contextvars.copy_context()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        return self.future.result(timeout)
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    @property
+    def status(self) -> str:
+        if self.discarded:
+            return "discarded"
+        if self.future.cancelled():
+            return "cancelled"
+        if not self.future.done():
+            return "running" if self.start is not None else "pending"
+        return "failed" if self.future.exception() else "done"
+
+
+class TaskGraph:
+    """
+    Runs pipeline stages as a dynamic DAG on a thread pool.
+
+    submit() returns immediately; a node is scheduled once all of its
+    dependencies have finished and receives their results as positional
+    arguments. Nodes can be added while the graph is running (one rewrite
+    node per loop iteration), speculative nodes can be cancelled, and
+    report() gives per-stage timings plus the critical path of the job.
+
+    stage_slot(name), when given, is entered around each node, e.g. to cap
+    how many rewrite calls run across all graphs of the process.
+    """
+
+    def __init__(
+        self,
+        name: str = "pipeline",
+        max_workers: int = 4,
+        stage_slot: Optional[Callable[[str], ContextManager[Any]]] = None,
+    ):
+        self.name = name
+        self._stage_slot = stage_slot or (lambda _name: nullcontext())
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-stage")
+        self._nodes: List[TaskNode] = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def __enter__(self) -> "TaskGraph":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
+
+    def submit(self, name: str, fn: Callable[..., Any], *deps: TaskNode, speculative: bool = False) -> TaskNode:
+        node = TaskNode(name, fn, deps, speculative)
+        with self._lock:
+            self._nodes.append(node)
+        if not deps:
+            self._schedule(node)
+            return node
+
+        remaining = [len(deps)]
+        remaining_lock = threading.Lock()
+
+        def _dep_done(_future: Future) -> None:
+            with remaining_lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                self._schedule(node)
+
+        for dep in deps:
+            dep.future.add_done_callback(_dep_done)
+        return node
+
+    def _schedule(self, node: TaskNode) -> None:
+        for dep in node.deps:
+            if dep.future.cancelled():
+                node.future.cancel()
+                return
+            error = dep.future.exception()
+            if error is not None:
+                if node.future.set_running_or_notify_cancel():
+                    node.future.set_exception(error)
+                return
+        try:
+            self._executor.submit(self._run, node)
+        except RuntimeError:
+            # graph already shut down (speculative node added too late)
+            node.future.cancel()
+
+    def _run(self, node: TaskNode) -> None:
+        if not node.future.set_running_or_notify_cancel():
+            return
+        try:
+            # the slot is taken inside the node's context, so it sees the job's deadline
+            value = node.context.run(self._run_in_slot, node)
+        except BaseException as exc:
+            if node.start is None:
+                node.start = time.perf_counter()
+            node.end = time.perf_counter()
+            node.future.set_exception(exc)
+            return
+        node.end = time.perf_counter()
+        node.future.set_result(value)
+
+    def _run_in_slot(self, node: TaskNode) -> Any:
+        with self._stage_slot(node.name):
+            node.start = time.perf_counter()
+            return node.fn(*(dep.future.result() for dep in node.deps))
+
+    def cancel(self, node: TaskNode) -> None:
+        """
+        Cancels a speculative node. If it already started its result is
+        discarded; it is left to finish on its own.
+        """
+        if not node.future.cancel():
+            node.discarded = True
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        The chain of dependencies that ended last: start from the latest
+        finishing useful node and follow the dependency that finished last.
+        """
+        finished = [
+            n for n in self._nodes
+            if n.end is not None and not n.discarded and not n.future.cancelled()
+        ]
+        if not finished:
+            return [], 0.0
+        node: Optional[TaskNode] = max(finished, key=lambda n: n.end)
+        path: List[str] = []
+        total = node.end - self._started
+        while node is not None:
+            path.append(node.name)
+            done_deps = [d for d in node.deps if d.end is not None]
+            node = max(done_deps, key=lambda d: d.end) if done_deps else None
+        return list(reversed(path)), total
+
+    def report(self) -> Dict[str, Any]:
+        path, seconds = self.critical_path()
+        stages = []
+        for node in self._nodes:
+            stages.append({
+                "name": node.name,
+                "status": node.status,
+                "speculative": node.speculative,
+                "start": round(node.start - self._started, 4) if node.start is not None else None,
+                "seconds": round(node.end - node.start, 4) if node.start is not None and node.end is not None else None,
+                "deps": [d.name for d in node.deps],
+            })
+        return {
+            "critical_path": path,
+            "critical_path_seconds": round(seconds, 4),
+            "wall_seconds": round(time.perf_counter() - self._started, 4),
+            "stages": stages,
+        }
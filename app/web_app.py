@@ -1,34 +1,158 @@
 from pathlib import Path
+import logging
+import os
+import random
+import threading
 import uuid
-from typing import Dict, List, Union
-from fastapi import FastAPI, Form, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from typing import List, Optional, Set, Union
+from fastapi import BackgroundTasks, FastAPI, Form, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from .pipeline import run_pipeline_and_get_text
-from .file_utils import (
-    create_resume_docx,
-    extract_text_from_docx_bytes,
-    load_master_resume_text,
+from .analysis_cache import ANALYZE_MIN_CHARS, analysis_status, jd_hash, prefetch_analysis
+from .artifact_store import (
+    artifact_etag,
+    content_disposition,
+    etag_matches,
+    get_artifact,
+    parse_range_header,
+    read_artifact_bytes,
+    start_cleanup_thread,
+    store_resume_docx,
 )
+from .compression import CompressionMiddleware
+from .budget import BudgetExceeded, admit_job, capacity, plan_job, release_job
+from .batch import BATCH_MAX_CONCURRENCY, run_batch, stream_batch_zip
+from .pipeline import (
+    PIPELINE_ACCEPT_SCORE,
+    PIPELINE_MAX_LOOPS,
+    PIPELINE_REGENERATE_LOOPS,
+    run_pipeline_and_get_text,
+)
+from .file_utils import OUTPUT_DIR, load_master_resume_text, render_resume_docx_bytes, safe_company_name
 from .diff_utils import make_side_by_side_diff_html
+from .executors import get_executors, run_cpu
+from .history_store import HistoryStore, get_history_store
+from .judge_cache import get_judge_cache
+from .llm_scheduler import get_scheduler
+from .ollama_client import get_ollama_client
 from .projects_utils import load_projects
+from .records import JobSession
+from .resilience import CircuitOpenError, DeadlineExceeded, breaker_stats
+from .resume_model import keyword_gaps, parse_resume, parse_resume_docx, remember_parsed
+from .request_context import current_budget_id, current_job_id, current_llm_routes
+from .state_store import get_state_store
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-OUTPUT_DIR = BASE_DIR / "output"
 STATIC_DIR = BASE_DIR / "app" / "static"
 
-app = FastAPI()
+try:  # orjson serializes the large resume/diff payloads several times faster
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# share of /generate and /regenerate responses summarized at DEBUG level
+RESPONSE_LOG_SAMPLE_RATE = float(os.getenv("RESPONSE_LOG_SAMPLE_RATE", "0.01"))
+# fields of /generate and /regenerate responses; ?fields= picks a subset
+JOB_RESPONSE_FIELDS = (
+    "job_id",
+    "version",
+    "resume_source",
+    "project_count",
+    "score",
+    "summary",
+    "docx_file",
+    "download_url",
+    "all_versions",
+    "new_resume_text",
+    "diff_html",
+    "selected_projects",
+    "critical_path",
+    "budget",
+    "keyword_gaps",
+)
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware)
 
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
-SESSIONS = {}
+# job sessions live in the shared state store so any worker can serve /regenerate
+SESSION_NAMESPACE = "sessions"
+state_store = get_state_store()
+
+
+@app.on_event("startup")
+def start_background_jobs():
+    start_cleanup_thread()
+    if os.getenv("OLLAMA_WARMUP", "1") == "1":
+        # load the local model now instead of on the first job; never blocks startup
+        threading.Thread(target=get_ollama_client().warm_up, name="ollama-warmup", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def stop_executors():
+    get_executors().shutdown()
+
 
 @app.get("/", response_class=HTMLResponse)
 def index():
     return (STATIC_DIR / "index.html").read_text()
 
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "scheduler": get_scheduler().stats(),
+        "executors": get_executors().stats(),
+        "circuit_breakers": breaker_stats(),
+        "judge_cache": get_judge_cache().stats(),
+    }
+
+
+@app.get("/capacity")
+def get_capacity():
+    """OpenRouter calls left today and how many typical jobs that covers."""
+    return capacity()
+
+
+def _history():
+    history = get_history_store()
+    if not isinstance(history, HistoryStore):
+        raise HTTPException(status_code=404, detail="History is disabled (HISTORY_ENABLED=0)")
+    return history
+
+
+@app.get("/history/latency")
+def history_latency(stage: str = "judge", days: float = 7, q: float = 0.95):
+    """Latency percentile of successful calls per model, e.g. p95 judge latency this week."""
+    return {"stage": stage, "days": days, "q": q, "models": _history().latency_percentiles(stage, days, q)}
+
+
+@app.get("/history/loops")
+def history_loops(score: float = PIPELINE_ACCEPT_SCORE, days: float = 30):
+    return {"days": days, **_history().loops_to_score(score, days)}
+
+
+@app.get("/history/calls")
+def history_calls(days: float = 1):
+    return {"days": days, "calls": _history().call_summary(days)}
+
+
+@app.get("/history/jobs/{job_id}")
+def history_job(job_id: str):
+    return {"job_id": job_id, "iterations": _history().job_trajectory(job_id)}
+
+
 @app.get("/projects")
 def get_projects():
     projects = load_projects()
@@ -45,26 +169,138 @@ def _project_display_names(projects):
             names.append(name)
     return names
 
+@app.post("/analyze")
+def analyze_job_description(
+    background_tasks: BackgroundTasks,
+    jd: str = Form(...),
+    project_count: int = Form(3),
+):
+    """
+    Speculative prefetch called by the UI while the user is still typing.
+    Analysis runs in the background into the shared cache, where /generate
+    picks it up by content hash.
+    """
+    if len(jd.strip()) < ANALYZE_MIN_CHARS:
+        return {"status": "skipped", "jd_hash": None}
+    status = analysis_status(jd)
+    if status == "missing":
+        background_tasks.add_task(prefetch_analysis, jd, project_count, load_projects())
+        status = "scheduled"
+    return {"status": status, "jd_hash": jd_hash(jd)}
+
+
+def _critical_path_summary(pipeline_state):
+    timings = pipeline_state.get("timings") or {}
+    return {
+        "stages": timings.get("critical_path", []),
+        "seconds": timings.get("critical_path_seconds"),
+    }
+
+
+def _keyword_gaps(resume_text, pipeline_state, wanted):
+    # local check, no LLM call; skipped when ?fields= leaves it out
+    if wanted is not None and "keyword_gaps" not in wanted:
+        return None
+    return keyword_gaps(parse_resume(resume_text), pipeline_state.get("jd_analysis") or {})
+
+
+def _admit(job_id, max_loops, setup=True):
+    """Admission control: reserves the job's OpenRouter calls or answers 503."""
+    try:
+        plan = admit_job(job_id, max_loops, setup=setup)
+    except BudgetExceeded as exc:
+        raise HTTPException(status_code=503, detail={"error": str(exc), "capacity": capacity()})
+    current_llm_routes.set(plan["routes"])
+    current_budget_id.set(plan["reservation_id"])
+    return plan
+
+
+def _run_admitted(plan, **pipeline_kwargs):
+    try:
+        result = run_pipeline_and_get_text(max_loops=plan["max_loops"], **pipeline_kwargs)
+    except DeadlineExceeded as exc:
+        release_job(plan)
+        raise HTTPException(status_code=504, detail=str(exc))
+    except CircuitOpenError as exc:
+        release_job(plan)
+        raise HTTPException(status_code=503, detail=str(exc))
+    except Exception:
+        release_job(plan)
+        raise
+    release_job(plan, result[2].get("loops"))
+    return result
+
+
+def _budget_summary(plan):
+    return {"mode": plan["mode"], "max_loops": plan["max_loops"], "reason": plan["reason"]}
+
+
+def _requested_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """Parses ?fields=a,b; None means every field. Checked before any work is done."""
+    if not fields:
+        return None
+    wanted = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = sorted(wanted - set(JOB_RESPONSE_FIELDS))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": f"Unknown fields: {', '.join(unknown)}", "fields": list(JOB_RESPONSE_FIELDS)},
+        )
+    return wanted
+
+
+def _job_response(payload, wanted: Optional[Set[str]], endpoint: str):
+    if wanted is not None:
+        payload = {key: value for key, value in payload.items() if key in wanted}
+    if RESPONSE_LOG_SAMPLE_RATE > 0 and logger.isEnabledFor(logging.DEBUG) and random.random() < RESPONSE_LOG_SAMPLE_RATE:
+        # a summary, never the resume text itself
+        logger.debug(
+            "%s job=%s version=%s score=%s fields=%s resume_chars=%s diff_chars=%s",
+            endpoint,
+            payload.get("job_id"),
+            payload.get("version"),
+            payload.get("score"),
+            sorted(payload),
+            len(payload.get("new_resume_text") or ""),
+            len(payload.get("diff_html") or ""),
+        )
+    return FastJSONResponse(payload)
+
+
 @app.post("/generate")
-def generate_resume(
+async def generate_resume(
     jd: str = Form(...),
     company: str = Form(...),
     project_count: int = Form(3),
     resume_mode: str = Form("paste"),
     base_resume: str = Form(""),
     resume_file: Union[UploadFile, None] = File(None),
+    fields: Optional[str] = Query(None, description="Comma-separated response fields to return"),
 ):
+    wanted = _requested_fields(fields)
+    docx_bytes = None
+    if resume_mode == "upload" and resume_file:
+        filename = (resume_file.filename or "").lower()
+        if not filename.endswith(".docx"):
+            raise HTTPException(status_code=400, detail="Only .docx files are supported")
+        docx_bytes = await resume_file.read()
+    # the pipeline blocks on LLM calls; it runs on the job pool, not the event loop
+    return await get_executors().run_job(
+        _generate_job, jd, company, project_count, resume_mode, docx_bytes, wanted
+    )
+
+
+def _generate_job(jd, company, project_count, resume_mode, docx_bytes, wanted):
+    job_id = str(uuid.uuid4())
+    current_job_id.set(job_id)
     resume_source = "paste"
     base_resume_text = ""
 
     if resume_mode == "upload":
         resume_source = "upload"
-        if resume_file:
-            filename = (resume_file.filename or "").lower()
-            if not filename.endswith(".docx"):
-                raise HTTPException(status_code=400, detail="Only .docx files are supported")
-            docx_bytes = resume_file.read()
-            base_resume_text = extract_text_from_docx_bytes(docx_bytes)
+        if docx_bytes is not None:
+            # parsed with paragraph styles and cached, so stages see real headings
+            base_resume_text = remember_parsed(run_cpu(parse_resume_docx, docx_bytes)).text
         else:
             resume_source = "master"
             base_resume_text = load_master_resume_text()
@@ -77,36 +313,34 @@ def generate_resume(
     if not base_resume_text:
         raise HTTPException(status_code=400, detail="Resume content is empty (including master resume)")
 
+    plan = _admit(job_id, max_loops=PIPELINE_MAX_LOOPS)
     projects = load_projects()
-    resume_text, judgement, pipeline_state = run_pipeline_and_get_text(
+    resume_text, judgement, pipeline_state = _run_admitted(
+        plan,
         jd_text=jd,
         base_resume=base_resume_text,
         project_count=project_count,
         projects=projects,
     )
-    diff_html = make_side_by_side_diff_html(base_resume_text, resume_text)
-
-    job_id = str(uuid.uuid4())
+    outputs = pipeline_state.get("outputs", {})
+    diff_html = None
+    if wanted is None or "diff_html" in wanted:
+        # built speculatively while the judge ran; rebuilt only if missing
+        diff_html = outputs.get("diff_html") or run_cpu(make_side_by_side_diff_html, base_resume_text, resume_text)
 
     # version starts at 1 for a new job
     version = 1
-    docx_path = create_resume_docx(company, resume_text, version)
+    artifact = store_resume_docx(job_id, company, resume_text, version, outputs.get("docx_bytes"))
 
-    selected_project_ids = pipeline_state.get("selected_project_ids", [])
     selected_projects_detail = pipeline_state.get("selected_projects", [])
     selected_project_names = _project_display_names(selected_projects_detail)
 
-    SESSIONS[job_id] = {
-        "jd": jd,
-        "company": company,
-        "base_resume": base_resume_text,
-        "jd_analysis": pipeline_state.get("jd_analysis", ""),
-        "selected_project_ids": selected_project_ids,
-        "resume_source": resume_source,
-        "project_count": project_count,
-        "version": version,
-        "files": [docx_path.name],
-    }
+    # texts go to the shared blob store; the session keeps their hashes and
+    # the warm-start state /regenerate continues from
+    session = JobSession.create(
+        jd, company, base_resume_text, resume_source, project_count, pipeline_state, files=[artifact["filename"]]
+    )
+    state_store.set(SESSION_NAMESPACE, job_id, session.to_record())
 
     response_payload = {
         "job_id": job_id,
@@ -115,61 +349,77 @@ def generate_resume(
         "project_count": project_count,
         "score": judgement.get("score"),
         "summary": judgement.get("summary"),
-        "docx_file": docx_path.name,
-        "download_url": f"/download/{docx_path.name}",
-        "all_versions": SESSIONS[job_id]["files"],
+        "docx_file": artifact["filename"],
+        "download_url": f"/download/{artifact['filename']}",
+        "all_versions": session.files,
         "new_resume_text": resume_text,
         "diff_html": diff_html,
         "selected_projects": selected_project_names,
+        "critical_path": _critical_path_summary(pipeline_state),
+        "budget": _budget_summary(plan),
+        "keyword_gaps": _keyword_gaps(resume_text, pipeline_state, wanted),
     }
-    print("judgement-----", judgement)
-    print("response_payload-----", response_payload)
-    return JSONResponse(response_payload)
+    return _job_response(response_payload, wanted, "generate")
 
 @app.post("/regenerate/{job_id}")
-def regenerate_resume(job_id: str):
-    session = SESSIONS.get(job_id)
-    if not session:
+async def regenerate_resume(
+    job_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated response fields to return"),
+):
+    wanted = _requested_fields(fields)
+    return await get_executors().run_job(_regenerate_job, job_id, wanted)
+
+
+def _regenerate_job(job_id, wanted):
+    record = state_store.get(SESSION_NAMESPACE, job_id)
+    if not record:
         raise HTTPException(status_code=404, detail="Unknown job_id")
+    current_job_id.set(job_id)
 
-    jd = session["jd"]
-    company = session["company"]
-    base_resume = session["base_resume"]
-    project_count = session.get("project_count", 3)
-    resume_source = session.get("resume_source", "redo")
-    previous_state = {
-        "jd_analysis": session.get("jd_analysis"),
-        "selected_project_ids": session.get("selected_project_ids"),
-    }
+    session = JobSession.from_record(record)
+    jd, base_resume = session.texts()
+    company = session.company
+    project_count = session.project_count
+    resume_source = session.resume_source
+    previous_state = session.previous_state()
+    # a session that kept its analysis and projects skips both
+    known = bool(previous_state.get("jd_analysis") and previous_state.get("selected_project_ids"))
+    plan = _admit(job_id, max_loops=PIPELINE_REGENERATE_LOOPS, setup=not known)
     projects = load_projects()
 
-    resume_text, judgement, pipeline_state = run_pipeline_and_get_text(
+    resume_text, judgement, pipeline_state = _run_admitted(
+        plan,
         jd_text=jd,
         base_resume=base_resume,
         project_count=project_count,
         projects=projects,
         previous_state=previous_state,
-        max_loops=3,
     )
-    diff_html = make_side_by_side_diff_html(base_resume, resume_text)
+    outputs = pipeline_state.get("outputs", {})
+    diff_html = None
+    if wanted is None or "diff_html" in wanted:
+        diff_html = outputs.get("diff_html") or run_cpu(make_side_by_side_diff_html, base_resume, resume_text)
 
-    # initialize session state if missing (for backwards compatibility)
-    session.setdefault("version", 1)
-    session.setdefault("files", [])
+    def _bump_version(current):
+        current = JobSession.from_record(current) if current else session
+        current.version += 1
+        return current.to_record()
 
-    # increment version
-    session["version"] += 1
-    version = session["version"]
+    # atomic so concurrent regenerates on different workers get distinct versions
+    version = state_store.update(SESSION_NAMESPACE, job_id, _bump_version)["version"]
 
-    docx_path = create_resume_docx(company, resume_text, version)
+    artifact = store_resume_docx(job_id, company, resume_text, version, outputs.get("docx_bytes"))
 
-    selected_project_ids = pipeline_state.get("selected_project_ids", [])
     selected_projects_detail = pipeline_state.get("selected_projects", [])
     selected_project_names = _project_display_names(selected_projects_detail)
 
-    session["files"].append(docx_path.name)
-    session["jd_analysis"] = pipeline_state.get("jd_analysis", session.get("jd_analysis", ""))
-    session["selected_project_ids"] = selected_project_ids
+    def _record_result(current):
+        current = JobSession.from_record(current) if current else session
+        current.files.append(artifact["filename"])
+        current.record_pipeline(pipeline_state)
+        return current.to_record()
+
+    session = JobSession.from_record(state_store.update(SESSION_NAMESPACE, job_id, _record_result))
 
     response_payload = {
         "job_id": job_id,
@@ -178,24 +428,120 @@ def regenerate_resume(job_id: str):
         "project_count": project_count,
         "score": judgement.get("score"),
         "summary": judgement.get("summary"),
-        "docx_file": docx_path.name,
-        "download_url": f"/download/{docx_path.name}",
-        "all_versions": session["files"],
+        "docx_file": artifact["filename"],
+        "download_url": f"/download/{artifact['filename']}",
+        "all_versions": session.files,
         "new_resume_text": resume_text,
         "diff_html": diff_html,
         "selected_projects": selected_project_names,
+        "critical_path": _critical_path_summary(pipeline_state),
+        "budget": _budget_summary(plan),
+        "keyword_gaps": _keyword_gaps(resume_text, pipeline_state, wanted),
     }
-    print("judgement-----", judgement)
-    print("response_payload-----")
-    print(JSONResponse(response_payload))
-    return JSONResponse(response_payload)
+    return _job_response(response_payload, wanted, "regenerate")
+
+@app.post("/batch")
+async def batch_generate(
+    jd: str = Form(...),
+    company: str = Form(...),
+    project_count: int = Form(3),
+    max_concurrency: int = Form(BATCH_MAX_CONCURRENCY),
+    resume_files: List[UploadFile] = File(...),
+):
+    resumes = []
+    for resume_file in resume_files:
+        filename = resume_file.filename or ""
+        if not filename.lower().endswith(".docx"):
+            raise HTTPException(status_code=400, detail=f"Only .docx files are supported: {filename}")
+        resumes.append((filename, await resume_file.read()))
+    if not resumes:
+        raise HTTPException(status_code=400, detail="No resumes uploaded")
+
+    # the shared analysis blocks on LLM calls; it runs on the job pool like /generate
+    max_concurrency = max(1, min(max_concurrency, BATCH_MAX_CONCURRENCY))
+    results = await get_executors().run_job(_batch_job, jd, project_count, max_concurrency, resumes)
+    return _batch_response(results, jd, company, project_count)
+
+
+def _batch_job(jd, project_count, max_concurrency, resumes):
+    # early answer for a batch that cannot run at all; candidates are admitted one by one
+    plan = plan_job(max_loops=PIPELINE_MAX_LOOPS)
+    if plan["mode"] == "reject":
+        raise HTTPException(status_code=503, detail={"error": plan["reason"], "capacity": capacity()})
+
+    projects = load_projects()
+    try:
+        results = run_batch(
+            jd_text=jd,
+            project_count=project_count,
+            projects=projects,
+            resumes=resumes,
+            max_concurrency=max_concurrency,
+        )
+    except BudgetExceeded as exc:
+        raise HTTPException(status_code=503, detail={"error": str(exc), "capacity": capacity()})
+    return results
+
+
+def _batch_response(results, jd, company, project_count):
+    def _with_sessions(batch_results):
+        # register every candidate as a job so it can be regenerated later
+        for result in batch_results:
+            if not result.get("error"):
+                # its v1 file, so /regenerate lists it in all_versions; the zip reuses the bytes
+                outputs = result["pipeline_state"].setdefault("outputs", {})
+                outputs["docx_bytes"] = outputs.get("docx_bytes") or render_resume_docx_bytes(result["resume_text"])
+                artifact = store_resume_docx(result["job_id"], company, result["resume_text"], 1, outputs["docx_bytes"])
+                session = JobSession.create(
+                    jd, company, result["base_resume"], "batch", project_count, result["pipeline_state"],
+                    files=[artifact["filename"]],
+                )
+                state_store.set(SESSION_NAMESPACE, result["job_id"], session.to_record())
+            yield result
+
+    archive_name = f"{safe_company_name(company) or 'batch'}_resumes.zip"
+    return StreamingResponse(
+        stream_batch_zip(_with_sessions(results), company),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(archive_name)},
+    )
 
 @app.get("/download/{filename}")
-def download_file(filename: str):
-    file_path = OUTPUT_DIR / filename
-    if not file_path.exists():
+def download_file(filename: str, request: Request):
+    record = get_artifact(filename)
+    if record is None:
+        # files written before the artifact store existed
+        legacy_path = OUTPUT_DIR / filename
+        if Path(filename).name != filename or not legacy_path.is_file():
+            raise HTTPException(status_code=404, detail="File not found")
+        return FileResponse(legacy_path, filename=filename)
+
+    etag = artifact_etag(record)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate",
+        "Content-Disposition": content_disposition(record["download_name"]),
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = read_artifact_bytes(record)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, filename=filename)
+
+    media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    try:
+        byte_range = parse_range_header(request.headers.get("range"), len(data))
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+    if byte_range is None:
+        return Response(content=data, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+    return Response(content=data[start : end + 1], status_code=206, media_type=media_type, headers=headers)
 
 # if __name__ == "__main__":
 #     jd="""
@@ -0,0 +1,378 @@
+"""
+Offline evaluation of the rewrite/judge loop settings: LLM cost vs quality.
+
+Replays a corpus of JD/resume pairs through run_pipeline_and_get_text for
+every combination of --accept-scores, --max-loops, --project-counts and the
+select/rewrite/judge temperatures, on a process pool of --workers. Every
+LLM call goes to an in-process stub server that answers
+
+  replay     with the reply the app recorded for the same prompt and
+             temperature (run the app with LLM_RECORD_PATH, pass --replay);
+  simulate   otherwise, with a toy quality model: each resume starts at a
+             seeded quality, every rewrite adds a seeded gain (larger with
+             judge feedback, noisier at higher rewrite temperature) and the
+             judge reports the quality plus noise that grows with its
+             temperature.
+
+Simulated scores show how the loop settings react to a judge of that
+shape, not how a real model scores; replies only replay for prompts that
+were recorded with the same settings (hits and misses are printed).
+
+Per configuration it reports LLM calls, tokens and time per job, the final
+score distribution, the share of jobs reaching --acceptable-score, and LLM
+calls per acceptable resume (lower is better). The JD analysis is warmed
+first: it is the same for every configuration and not counted.
+
+Corpus: --corpus JSONL lines {"id", "jd", "resume"}, --state-db to take the
+JD and base resume of every session the app stored, or --cases synthetic
+pairs (default).
+
+    python bench/evaluate.py --cases 40 --accept-scores 7.5 8 8.5 --max-loops 3 5
+    LLM_RECORD_PATH=data/llm_replies.jsonl uvicorn app.web_app:app
+    python bench/evaluate.py --state-db data/state.db --replay data/llm_replies.jsonl --report eval.json
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from load_test import RESUME_LINES, configure_env, percentile  # noqa: E402
+from stub_llm_server import start_stub_server  # noqa: E402
+
+from app.json_utils import response_key  # noqa: E402
+
+SKILLS = ["Python", "FastAPI", "PostgreSQL", "Kubernetes", "AWS", "React", "Go", "Kafka", "Redis", "Terraform"]
+DOMAINS = ["Retail", "Fintech", "Health", "Logistics"]
+
+_QUALITY_RE = re.compile(r"\[sim quality (\d+(?:\.\d+)?)\]")
+_STAGES = (("project selector", "select"), ("rewrite resumes", "rewrite"), ("recruiter", "judge"))
+
+
+def _rng(*parts: Any) -> random.Random:
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+class Responder:
+    """Replays recorded replies; simulates rewrite and judge replies for anything else."""
+
+    def __init__(self, replies: Dict[str, str]):
+        self.replies = replies
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request: Dict[str, Any]) -> Optional[str]:
+        messages = request.get("messages") or []
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system").lower()
+        stage = next((name for marker, name in _STAGES if marker in system), None)
+        if stage is None:
+            return None  # JD analysis: canned
+        temperature = request.get("temperature", (request.get("options") or {}).get("temperature"))
+        if self.replies:
+            reply = self.replies.get(response_key(messages, temperature))
+            with self._lock:
+                if reply is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if reply is not None:
+                return reply
+        prompt = messages[-1].get("content", "") if messages else ""
+        if stage == "rewrite":
+            return self._rewrite(prompt, float(temperature or 0))
+        if stage == "judge":
+            return self._judge(prompt, float(temperature or 0))
+        return None  # selection: the first project_count candidates
+
+    @staticmethod
+    def _start_quality(resume: str) -> float:
+        return _rng("start", _QUALITY_RE.sub("", resume).strip()).uniform(4.5, 7.5)
+
+    def _rewrite(self, prompt: str, temperature: float) -> str:
+        resume = prompt.split("Resume:\n", 1)[-1]
+        match = _QUALITY_RE.search(resume)
+        quality = float(match.group(1)) if match else self._start_quality(resume)
+        feedback = "recruiter feedback" in prompt
+        rng = _rng("rewrite", prompt, temperature)
+        gain = rng.gauss(0.5 + 0.5 * temperature + (0.4 if feedback else 0.0), 0.15 + 1.2 * temperature)
+        quality = min(9.6, max(0.0, quality + gain))
+        text = _QUALITY_RE.sub("", resume).strip()
+        return json.dumps({"upgradedResume": f"{text}\n[sim quality {quality:.2f}]"})
+
+    def _judge(self, prompt: str, temperature: float) -> str:
+        resume = prompt.split("Resume:\n", 1)[-1].split("\n\nReturn JSON", 1)[0]
+        match = _QUALITY_RE.search(resume)
+        quality = float(match.group(1)) if match else self._start_quality(resume)
+        rng = _rng("judge", prompt, temperature)
+        score = min(10.0, max(0.0, quality + rng.gauss(0.0, 0.2 + 2.0 * temperature)))
+        improvements = [f"Quantify impact in project {rng.randint(1, 3)}", "Mirror the JD's core keywords"]
+        return json.dumps({
+            "score": round(score, 1),
+            "summary": "Simulated judgement",
+            "improvements": improvements[: 1 + int(score < 8)],
+            "project_selection_issue": False,
+        })
+
+
+def load_replies(paths: List[str]) -> Dict[str, str]:
+    replies: Dict[str, str] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    replies[record["key"]] = record["content"]
+    return replies
+
+
+def synthetic_corpus(count: int) -> List[Dict[str, str]]:
+    cases = []
+    for index in range(count):
+        rng = random.Random(index)
+        skills = rng.sample(SKILLS, 5)
+        jd = (
+            f"Backend Engineer #{index}. We build services in {', '.join(skills[:3])}. "
+            f"Nice to have: {', '.join(skills[3:])}. You will own APIs, data models and on-call health. "
+        ) * 4
+        resume = "\n".join(rng.sample(RESUME_LINES, 20))
+        cases.append({"id": f"synthetic-{index}", "jd": jd, "resume": resume})
+    return cases
+
+
+def load_corpus(path: str) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    return [{"id": str(case.get("id", i)), "jd": case["jd"], "resume": case["resume"]} for i, case in enumerate(cases)]
+
+
+def corpus_from_state_db(path: str) -> List[Dict[str, str]]:
+    """JD and base resume of every session the app stored, one case per distinct pair."""
+    from app.records import JobSession, TextBlobs
+    from app.state_store import SqliteStateStore
+
+    store = SqliteStateStore(Path(path))
+    blobs = TextBlobs(store)
+    cases: Dict[str, Dict[str, str]] = {}
+    for job_id, record in store.items("sessions").items():
+        session = JobSession.from_record(record, blobs)
+        jd, resume = session.texts(blobs)
+        if jd and resume:
+            cases.setdefault(f"{session.jd_hash}:{session.base_resume_hash}", {"id": job_id, "jd": jd, "resume": resume})
+    return list(cases.values())
+
+
+def synthetic_projects(count: int = 12) -> List[Dict[str, Any]]:
+    rng = random.Random(7)
+    return [
+        {
+            "id": f"proj-{i}",
+            "name": f"Project {i}",
+            "intro": f"Service {i} for {rng.choice(DOMAINS)} customers.",
+            "bullets": [f"Cut latency by {rng.randint(10, 60)}%", f"Served {rng.randint(1, 90)}k users"],
+            "tech_tags": rng.sample(SKILLS, 3),
+            "domain_tags": [rng.choice(DOMAINS)],
+        }
+        for i in range(count)
+    ]
+
+
+def config_grid(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    grid = itertools.product(
+        args.accept_scores, args.max_loops, args.project_counts,
+        args.select_temperatures, args.rewrite_temperatures, args.judge_temperatures,
+    )
+    return [
+        {
+            "name": f"accept={accept:g} loops={loops} projects={count} t={select:g}/{rewrite:g}/{judge:g}",
+            "accept_score": accept,
+            "max_loops": loops,
+            "project_count": count,
+            "select_temperature": select,
+            "rewrite_temperature": rewrite,
+            "judge_temperature": judge,
+        }
+        for accept, loops, count, select, rewrite, judge in grid
+    ]
+
+
+# --- worker processes ---------------------------------------------------------
+
+_projects: List[Dict[str, Any]] = []
+
+
+def _init_worker(stub_url: str, workdir: str, projects: List[Dict[str, Any]]) -> None:
+    global _projects
+    own_dir = Path(workdir) / f"worker-{os.getpid()}"
+    own_dir.mkdir(parents=True, exist_ok=True)
+    configure_env(own_dir, stub_url, keys=4)
+    os.environ["HISTORY_FLUSH_SECONDS"] = "0.05"
+    # judgements shared across runs would make later settings look cheaper
+    os.environ["JUDGE_CACHE_ENABLED"] = "0"
+    # the LLM clients print and log every call; failed runs come back as results
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+    _projects = projects
+
+
+def _run_case(settings: Dict[str, Any], case: Dict[str, str]) -> Dict[str, Any]:
+    from app.analysis_cache import get_or_analyze
+    from app.history_store import get_history_store
+    from app.pipeline import PipelineConfig, run_pipeline_and_get_text
+    from app.request_context import current_job_id
+
+    current_job_id.set("eval-warmup")
+    get_or_analyze(case["jd"])
+
+    job_id = f"eval-{uuid.uuid4().hex}"
+    current_job_id.set(job_id)
+    config = PipelineConfig(
+        accept_score=settings["accept_score"],
+        select_temperature=settings["select_temperature"],
+        rewrite_temperature=settings["rewrite_temperature"],
+        judge_temperature=settings["judge_temperature"],
+    )
+    started = time.perf_counter()
+    try:
+        _, judgement, state = run_pipeline_and_get_text(
+            jd_text=case["jd"],
+            base_resume=case["resume"],
+            project_count=settings["project_count"],
+            projects=_projects,
+            max_loops=settings["max_loops"],
+            speculate_outputs=False,
+            config=config,
+        )
+    except Exception as exc:
+        return {"config": settings["name"], "case": case["id"], "error": str(exc)}
+    wall = time.perf_counter() - started
+    history = get_history_store()
+    history.flush()
+    return {
+        "config": settings["name"],
+        "case": case["id"],
+        "score": float(judgement.get("score") or 0),
+        "loops": state.get("loops", 0),
+        "wall_s": wall,
+        **history.job_usage(job_id),
+    }
+
+
+# --- report -------------------------------------------------------------------
+
+def summarize(settings: Dict[str, Any], runs: List[Dict[str, Any]], acceptable: float) -> Dict[str, Any]:
+    ok = [run for run in runs if "error" not in run]
+    scores = [run["score"] for run in ok]
+    accepted = sum(1 for score in scores if score >= acceptable)
+    calls = sum(run["calls"] for run in ok)
+    count = max(1, len(ok))
+    return {
+        **settings,
+        "runs": len(runs),
+        "errors": len(runs) - len(ok),
+        "calls_per_job": calls / count,
+        "tokens_per_job": sum(run["prompt_tokens"] + run["completion_tokens"] for run in ok) / count,
+        "llm_s_per_job": sum(run["llm_ms"] for run in ok) / count / 1000,
+        "wall_p95_s": percentile([run["wall_s"] for run in ok], 95),
+        "loops_per_job": sum(run["loops"] for run in ok) / count,
+        "score_p10": percentile(scores, 10),
+        "score_p50": percentile(scores, 50),
+        "score_p90": percentile(scores, 90),
+        "acceptable_share": accepted / count,
+        "calls_per_acceptable": calls / accepted if accepted else None,
+    }
+
+
+def print_report(rows: List[Dict[str, Any]], acceptable: float) -> None:
+    header = (
+        f"{'configuration':<46} {'calls':>6} {'tokens':>7} {'llm s':>6} {'loops':>5} "
+        f"{'p10':>5} {'p50':>5} {'p90':>5} {f'>={acceptable:g}':>6} {'calls/ok':>8}"
+    )
+    print(header)
+    for row in rows:
+        per_ok = f"{row['calls_per_acceptable']:.2f}" if row["calls_per_acceptable"] is not None else "-"
+        print(
+            f"{row['name']:<46} {row['calls_per_job']:>6.2f} {row['tokens_per_job']:>7.0f} "
+            f"{row['llm_s_per_job']:>6.2f} {row['loops_per_job']:>5.2f} {row['score_p10']:>5.1f} "
+            f"{row['score_p50']:>5.1f} {row['score_p90']:>5.1f} {row['acceptable_share']:>6.0%} {per_ok:>8}"
+            + (f"  ({row['errors']} errors)" if row["errors"] else "")
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="JSONL of {id, jd, resume}")
+    parser.add_argument("--state-db", help="use the sessions stored in this state.db as the corpus")
+    parser.add_argument("--cases", type=int, default=20, help="synthetic cases when no corpus is given")
+    parser.add_argument("--projects", help="projects.json to select from (default: a synthetic inventory)")
+    parser.add_argument("--replay", nargs="*", default=[], help="JSONL files written through LLM_RECORD_PATH")
+    parser.add_argument("--accept-scores", type=float, nargs="+", default=[8.0])
+    parser.add_argument("--max-loops", type=int, nargs="+", default=[3, 5])
+    parser.add_argument("--project-counts", type=int, nargs="+", default=[3])
+    parser.add_argument("--select-temperatures", type=float, nargs="+", default=[0.2])
+    parser.add_argument("--rewrite-temperatures", type=float, nargs="+", default=[0.3])
+    parser.add_argument("--judge-temperatures", type=float, nargs="+", default=[0.1])
+    parser.add_argument("--acceptable-score", type=float, default=8.0, help="final score counted as acceptable")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub delay per LLM call")
+    parser.add_argument("--report", help="write per-configuration results and every run as JSON")
+    args = parser.parse_args()
+
+    if args.corpus:
+        cases = load_corpus(args.corpus)
+    elif args.state_db:
+        cases = corpus_from_state_db(args.state_db)
+    else:
+        cases = synthetic_corpus(args.cases)
+    if not cases:
+        raise SystemExit("empty corpus")
+    if args.projects:
+        with open(args.projects, encoding="utf-8") as f:
+            projects = json.load(f)
+    else:
+        projects = synthetic_projects()
+
+    responder = Responder(load_replies(args.replay))
+    stub = start_stub_server(latency=args.llm_latency, responder=responder)
+    workdir = tempfile.mkdtemp(prefix="evaluate-")
+    configs = config_grid(args)
+    print(f"{len(cases)} cases x {len(configs)} configurations on {args.workers} workers\n")
+
+    runs: Dict[str, List[Dict[str, Any]]] = {config["name"]: [] for config in configs}
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(f"http://127.0.0.1:{stub.server_port}", workdir, projects),
+    ) as pool:
+        futures = [pool.submit(_run_case, config, case) for config in configs for case in cases]
+        for future in futures:
+            result = future.result()
+            runs[result["config"]].append(result)
+    stub.shutdown()
+
+    rows = [summarize(config, runs[config["name"]], args.acceptable_score) for config in configs]
+    rows.sort(key=lambda row: (row["calls_per_acceptable"] is None, row["calls_per_acceptable"] or 0))
+    print_report(rows, args.acceptable_score)
+    if args.replay:
+        print(f"\nreplayed {responder.hits} replies, simulated {responder.misses}")
+    if args.report:
+        Path(args.report).write_text(json.dumps({"configs": rows, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
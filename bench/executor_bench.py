@@ -0,0 +1,153 @@
+"""
+Throughput of the pipeline executors, and how much they stall the event loop.
+
+cpu:  --tasks docx render + parse + HtmlDiff runs of a --resume-lines resume
+      on a thread pool vs a process pool of --cpu-workers.
+jobs: --jobs full pipelines (stub LLM, --llm-latency per call) awaited from
+      an asyncio loop through Executors, for each --configs entry
+      "job_workers:cpu_backend[:stage=limit+stage=limit]".
+
+Both report tasks (or jobs) per second and the p99 lag of a 5 ms asyncio
+heartbeat. The lag shows how long the event loop, which also serves
+downloads and /metrics, waited for the GIL.
+
+    python bench/executor_bench.py --cpu-workers 4 --tasks 64
+    python bench/executor_bench.py --skip-cpu --jobs 40 --configs 8:thread 32:thread 32:process 32:thread:rewrite=4
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from load_test import configure_env, make_docx  # noqa: E402
+from stub_llm_server import start_stub_server  # noqa: E402
+
+HEARTBEAT = 0.005
+
+
+def cpu_task(resume_text: str) -> int:
+    from app.diff_utils import make_side_by_side_diff_html
+    from app.file_utils import extract_text_from_docx_bytes, render_resume_docx_bytes
+
+    rendered = render_resume_docx_bytes(resume_text)
+    parsed = extract_text_from_docx_bytes(rendered)
+    # a rewrite touches some lines; HtmlDiff is quadratic when every line changes
+    changed = "\n".join(
+        line.replace("latency", "p95 latency") if i % 10 == 0 else line for i, line in enumerate(parsed.splitlines())
+    )
+    return len(make_side_by_side_diff_html(parsed, changed))
+
+
+async def _heartbeat(stop: asyncio.Event, lags: List[float]) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT)
+        lags.append(time.perf_counter() - started - HEARTBEAT)
+
+
+def _p99(values: List[float]) -> float:
+    ordered = sorted(values) or [0.0]
+    return ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+
+
+async def _timed(work: Callable[[], Any]) -> Tuple[float, float]:
+    stop, lags = asyncio.Event(), []
+    beat = asyncio.create_task(_heartbeat(stop, lags))
+    started = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    return elapsed, _p99(lags)
+
+
+def bench_cpu(args: argparse.Namespace) -> None:
+    lines = [f"- Built service {i} in Python, cutting p95 latency by {i % 90}% for {i * 10} users" for i in
+             range(args.resume_lines)]
+    resume_text = "\n".join(lines)
+    print(f"cpu: {args.tasks} tasks, {args.cpu_workers} workers, {len(resume_text) / 1024:.0f} KB resume")
+
+    pools: Dict[str, Callable[[], Executor]] = {
+        "thread": lambda: ThreadPoolExecutor(args.cpu_workers),
+        "process": lambda: ProcessPoolExecutor(args.cpu_workers, mp_context=get_context("spawn")),
+    }
+    for name, make_pool in pools.items():
+        with make_pool() as pool:
+            pool.submit(cpu_task, "warm up").result()  # process start-up is not part of the run
+
+            async def work():
+                loop = asyncio.get_running_loop()
+                await asyncio.gather(*(loop.run_in_executor(pool, cpu_task, resume_text) for _ in range(args.tasks)))
+
+            elapsed, lag = asyncio.run(_timed(work))
+        print(f"  {name:<8} {args.tasks / elapsed:8.1f} tasks/s   loop lag p99 {lag * 1000:7.1f} ms")
+
+
+def bench_jobs(args: argparse.Namespace) -> None:
+    stub = start_stub_server(latency=args.llm_latency)
+    workdir = tempfile.mkdtemp()
+    configure_env(Path(workdir), f"http://127.0.0.1:{stub.server_port}", keys=4)
+
+    from app.executors import Executors, parse_stage_limits
+    from app.pipeline import run_pipeline_and_get_text
+    from app.resume_model import parse_resume_docx
+
+    base_resume = parse_resume_docx(make_docx(0)).text
+    jd_text = "Backend engineer: Python, FastAPI, PostgreSQL, Kubernetes, REST APIs. " * 10
+    print(f"\njobs: {args.jobs} pipelines, stub LLM {args.llm_latency}s per call")
+
+    for config in args.configs:
+        workers, backend, *limits = config.split(":")
+        executors = Executors(
+            job_workers=int(workers),
+            cpu_backend=backend,
+            cpu_workers=args.cpu_workers,
+            stage_limits=parse_stage_limits((limits or [""])[0].replace("+", ",")),
+        )
+        executors.run_cpu(len, "warm up")
+
+        import app.executors as executors_module
+
+        executors_module._executors = executors  # the pipeline picks up this configuration
+
+        def one_job():
+            return run_pipeline_and_get_text(
+                jd_text=jd_text, base_resume=base_resume, project_count=3, projects=[], max_loops=2
+            )
+
+        async def work():
+            await asyncio.gather(*(executors.run_job(one_job) for _ in range(args.jobs)))
+
+        elapsed, lag = asyncio.run(_timed(work))
+        executors.shutdown()
+        print(f"  {config:<28} {args.jobs / elapsed:8.2f} jobs/s   loop lag p99 {lag * 1000:7.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cpu-workers", type=int, default=4)
+    parser.add_argument("--tasks", type=int, default=16)
+    parser.add_argument("--resume-lines", type=int, default=400)
+    parser.add_argument("--jobs", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--configs", nargs="+", default=["8:thread", "32:thread", "32:process", "32:thread:rewrite=4"])
+    parser.add_argument("--skip-cpu", action="store_true")
+    parser.add_argument("--skip-jobs", action="store_true")
+    args = parser.parse_args()
+
+    if not args.skip_cpu:
+        bench_cpu(args)
+    if not args.skip_jobs:
+        bench_jobs(args)
+
+
+if __name__ == "__main__":
+    main()
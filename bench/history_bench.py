@@ -0,0 +1,80 @@
+"""
+Query latency of the history store over months of synthetic telemetry.
+
+Fills a temporary history.db with --days of LLM calls (--calls-per-day,
+spread over stages, models, keys and statuses) and rewrite/judge
+iterations, then times the analytics queries the /history endpoints run.
+
+    python bench/history_bench.py --days 180 --calls-per-day 2000
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.history_store import HistoryStore  # noqa: E402
+
+STAGES = ["analyze", "select", "rewrite", "judge"]
+MODELS = ["xiaomi/mimo-v2-flash:free", "tngtech/deepseek-r1t2-chimera:free", "mistral"]
+STATUSES = ["ok"] * 18 + ["http_429", "error"]
+
+
+def fill(store: HistoryStore, days: int, calls_per_day: int) -> int:
+    rng = random.Random(7)
+    now = time.time()
+    rows = 0
+    for day in range(days):
+        batch = []
+        for _ in range(calls_per_day // 8):
+            job_id = str(uuid.uuid4())
+            ts = now - day * 86400 - rng.random() * 86400
+            loops = rng.randint(1, 5)
+            for iteration in range(1, loops + 1):
+                score = 8.5 if iteration == loops and rng.random() < 0.7 else rng.uniform(4, 7.9)
+                batch.append(("iteration", (ts + iteration, job_id, iteration, score, 0)))
+            for _ in range(8):
+                stage = rng.choice(STAGES)
+                batch.append(("call", (
+                    ts, job_id, stage, "openrouter", rng.choice(MODELS), f"OPENROUTER_KEY_{rng.randint(1, 11)}",
+                    rng.choice(STATUSES), rng.lognormvariate(8, 0.6), rng.randint(500, 4000), rng.randint(100, 2000),
+                )))
+        store._write(batch)
+        rows += len(batch)
+    return rows
+
+
+def timed(label: str, fn, repeat: int = 5) -> None:
+    fn()  # warm the page cache
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - t0) / repeat * 1000
+    print(f"{label:<42} {elapsed:8.2f} ms   {str(result)[:70]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--calls-per-day", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "history.db"
+        store = HistoryStore(db_path)
+        t0 = time.perf_counter()
+        rows = fill(store, args.days, args.calls_per_day)
+        print(f"wrote {rows} rows in {time.perf_counter() - t0:.1f}s, {db_path.stat().st_size / 1e6:.1f} MB")
+
+        timed("p95 judge latency by model, 7 days", lambda: store.latency_percentiles("judge", days=7))
+        timed("p95 rewrite latency by model, 30 days", lambda: store.latency_percentiles("rewrite", days=30))
+        timed("avg loops to score 8, 30 days", lambda: store.loops_to_score(8, days=30))
+        timed("call summary, 1 day", lambda: len(store.call_summary(days=1)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+Scenario-driven load and soak test for the web API.
+
+Starts the app in-process (uvicorn on a free port) against the stub LLM
+server, with its own temporary state.db, history.db and output directory,
+then runs --users concurrent virtual users for --duration seconds. Each
+user loops over a weighted mix of scenarios:
+
+    generate        /generate with a small .docx upload
+    upload          /generate with a --upload-mb .docx upload
+    regenerate      /regenerate/{job_id} of a job generated earlier
+    download        /download of a generated file, sometimes with
+                    If-None-Match (expects 304) or a Range header (206)
+
+Before the users start, a .docx written straight into OUTPUT_DIR (as
+before the artifact store) is downloaded once; a failure there breaks
+the run like a threshold.
+
+Every --sample-interval seconds it records RSS, open file descriptors,
+threads, stored sessions and the size of the output directory. At the end
+it prints latency percentiles and error rates per scenario plus resource
+growth, and exits 1 if any threshold is broken:
+
+    python bench/load_test.py --users 50 --duration 120
+    python bench/load_test.py --users 10 --duration 86400 --sample-interval 300 --report soak.json
+
+Growth is measured from the first sample after --warmup seconds, so
+one-off start-up allocations (imports, thread pools, malloc arenas) do
+not count. The stub and the HTTP client share the process, so absolute
+RSS and FD numbers include them; growth is what the thresholds check.
+RSS and FD counts come from /proc and are skipped on other platforms.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_llm_server import start_stub_server  # noqa: E402
+
+DEFAULT_MIX = "generate=3,upload=1,regenerate=2,download=4"
+
+JD_TEXT = (
+    "Backend Engineer. We build APIs in Python and FastAPI on PostgreSQL and Kubernetes. "
+    "You will design REST APIs, own SQL schemas, improve scalability and on-call health. "
+) * 8
+
+RESUME_LINES = [
+    f"- Built service {i} in Python and FastAPI, cutting p95 latency by {10 + i}%" for i in range(40)
+]
+
+# stand-ins for the prompts normally provided through .env
+PROMPT_DEFAULTS = {
+    "PROMPT_ANALYZE_JD_TEMPLATE": "Analyze this job description and return JSON.\n{jd_text}",
+    "PROMPT_REWRITE_USER_TEMPLATE": "Style:\n{style_text}\n\nJob analysis:\n{jd_analysis}\n\nResume:\n{base_resume}",
+    "PROMPT_JUDGE_TEMPLATE": "Job description:\n{jd_text}\n\nResume:\n{new_resume}\n\nReturn JSON with a score.",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def configure_env(workdir: Path, stub_url: str, keys: int) -> None:
+    """Must run before `app` is imported: most settings are read at import time."""
+    os.environ.update({
+        "STATE_BACKEND": "sqlite",
+        "STATE_DB_PATH": str(workdir / "state.db"),
+        "HISTORY_DB_PATH": str(workdir / "history.db"),
+        "OUTPUT_DIR": str(workdir / "output"),
+        "OPENROUTER_API_URL": f"{stub_url}/api/v1/chat/completions",
+        "OLLAMA_BASE_URL": stub_url,
+        "OPENROUTER_DAILY_CALL_LIMIT": str(10 ** 9),
+        "OPENROUTER_KEY_RPM": "0",
+    })
+    for index in range(1, keys + 1):
+        os.environ[f"OPENROUTER_KEY_{index}"] = "stub"
+    for name, template in PROMPT_DEFAULTS.items():
+        os.environ.setdefault(name, template)
+
+
+def make_docx(size_mb: float) -> bytes:
+    """A resume .docx padded with an incompressible part up to about size_mb."""
+    from docx import Document
+
+    document = Document()
+    for line in RESUME_LINES:
+        document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    padding = int(size_mb * 1024 * 1024) - buffer.tell()
+    if padding > 0:
+        # stored, random bytes: python-docx ignores the part, the upload keeps its size
+        with zipfile.ZipFile(buffer, "a", compression=zipfile.ZIP_STORED) as archive:
+            archive.writestr("customXml/padding.bin", os.urandom(padding))
+    return buffer.getvalue()
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("generate", "upload", "regenerate", "download"):
+            raise SystemExit(f"unknown scenario in --mix: {name}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def fd_count() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def dir_size_mb(path: Path) -> float:
+    if not path.exists():
+        return 0.0
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 1e6
+
+
+class LoadTest:
+    def __init__(self, base_url: str, args: argparse.Namespace):
+        self.base_url = base_url
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.latencies: Dict[str, List[float]] = {name: [] for name in self.mix}
+        self.errors: Dict[str, Dict[str, int]] = {name: {} for name in self.mix}
+        self.samples: List[Dict[str, Any]] = []
+        # job_id, download_url and last etag of finished jobs, shared by all users
+        self.jobs: List[Dict[str, Any]] = []
+        # uploads in both cases: paste mode needs the private master resume
+        self.form = {"jd": JD_TEXT, "company": "Acme", "resume_mode": "upload", "project_count": "3"}
+        self.small_docx = make_docx(0)
+        self.large_docx = make_docx(args.upload_mb)
+        self.legacy_error: Optional[str] = None
+
+    def _record(self, scenario: str, started: float, error: Optional[str]) -> None:
+        if error is None:
+            self.latencies[scenario].append(time.perf_counter() - started)
+        else:
+            self.errors[scenario][error] = self.errors[scenario].get(error, 0) + 1
+
+    async def _generate(self, client, scenario: str) -> Optional[str]:
+        docx = self.large_docx if scenario == "upload" else self.small_docx
+        files = {"resume_file": ("resume.docx", docx)}
+        response = await client.post("/generate?fields=job_id,download_url,score", data=self.form, files=files)
+        if response.status_code != 200:
+            return f"http_{response.status_code}"
+        body = response.json()
+        self.jobs.append({"job_id": body["job_id"], "download_url": body["download_url"], "etag": None})
+        return None
+
+    async def _regenerate(self, client, job: Dict[str, Any]) -> Optional[str]:
+        response = await client.post(f"/regenerate/{job['job_id']}?fields=version,download_url,score")
+        if response.status_code != 200:
+            return f"http_{response.status_code}"
+        job["download_url"], job["etag"] = response.json()["download_url"], None
+        return None
+
+    async def _download(self, client, job: Dict[str, Any], rng: random.Random) -> Optional[str]:
+        headers, expected = {}, 200
+        roll = rng.random()
+        if job["etag"] and roll < 0.3:
+            headers["If-None-Match"], expected = job["etag"], 304
+        elif roll < 0.5:
+            headers["Range"], expected = "bytes=0-1023", 206
+        response = await client.get(job["download_url"], headers=headers)
+        if response.status_code != expected:
+            return f"http_{response.status_code}"
+        if expected == 200:
+            job["etag"] = response.headers.get("etag")
+        return None
+
+    async def _legacy_download(self, client) -> Optional[str]:
+        # files from before the artifact store are served straight from OUTPUT_DIR
+        output_dir = Path(os.environ["OUTPUT_DIR"])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        (output_dir / "legacy_resume.docx").write_bytes(self.small_docx)
+        response = await client.get("/download/legacy_resume.docx")
+        if response.status_code != 200 or response.content != self.small_docx:
+            return f"http_{response.status_code}"
+        return None
+
+    async def user(self, client, deadline: float, seed: int) -> None:
+        rng = random.Random(seed)
+        names, weights = list(self.mix), list(self.mix.values())
+        while time.monotonic() < deadline:
+            scenario = rng.choices(names, weights)[0]
+            if scenario in ("regenerate", "download") and not self.jobs:
+                scenario = "generate" if "generate" in self.mix else scenario
+                if scenario != "generate":
+                    await asyncio.sleep(0.1)
+                    continue
+            started = time.perf_counter()
+            try:
+                if scenario in ("generate", "upload"):
+                    error = await self._generate(client, scenario)
+                elif scenario == "regenerate":
+                    error = await self._regenerate(client, rng.choice(self.jobs))
+                else:
+                    error = await self._download(client, rng.choice(self.jobs), rng)
+            except Exception as exc:  # timeouts, resets: count them, keep the user going
+                error = type(exc).__name__
+            self._record(scenario, started, error)
+            if self.args.think_time:
+                await asyncio.sleep(rng.expovariate(1 / self.args.think_time))
+
+    async def sampler(self, deadline: float, started: float) -> None:
+        from app.state_store import get_state_store
+        from app.web_app import SESSION_NAMESPACE
+
+        store = get_state_store()
+        output_dir = Path(os.environ["OUTPUT_DIR"])
+        while True:
+            sessions = await asyncio.to_thread(lambda: len(store.items(SESSION_NAMESPACE)))
+            self.samples.append({
+                "t": round(time.monotonic() - started, 1),
+                "rss_mb": rss_mb(),
+                "fds": fd_count(),
+                "threads": threading.active_count(),
+                "sessions": sessions,
+                "output_mb": round(await asyncio.to_thread(dir_size_mb, output_dir), 2),
+                "requests": sum(len(v) for v in self.latencies.values()),
+            })
+            if time.monotonic() >= deadline:
+                return
+            await asyncio.sleep(min(self.args.sample_interval, max(0.0, deadline - time.monotonic())))
+
+    async def run(self) -> None:
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.args.users, max_keepalive_connections=self.args.users)
+        timeout = httpx.Timeout(self.args.timeout)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=timeout) as client:
+            self.legacy_error = await self._legacy_download(client)
+            started = time.monotonic()
+            deadline = started + self.args.duration
+            users = [self.user(client, deadline, seed) for seed in range(self.args.users)]
+            await asyncio.gather(self.sampler(deadline, started), *users)
+
+    def report(self) -> Dict[str, Any]:
+        scenarios = {}
+        for name in self.mix:
+            ok, failed = self.latencies[name], sum(self.errors[name].values())
+            total = len(ok) + failed
+            scenarios[name] = {
+                "requests": total,
+                "error_rate": round(failed / total, 4) if total else 0.0,
+                "errors": self.errors[name],
+                "p50": round(percentile(ok, 50), 3),
+                "p95": round(percentile(ok, 95), 3),
+                "p99": round(percentile(ok, 99), 3),
+                "max": round(max(ok), 3) if ok else 0.0,
+            }
+        baseline = next((s for s in self.samples if s["t"] >= self.args.warmup), self.samples[0])
+        last = self.samples[-1]
+        growth = {
+            key: round(last[key] - baseline[key], 2) if last[key] is not None and baseline[key] is not None else None
+            for key in ("rss_mb", "fds", "threads", "sessions", "output_mb")
+        }
+        return {"scenarios": scenarios, "legacy_download": self.legacy_error or "ok", "growth": growth, "samples": self.samples}
+
+
+def check_thresholds(report: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    failures = []
+    if report["legacy_download"] != "ok":
+        failures.append(f"legacy download from OUTPUT_DIR failed: {report['legacy_download']}")
+    for name, stats in report["scenarios"].items():
+        if stats["error_rate"] > args.max_error_rate:
+            failures.append(f"{name}: error rate {stats['error_rate']:.2%} > {args.max_error_rate:.2%}")
+        limit = args.max_p95_download if name == "download" else args.max_p95
+        if stats["p95"] > limit:
+            failures.append(f"{name}: p95 {stats['p95']:.2f}s > {limit:.2f}s")
+    growth = report["growth"]
+    if growth["rss_mb"] is not None and growth["rss_mb"] > args.max_rss_growth_mb:
+        failures.append(f"RSS grew {growth['rss_mb']:.0f} MB > {args.max_rss_growth_mb:.0f} MB")
+    if growth["fds"] is not None and growth["fds"] > args.max_fd_growth:
+        failures.append(f"open file descriptors grew by {growth['fds']} > {args.max_fd_growth}")
+    return failures
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{'scenario':<12} {'requests':>8} {'errors':>7} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'max s':>8}")
+    for name, stats in report["scenarios"].items():
+        print(
+            f"{name:<12} {stats['requests']:>8} {stats['error_rate']:>7.2%} {stats['p50']:>8.3f} "
+            f"{stats['p95']:>8.3f} {stats['p99']:>8.3f} {stats['max']:>8.3f}"
+        )
+        for error, count in stats["errors"].items():
+            print(f"{'':<12} {error}: {count}")
+    print(f"legacy download: {report['legacy_download']}")
+    print(f"\n{'t s':>8} {'rss MB':>8} {'fds':>6} {'threads':>8} {'sessions':>9} {'output MB':>10} {'requests':>9}")
+    for sample in report["samples"]:
+        print(
+            f"{sample['t']:>8} {sample['rss_mb'] or 0:>8.1f} {sample['fds'] or 0:>6} {sample['threads']:>8} "
+            f"{sample['sessions']:>9} {sample['output_mb']:>10.2f} {sample['requests']:>9}"
+        )
+    print("\ngrowth after warm-up:", ", ".join(f"{k}={v}" for k, v in report["growth"].items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=120, help="seconds to run; use hours for a soak")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between a user's requests")
+    parser.add_argument("--upload-mb", type=float, default=2.0, help="size of the uploaded .docx")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--sample-interval", type=float, default=5, help="seconds between resource samples")
+    parser.add_argument("--warmup", type=float, default=30, help="seconds excluded from growth checks")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub seconds per LLM call")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="share of stub calls failing with 429/500")
+    parser.add_argument("--keys", type=int, default=4, help="OpenRouter keys to configure against the stub")
+    parser.add_argument("--max-p95", type=float, default=10.0, help="p95 seconds allowed for generate/regenerate")
+    parser.add_argument("--max-p95-download", type=float, default=1.0, help="p95 seconds allowed for downloads")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=200)
+    parser.add_argument("--max-fd-growth", type=int, default=50)
+    parser.add_argument("--report", type=Path, help="write the full report (with samples) as JSON")
+    args = parser.parse_args()
+
+    stub = start_stub_server(latency=args.llm_latency, jitter=args.llm_latency / 4, error_rate=args.llm_error_rate)
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_env(Path(tmp), f"http://127.0.0.1:{stub.server_port}", args.keys)
+
+        import uvicorn
+        from app.web_app import app
+
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+
+        test = LoadTest(f"http://127.0.0.1:{port}", args)
+        print(f"{args.users} users for {args.duration:.0f}s, mix {args.mix}, stub LLM {args.llm_latency}s/call")
+        asyncio.run(test.run())
+        server.should_exit = True
+        thread.join(timeout=10)
+
+        report = test.report()
+        report["stub_llm_calls"] = stub.stub_calls
+        print_report(report)
+        if args.report:
+            args.report.write_text(json.dumps(report, indent=2))
+
+    failures = check_thresholds(report, args)
+    for failure in failures:
+        print("FAIL", failure)
+    print("PASS" if not failures else f"{len(failures)} threshold(s) broken")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Per-job memory footprint of stored sessions, before and after JobSession.
+
+Builds --jobs sessions (in steps) in an in-memory state store, the old way
+(every session holds full copies of the JD, base resume, analysis and
+best resume plus raw judgement dicts) and with JobSession records whose
+texts live once in TextBlobs. Jobs reuse --jds job descriptions and
+--resumes base resumes, like batches and repeat applications do; every
+job gets its own best resume. Reports traced bytes per job, stored JSON
+bytes per job, and the footprint of the project inventory as plain dicts
+vs interned Project records.
+
+    python bench/memory_bench.py --jobs 100 1000 5000
+"""
+import argparse
+import json
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.records import JobSession, Project, TextBlobs  # noqa: E402
+from app.state_store import MemoryStateStore  # noqa: E402
+
+TAGS = ["Python", "FastAPI", "PostgreSQL", "Kubernetes", "AWS", "React", "Go", "Kafka", "Redis", "Terraform"]
+WORDS = "build scale ship design own improve latency service pipeline platform customers reliability".split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _judgement(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "score": round(rng.uniform(5, 9), 1),
+        "summary": _text(rng, 30),
+        "improvements": [_text(rng, 12) for _ in range(3)],
+        "project_selection_issue": False,
+    }
+
+
+def _pipeline_state(rng: random.Random, analysis: str) -> Dict[str, Any]:
+    judge_results = {f"{rng.getrandbits(256):064x}": _judgement(rng) for _ in range(4)}
+    best_key = next(iter(judge_results))
+    return {
+        "jd_analysis": analysis,
+        "selected_project_ids": [f"proj-{rng.randint(1, 40)}" for _ in range(3)],
+        "best_resume": _text(rng, 900),
+        "best_score": judge_results[best_key]["score"],
+        "best_judgement": judge_results[best_key],
+        "best_project_ids": [f"proj-{rng.randint(1, 40)}" for _ in range(3)],
+        "outstanding_improvements": judge_results[best_key]["improvements"],
+        "judge_results": judge_results,
+    }
+
+
+def _legacy_session(jd: str, resume: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "jd": jd,
+        "company": "Acme",
+        "base_resume": resume,
+        "resume_source": "upload",
+        "project_count": 3,
+        "version": 1,
+        "files": ["Anmol_Sansi_Acme_1a2b3c4d_v1.docx"],
+        **state,
+    }
+
+
+def run(jobs: int, jd_count: int, resume_count: int, records: bool) -> Dict[str, float]:
+    rng = random.Random(11)
+    # fresh strings per job, the way each request parses its own form fields
+    jds = [_text(rng, 600) for _ in range(jd_count)]
+    resumes = [_text(rng, 900) for _ in range(resume_count)]
+    analyses = {jd: _text(rng, 150) for jd in jds}
+
+    tracemalloc.start()
+    store = MemoryStateStore()
+    blobs = TextBlobs(store)
+    for job in range(jobs):
+        jd = "".join(list(rng.choice(jds)))
+        resume = "".join(list(rng.choice(resumes)))
+        state = _pipeline_state(rng, analyses[rng.choice(jds)])
+        if records:
+            session = JobSession.create(jd, "Acme", resume, "upload", 3, state, files=["Acme_v1.docx"], blobs=blobs)
+            store.set("sessions", str(job), session.to_record())
+        else:
+            store.set("sessions", str(job), _legacy_session(jd, resume, state))
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stored = sum(len(raw) for ns in store._data.values() for raw in ns.values())
+    return {"traced_per_job": traced / jobs, "stored_per_job": stored / jobs}
+
+
+def project_footprint(count: int) -> Dict[str, int]:
+    rng = random.Random(3)
+    raw = json.dumps([
+        {
+            "id": f"proj-{i}",
+            "name": f"Project {i}",
+            "intro": _text(rng, 25),
+            "bullets": [_text(rng, 15) for _ in range(4)],
+            "tech_tags": rng.sample(TAGS, 4),
+            "domain_tags": rng.sample(["Retail", "Fintech", "Health", "Logistics"], 2),
+        }
+        for i in range(count)
+    ])
+    sizes = {}
+    for label, build in (("dicts", lambda: json.loads(raw)), ("records", lambda: [
+        Project.from_dict(item) for item in json.loads(raw)
+    ])):
+        tracemalloc.start()
+        kept: List[Any] = [build() for _ in range(5)]  # five requests holding the inventory at once
+        sizes[label] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+    return sizes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--jds", type=int, default=50, help="distinct job descriptions")
+    parser.add_argument("--resumes", type=int, default=20, help="distinct base resumes")
+    parser.add_argument("--projects", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'jobs':>6} {'old KB/job':>11} {'new KB/job':>11} {'old stored':>11} {'new stored':>11}")
+    for jobs in args.jobs:
+        old = run(jobs, args.jds, args.resumes, records=False)
+        new = run(jobs, args.jds, args.resumes, records=True)
+        print(
+            f"{jobs:>6} {old['traced_per_job'] / 1024:>11.1f} {new['traced_per_job'] / 1024:>11.1f} "
+            f"{old['stored_per_job'] / 1024:>11.1f} {new['stored_per_job'] / 1024:>11.1f}"
+        )
+
+    sizes = project_footprint(args.projects)
+    print(
+        f"\n{args.projects} projects x 5 live copies: dicts {sizes['dicts'] / 1e6:.2f} MB, "
+        f"records {sizes['records'] / 1e6:.2f} MB (load_projects now shares one copy)"
+    )
+
+
+if __name__ == "__main__":
+    main()
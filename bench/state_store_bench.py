@@ -0,0 +1,91 @@
+"""
+Multi-worker throughput check for the shared state store.
+
+Each worker process simulates /generate + /regenerate requests: a CPU-bound
+diff (the part of a request that contends on the GIL), a session write,
+an atomic version bump and an OpenRouter usage reservation, all against the
+same SQLite file. Throughput should scale with the worker count while the
+usage counters stay exact.
+
+    python bench/state_store_bench.py --workers 1 2 4 --requests 100
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+import uuid
+from difflib import HtmlDiff
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.state_store import SqliteStateStore  # noqa: E402
+
+BASE_TEXT = "\n".join(f"- Built service {i} with Python, FastAPI and PostgreSQL" for i in range(20))
+NEW_TEXT = "\n".join(f"- Designed service {i} using Python, FastAPI and Redis" for i in range(20))
+
+
+def _simulate_request(store: SqliteStateStore, usage_limit: int) -> None:
+    job_id = str(uuid.uuid4())
+    HtmlDiff(wrapcolumn=80).make_table(BASE_TEXT.splitlines(), NEW_TEXT.splitlines(), context=True)
+    store.set("sessions", job_id, {"jd": "x" * 2000, "version": 1, "files": []})
+
+    def _bump(current):
+        current["version"] += 1
+        return current
+
+    store.update("sessions", job_id, _bump)
+    store.incr_if_below("openrouter_usage", "bench:KEY", usage_limit)
+
+
+def _worker(db_path: str, requests: int, usage_limit: int, start, results) -> None:
+    store = SqliteStateStore(Path(db_path))
+    start.wait()
+    t0 = time.perf_counter()
+    for _ in range(requests):
+        _simulate_request(store, usage_limit)
+    results.put(time.perf_counter() - t0)
+
+
+def run(workers: int, requests: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "state.db")
+        SqliteStateStore(Path(db_path))
+        usage_limit = workers * requests // 2
+        start = mp.Event()
+        results = mp.Queue()
+        procs = [
+            mp.Process(target=_worker, args=(db_path, requests, usage_limit, start, results))
+            for _ in range(workers)
+        ]
+        for proc in procs:
+            proc.start()
+        t0 = time.perf_counter()
+        start.set()
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - t0
+        used = SqliteStateStore(Path(db_path)).get("openrouter_usage", "bench:KEY")
+        assert used == usage_limit, f"usage counter drifted: {used} != {usage_limit}"
+    throughput = workers * requests / elapsed
+    print(f"workers={workers:<3} requests={workers * requests:<6} elapsed={elapsed:6.2f}s  {throughput:8.1f} req/s")
+    return throughput
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=100, help="requests per worker")
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in args.workers:
+        throughput = run(workers, args.requests)
+        baseline = baseline or throughput
+        print(f"  speedup vs {args.workers[0]} worker(s): {throughput / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
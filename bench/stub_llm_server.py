@@ -0,0 +1,176 @@
+"""
+Stub LLM server speaking both the Ollama and the OpenRouter chat APIs.
+
+Answers every pipeline prompt with valid canned JSON (JD analysis, project
+selection, rewrite, judge) after a configurable delay, so the app, the
+Ollama client and load tests can run without a GPU or API keys.
+
+    python bench/stub_llm_server.py --port 11434 --latency 0.5
+    OLLAMA_BASE_URL=http://localhost:11434 uvicorn app.web_app:app
+
+Endpoints: GET /api/tags, POST /api/generate, POST /api/chat (Ollama) and
+POST /api/v1/chat/completions (OpenRouter).
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_ID_RE = re.compile(r"\(ID: ([^)]+)\)")
+_COUNT_RE = re.compile(r"Number of projects required: (\d+)")
+
+ANALYSIS = {
+    "must_have": ["Python", "REST APIs", "SQL"],
+    "nice_to_have": ["Kubernetes"],
+    "tech_stack": ["Python", "FastAPI", "PostgreSQL"],
+    "responsibilities": ["Build and operate backend services"],
+    "keywords": ["backend", "APIs", "scalability"],
+}
+
+
+def canned_reply(messages: List[Dict[str, str]], score: float) -> str:
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system").lower()
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    if "project selector" in system:
+        count_match = _COUNT_RE.search(prompt)
+        count = int(count_match.group(1)) if count_match else 3
+        ids = _ID_RE.findall(prompt)[:count]
+        return json.dumps({"selected_project_ids": ids, "reasons": [{"id": pid, "reason": "stub"} for pid in ids]})
+    if "rewrite resumes" in system:
+        lines = [line for line in prompt.splitlines() if line.strip()][-20:]
+        return json.dumps({"upgradedResume": "Tailored resume\n" + "\n".join(lines)})
+    if "recruiter" in system:
+        return json.dumps({
+            "score": score,
+            "summary": "Stub judgement",
+            "improvements": ["Quantify impact in the first project"],
+            "project_selection_issue": False,
+        })
+    return json.dumps(ANALYSIS)
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    server_version = "StubLLM/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _delay_or_fail(self) -> Tuple[bool, int]:
+        opts = self.server.stub_options
+        time.sleep(max(0.0, random.gauss(opts["latency"], opts["jitter"])))
+        with self.server.stub_lock:
+            self.server.stub_calls += 1
+        if random.random() < opts["error_rate"]:
+            return True, random.choice([429, 500])
+        return False, 200
+
+    def do_GET(self) -> None:
+        if self.path == "/api/tags":
+            self._send(200, {"models": [{"name": self.server.stub_options["model"]}]})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        request = self._read_json()
+        if self.path == "/api/generate":
+            self._send(200, {"model": request.get("model"), "response": "", "done": True})
+            return
+        if self.path not in ("/api/chat", "/api/v1/chat/completions"):
+            self._send(404, {"error": "not found"})
+            return
+        if not self.server.stub_options["schemas"] and (
+            isinstance(request.get("format"), dict) or "response_format" in request
+        ):
+            # emulate providers without structured-output support
+            self._send(400, {"error": "structured outputs not supported"})
+            return
+        failed, status = self._delay_or_fail()
+        if failed:
+            self._send(status, {"error": {"message": "stub failure", "code": status}})
+            return
+        responder = self.server.stub_options["responder"]
+        content = responder(request) if responder else None
+        if content is None:
+            content = canned_reply(request.get("messages") or [], self.server.stub_options["score"])
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages") or []) // 4
+        completion_tokens = len(content) // 4
+        if self.path == "/api/chat":
+            self._send(200, {
+                "model": request.get("model"),
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": completion_tokens,
+            })
+        else:
+            self._send(200, {
+                "choices": [{"message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens},
+            })
+
+
+def start_stub_server(
+    port: int = 0,
+    latency: float = 0.05,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    score: float = 8.5,
+    model: str = "mistral",
+    schemas: bool = True,
+    responder: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None,
+) -> ThreadingHTTPServer:
+    """
+    Starts the stub on a daemon thread; port 0 picks a free port (see
+    server.server_port). responder(request_json) may answer a chat request
+    itself; returning None falls back to the canned replies.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubLLMHandler)
+    server.daemon_threads = True
+    server.stub_options = {
+        "latency": latency, "jitter": jitter, "error_rate": error_rate, "score": score, "model": model,
+        "schemas": schemas, "responder": responder,
+    }
+    server.stub_lock = threading.Lock()
+    server.stub_calls = 0
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per chat call")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 429/500")
+    parser.add_argument("--score", type=float, default=8.5, help="score the stub judge returns")
+    parser.add_argument("--no-schemas", action="store_true", help="answer 400 to JSON-schema requests")
+    args = parser.parse_args()
+    server = start_stub_server(
+        args.port, args.latency, args.jitter, args.error_rate, args.score, schemas=not args.no_schemas
+    )
+    print(f"stub LLM server on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()